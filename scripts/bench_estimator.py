@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+高度预估准确度基准 — 对比字宽表预估与浏览器实测，统计能省下多少次浏览器测量。
+
+对语料中每篇笔记：
+  1. 取每个内容块及其 smart_split_content 拆分结果作为样本，
+     分别用旧的固定常数预估和新的字宽表预估，与浏览器实测的内容高度比较
+  2. 用两种预估各跑一遍 estimate 分页流程（同一装箱算法，只换预估函数），统计浏览器测量次数
+
+用法:
+  python3 bench_estimator.py                       # 默认语料 assets/example.md
+  python3 bench_estimator.py notes/*.md --style dark
+  python3 bench_estimator.py notes/ --json result.json
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import sys
+from pathlib import Path
+
+import render_xhs_v2 as renderer
+
+DEFAULT_CORPUS = str(renderer.ASSETS_DIR / "example.md")
+
+# 不受 min-height 影响的内容实际高度（card-inner 去掉上下 padding）
+# 测完恢复 min-height，复用的卡片外壳不受影响
+MEASURE_NATURAL_HEIGHT_JS = """() => {
+    const inner = document.querySelector('.card-inner');
+    inner.style.minHeight = '0';
+    const cs = getComputedStyle(inner);
+    const height = inner.scrollHeight - parseFloat(cs.paddingTop) - parseFloat(cs.paddingBottom);
+    inner.style.minHeight = '';
+    return height;
+}"""
+
+
+def legacy_estimate_content_height(content: str, style_key: str = "purple") -> int:
+    """旧版预估：每行 28 字、按元素类型取固定像素（保留用于对比）"""
+    total_height = 0
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line:
+            total_height += 20
+        elif line.startswith('# '):
+            total_height += 130
+        elif line.startswith('## '):
+            total_height += 110
+        elif line.startswith('### '):
+            total_height += 90
+        elif line.startswith('```'):
+            total_height += 80
+        elif line.startswith(('- ', '* ', '+ ')):
+            total_height += 85
+        elif line.startswith('>'):
+            total_height += 100
+        elif line.startswith('!['):
+            total_height += 300
+        else:
+            total_height += int(max(1, len(line) / 28) * 42 * 1.7) + 35
+    return total_height
+
+
+ESTIMATORS = {
+    "legacy": legacy_estimate_content_height,
+    "glyph": renderer.estimate_content_height,
+}
+
+
+def collect_samples(md_files, style_key: str):
+    """每个内容块本身 + 其拆分结果（去重）"""
+    samples = []
+    for md_file in md_files:
+        body = renderer.parse_markdown_file(md_file)['body']
+        for chunk in renderer.split_content_by_separator(body):
+            candidates = [chunk] + renderer.smart_split_content(chunk, renderer.SAFE_HEIGHT, style_key)
+            for candidate in dict.fromkeys(candidates):
+                samples.append((md_file, candidate))
+    return samples
+
+
+def error_stats(errors):
+    abs_errors = sorted(abs(e) for e in errors)
+    return {
+        "mean_abs_error": round(statistics.mean(abs_errors), 1),
+        "p90_abs_error": round(abs_errors[min(len(abs_errors) - 1, int(len(abs_errors) * 0.9))], 1),
+        "mean_signed_error": round(statistics.mean(errors), 1),
+    }
+
+
+def split_with_estimator(content: str, style_key: str, estimator) -> list:
+    """
+    与 smart_split_content 相同的段落装箱（paginate_optimal），但每个候选卡片的高度直接由
+    estimator 对整段 Markdown 预估，不经 layout_blocks，新旧预估在同一装箱算法下对比
+    """
+    if estimator(content, style_key) <= renderer.SAFE_HEIGHT:
+        return [content]
+    blocks = [block for block in renderer.split_paragraphs(content) if not re.fullmatch(r'\s*---+\s*', block)]
+    if not blocks:
+        return [content]
+
+    def span(i: int, j: int) -> float:
+        return estimator('\n\n'.join(blocks[i:j + 1]), style_key)
+
+    keep_with_next = [bool(re.fullmatch(r'#{1,6}\s+.*', block.strip())) for block in blocks]
+    return ['\n\n'.join(blocks[start:end])
+            for start, end in renderer.paginate_optimal(len(blocks), span, renderer.SAFE_HEIGHT, keep_with_next)]
+
+
+async def count_pagination_measurements(page, md_files, style_key: str, estimator) -> dict:
+    """
+    用指定预估函数跑 estimate 分页流程（预估装箱 → 逐张实测 → 仍超出的按行二分拆分），
+    统计浏览器测量次数与卡片数；测量次数取自渲染器自身的 measurements 计数
+    """
+    metrics = renderer.RenderMetrics("bench_estimator", style_key, "estimate")
+    token = renderer._current_metrics.set(metrics)
+    cards = 0
+    try:
+        for md_file in md_files:
+            body = renderer.parse_markdown_file(md_file)['body']
+            for chunk in renderer.split_content_by_separator(body):
+                for content in split_with_estimator(chunk, style_key, estimator):
+                    html = renderer.generate_card_html(content, 1, 1, style_key)
+                    if await renderer.measure_content_height(page, html) > renderer.MAX_INNER_HEIGHT:
+                        cards += len(await renderer.split_overflow_bisect(page, content.split('\n'), style_key))
+                    else:
+                        cards += 1
+    finally:
+        renderer._current_metrics.reset(token)
+    return {"measurements": metrics.counters["measurements"], "cards": cards}
+
+
+async def run_benchmark(md_files, style_key: str) -> dict:
+    samples = collect_samples(md_files, style_key)
+
+    async with renderer.async_playwright() as p:
+        browser = await p.chromium.launch()
+        try:
+            page = await renderer.new_render_page(browser)
+
+            errors = {name: [] for name in ESTIMATORS}
+            for _, content in samples:
+                await renderer.set_page_content(page, renderer.generate_card_html(content, 1, 1, style_key))
+                actual = await page.evaluate(MEASURE_NATURAL_HEIGHT_JS)
+                for name, estimator in ESTIMATORS.items():
+                    errors[name].append(estimator(content, style_key) - actual)
+
+            pagination = {}
+            for name, estimator in ESTIMATORS.items():
+                pagination[name] = await count_pagination_measurements(page, md_files, style_key, estimator)
+        finally:
+            await browser.close()
+
+    return {
+        "style": style_key,
+        "notes": len(md_files),
+        "samples": len(samples),
+        "accuracy": {name: error_stats(errs) for name, errs in errors.items()},
+        "pagination": pagination,
+        "measurements_saved": pagination["legacy"]["measurements"] - pagination["glyph"]["measurements"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="高度预估准确度基准")
+    parser.add_argument("corpus", nargs="*", default=[DEFAULT_CORPUS],
+                        help="Markdown 文件、目录或 glob（默认: assets/example.md）")
+    parser.add_argument("--style", "-s", default="purple", choices=list(renderer.STYLES.keys()))
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    md_files = []
+    for pattern in args.corpus:
+        md_files.extend(renderer.collect_markdown_files(pattern))
+    if not md_files:
+        print(json.dumps({"ok": False, "error": "No markdown files found"}))
+        sys.exit(1)
+
+    result = asyncio.run(run_benchmark(md_files, args.style))
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    print(output)
+    if args.json:
+        Path(args.json).write_text(output, encoding='utf-8')
+
+
+if __name__ == "__main__":
+    main()
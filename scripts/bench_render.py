@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+渲染流水线基准 — 离线跑一组固定语料，输出可跨提交 diff 的 JSON。
+
+语料：assets/example.md + 生成的合成笔记（长文、代码多、列表多、中文混 emoji），
+合成笔记内容固定，每次生成完全一致。
+字体固定用本地模式（assets/fonts，没有字体文件时用系统字体），不访问 Google Fonts，
+计时不含网络请求；结果中的 local_fonts 记录实际用到的字体文件，只有字体相同的结果才可比较。
+
+每篇笔记统计：
+  - 各阶段耗时：parse / paginate / screenshot / optimize
+  - Chromium 启动次数、page.set_content 次数（整页加载）、高度测量次数
+  - 输出 PNG 总字节数
+
+用法:
+  python3 bench_render.py                          # 全部语料，共用一个浏览器
+  python3 bench_render.py --cold                   # 每篇单独启动浏览器
+  python3 bench_render.py --paginate estimate --json before.json
+  python3 bench_render.py --only long code_heavy
+  python3 bench_render.py --render-mode stacked
+  python3 bench_render.py --backend auto           # 纯文字卡片走 Pillow（默认全部用浏览器截图）
+
+叠排与逐张渲染的逐像素一致性由 tests/test_render_modes.py 检查
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import render_xhs_v2 as renderer
+from playwright.async_api import BrowserType, Page
+
+EXAMPLE_NOTE = renderer.ASSETS_DIR / "example.md"
+
+
+# ─── 合成语料 ───
+
+def _front_matter(emoji: str, title: str, subtitle: str) -> str:
+    return f'---\nemoji: "{emoji}"\ntitle: "{title}"\nsubtitle: "{subtitle}"\n---\n\n'
+
+
+def fixture_long() -> str:
+    """长文：多个小节，每节若干长段落，触发多次分页"""
+    paragraph = ("坚持记录每天的工作与思考，是提升效率最朴素也最有效的方法。"
+                 "把零散的想法写下来，第二天回看时往往能发现新的联系，"
+                 "久而久之就形成了自己的知识体系。")
+    sections = []
+    for i in range(1, 7):
+        body = "\n\n".join(f"{paragraph}（第 {i}.{j} 段）" for j in range(1, 6))
+        sections.append(f"# 第 {i} 章：长期主义\n\n{body}")
+    return _front_matter("📚", "长文测试", "多章节长段落") + "\n\n---\n\n".join(sections) + \
+        "\n\n#长文 #效率 #读书笔记\n"
+
+
+def fixture_code_heavy() -> str:
+    """代码多：大段代码块，块内含 --- 和 # 注释"""
+    code = "\n".join(f"    result_{i} = process(item_{i})  # 第 {i} 步" for i in range(1, 26))
+    sections = []
+    for i in range(1, 4):
+        sections.append(
+            f"## 示例 {i}\n\n下面这段脚本演示批处理流程：\n\n"
+            f"```python\ndef run_batch_{i}(items):\n{code}\n    # ---\n    return results\n```\n\n"
+            f"运行后检查输出：\n\n```bash\npython3 run.py --batch {i}\n```"
+        )
+    return _front_matter("💻", "代码测试", "大段代码块") + "\n\n---\n\n".join(sections) + \
+        "\n\n#编程 #Python\n"
+
+
+def fixture_list_heavy() -> str:
+    """列表多：长无序/有序列表与嵌套列表"""
+    sections = []
+    for i in range(1, 4):
+        bullets = "\n".join(f"- 第 {j} 条清单：整理桌面、归档文件、清空收件箱" for j in range(1, 21))
+        ordered = "\n".join(f"{j}. 步骤 {j}\n    - 子项 {j}.1\n    - 子项 {j}.2" for j in range(1, 9))
+        sections.append(f"# 清单 {i}\n\n{bullets}\n\n**操作步骤：**\n\n{ordered}")
+    return _front_matter("✅", "清单测试", "长列表与嵌套") + "\n\n---\n\n".join(sections) + \
+        "\n\n#清单 #时间管理\n"
+
+
+def fixture_cjk_emoji() -> str:
+    """中文混 emoji 与英文：考验字宽预估和换行"""
+    line = "今天☀️去了 Coffee Shop ☕️ 点了一杯 Latte 🥛，顺便用 MacBook 💻 写完了 Weekly Report 📊！"
+    sections = []
+    for i in range(1, 5):
+        body = "\n\n".join(f"{line} 🎉 x{j}" for j in range(1, 8))
+        sections.append(f"# 日常 vlog {i} 🌈\n\n{body}\n\n> 生活需要一点仪式感 ✨✨✨")
+    return _front_matter("🌸", "日常记录", "中英混排与 emoji") + "\n\n---\n\n".join(sections) + \
+        "\n\n#生活 #vlog #日常\n"
+
+
+FIXTURES = {
+    "long": fixture_long,
+    "code_heavy": fixture_code_heavy,
+    "list_heavy": fixture_list_heavy,
+    "cjk_emoji": fixture_cjk_emoji,
+}
+
+
+def write_corpus(corpus_dir: Path) -> dict:
+    """example.md 原样使用，合成笔记写入临时目录"""
+    corpus = {"example": str(EXAMPLE_NOTE)}
+    for name, build in FIXTURES.items():
+        path = corpus_dir / f"{name}.md"
+        path.write_text(build(), encoding='utf-8')
+        corpus[name] = str(path)
+    return corpus
+
+
+# ─── 计数与计时 ───
+
+class Probe:
+    """临时替换渲染器和 Playwright 的入口函数，统计调用次数与各阶段耗时"""
+
+    # dom 模式的 parse_note_blocks 在 paginate_cards 内调用，其耗时同时计入 parse 和 paginate
+    PHASES = {
+        "parse": ("parse_markdown_file", "parse_note_blocks"),
+        "paginate": ("paginate_cards",),
+        "screenshot": ("render_jobs", "render_jobs_stacked"),
+        "optimize": ("optimize_pngs",),
+    }
+
+    def __init__(self):
+        self.reset()
+        self._restore = []
+
+    def reset(self):
+        self.phases = {phase: 0.0 for phase in self.PHASES}
+        self.counters = {"chromium_launches": 0, "set_content": 0, "measurements": 0}
+
+    def _patch(self, owner, name, replacement):
+        self._restore.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+
+    def _count(self, owner, name, counter):
+        original = getattr(owner, name)
+
+        async def counted(*args, **kwargs):
+            self.counters[counter] += 1
+            return await original(*args, **kwargs)
+        self._patch(owner, name, counted)
+
+    def _time(self, phase, name):
+        original = getattr(renderer, name)
+
+        if asyncio.iscoroutinefunction(original):
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    self.phases[phase] += time.perf_counter() - start
+        else:
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self.phases[phase] += time.perf_counter() - start
+        self._patch(renderer, name, timed)
+
+    def __enter__(self):
+        self._count(BrowserType, "launch", "chromium_launches")
+        self._count(Page, "set_content", "set_content")
+        # estimate 模式每次试排一次测量；dom 模式每个内容块整段测量一次
+        self._count(renderer, "measure_content_height", "measurements")
+        self._count(renderer, "paginate_content_in_dom", "measurements")
+        for phase, names in self.PHASES.items():
+            for name in names:
+                self._time(phase, name)
+        return self
+
+    def __exit__(self, *exc):
+        for owner, name, original in reversed(self._restore):
+            setattr(owner, name, original)
+        self._restore.clear()
+
+
+def output_bytes(output_dir: str) -> int:
+    return sum(p.stat().st_size for p in Path(output_dir).glob('*.png'))
+
+
+# ─── 运行 ───
+
+async def bench_note(md_file: str, output_dir: str, style_key: str, browser, probe: Probe,
+                     options: dict) -> dict:
+    probe.reset()
+    start = time.perf_counter()
+    # 渲染器的进度输出转到 stderr，stdout 只留 JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        cards = await renderer.render_markdown_to_cards(md_file, output_dir, style_key, browser, **options)
+    wall = time.perf_counter() - start
+    return {
+        "cards": cards,
+        "wall_s": round(wall, 3),
+        "phases_s": {phase: round(seconds, 3) for phase, seconds in probe.phases.items()},
+        **probe.counters,
+        "png_bytes": output_bytes(output_dir),
+    }
+
+
+async def run_benchmark(corpus: dict, output_root: str, style_key: str, cold: bool,
+                        options: dict) -> dict:
+    notes = {}
+    with Probe() as probe:
+        if cold:
+            for name, md_file in corpus.items():
+                notes[name] = await bench_note(md_file, os.path.join(output_root, name),
+                                               style_key, None, probe, options)
+        else:
+            async with renderer.async_playwright() as p:
+                probe.reset()
+                browser = await p.chromium.launch()
+                launches = probe.counters["chromium_launches"]
+                try:
+                    for name, md_file in corpus.items():
+                        notes[name] = await bench_note(md_file, os.path.join(output_root, name),
+                                                       style_key, browser, probe, options)
+                finally:
+                    await browser.close()
+            # 共用浏览器的那次启动记在第一篇上
+            first = next(iter(notes.values()), None)
+            if first is not None:
+                first["chromium_launches"] += launches
+
+    totals = {key: sum(note[key] for note in notes.values())
+              for key in ("cards", "chromium_launches", "set_content", "measurements", "png_bytes")}
+    totals["wall_s"] = round(sum(note["wall_s"] for note in notes.values()), 3)
+    totals["phases_s"] = {phase: round(sum(note["phases_s"][phase] for note in notes.values()), 3)
+                          for phase in Probe.PHASES}
+    return {"notes": notes, "totals": totals}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=renderer.SCRIPT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    choices = ["example"] + list(FIXTURES)
+    parser = argparse.ArgumentParser(description="渲染流水线基准")
+    parser.add_argument("--only", nargs="+", choices=choices, help="只跑指定语料")
+    parser.add_argument("--style", "-s", default="purple", choices=list(renderer.STYLES.keys()))
+    parser.add_argument("--paginate", default="dom", choices=renderer.PAGINATE_MODES)
+    parser.add_argument("--split-mode", default="bisect", choices=renderer.SPLIT_MODES)
+    parser.add_argument("--render-mode", default="pages", choices=renderer.RENDER_MODES)
+    parser.add_argument("--backend", default="playwright", choices=renderer.RENDER_BACKENDS,
+                        help="出图后端（默认 playwright，全部走浏览器）")
+    parser.add_argument("--concurrency", "-j", type=int, default=1)
+    parser.add_argument("--optimize-png", action="store_true")
+    parser.add_argument("--cold", action="store_true", help="每篇笔记单独启动浏览器")
+    parser.add_argument("--keep-output", help="渲染结果保存到该目录（默认用完即删）")
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+    if args.render_mode == "stacked" and args.concurrency > 1:
+        parser.error("--render-mode stacked 在一个页面内逐张截图，不能与 --concurrency 同时使用")
+
+    # 不走 Google Fonts：网络耗时会混进计时，离线机器上还会等到超时
+    renderer.FONT_MODE = "local"
+    local_fonts = [font_file.name for font_file, _ in renderer.discover_local_fonts()]
+    if not local_fonts:
+        print(f"⚠️ {renderer.FONTS_DIR} 下没有字体文件，基准使用系统字体", file=sys.stderr)
+
+    # 基准要测真实渲染，不走图片缓存
+    options = {
+        "split_mode": args.split_mode,
+        "paginate_mode": args.paginate,
+        "concurrency": args.concurrency,
+        "render_mode": args.render_mode,
+        "backend": args.backend,
+        "optimize_png": args.optimize_png,
+    }
+
+    with tempfile.TemporaryDirectory(prefix="xhs_bench_") as tmp:
+        corpus = write_corpus(Path(tmp))
+        if args.only:
+            corpus = {name: path for name, path in corpus.items() if name in args.only}
+        output_root = args.keep_output or os.path.join(tmp, "output")
+        result = asyncio.run(run_benchmark(corpus, output_root, args.style, args.cold, options))
+
+    result = {
+        "commit": git_revision(),
+        "style": args.style,
+        "paginate": args.paginate,
+        "split_mode": args.split_mode,
+        "render_mode": args.render_mode,
+        "backend": args.backend,
+        "concurrency": args.concurrency,
+        "cold": args.cold,
+        "font_mode": renderer.FONT_MODE,
+        "local_fonts": local_fonts,
+        **result,
+    }
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    print(output)
+    if args.json:
+        Path(args.json).write_text(output, encoding='utf-8')
+
+
+if __name__ == "__main__":
+    main()
@@ -10,20 +10,44 @@
 
 使用方法:
     python render_xhs_v2.py <markdown_file> [options]
+    python render_xhs_v2.py --batch <目录或glob> -o <输出根目录> [options]
+    python render_xhs_v2.py --serve [--port 5007]
 
 依赖安装:
     pip install markdown pyyaml playwright
     playwright install chromium
+
+离线字体:
+    将 Noto Sans SC 字体文件（.woff2/.woff/.ttf/.otf，文件名含 Regular/Bold/Black 等字重）
+    放入 assets/fonts/，默认即改用本地字体，不再访问 Google Fonts
 """
 
 import argparse
 import asyncio
+import base64
+import glob
+import hashlib
+import json
+import math
 import os
 import re
+import shutil
 import sys
 import tempfile
+import time
+import unicodedata
+import weakref
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from html import escape as escape_html
+from html.parser import HTMLParser
+from multiprocessing.util import Finalize
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import AsyncIterator, Callable, List, Dict, Optional, TextIO, Tuple
+from urllib.parse import unquote, urlparse
 
 try:
     import markdown
@@ -38,6 +62,7 @@ except ImportError as e:
 # 获取脚本所在目录
 SCRIPT_DIR = Path(__file__).parent.parent
 ASSETS_DIR = SCRIPT_DIR / "assets"
+FONTS_DIR = ASSETS_DIR / "fonts"
 
 # 卡片尺寸配置 (3:4 比例)
 CARD_WIDTH = 1080
@@ -50,6 +75,94 @@ CARD_HEIGHT = 1440
 # 安全边距: ~40px
 SAFE_HEIGHT = CARD_HEIGHT - 120 - 100 - 80 - 40  # ~1100px
 
+# 实测高度上限：card-inner 的 scrollHeight 超过此值即视为溢出
+MAX_INNER_HEIGHT = CARD_HEIGHT - 100
+
+# 溢出块按行拆分的方式
+# linear: 逐行累加，每加一行测量一次（O(行数) 次渲染）
+# bisect: 二分查找每张卡片能容纳的最多行数（每张卡片 O(log 行数) 次渲染）
+SPLIT_MODES = ("bisect", "linear")
+
+# Markdown 转换使用的扩展
+MARKDOWN_EXTENSIONS = ['extra', 'codehilite', 'tables', 'nl2br']
+
+# 分页引擎
+# dom: 整段内容在卡片布局中渲染一次，由浏览器内读取各块偏移一次性算出分页点
+# estimate: Python 侧字数预估 + smart_split_content + 逐块实测（旧流程）
+PAGINATE_MODES = ("dom", "estimate")
+
+# 截图方式
+# pages: 每张卡片单独载入后截图（复用卡片外壳时只替换内容）
+# stacked: 多张卡片叠排在一个文档中，载入一次后按区域逐张截图
+RENDER_MODES = ("pages", "stacked")
+# 出图后端
+# playwright: 全部用浏览器截图（默认）
+# auto: 只含段落、标题、简单列表、分割线和标签的卡片（及不含 emoji 的封面）直接用 Pillow 绘制，
+#       其余交给 Playwright；需要 Pillow 和 assets/fonts 下的本地字体。
+#       Pillow 绘制与 Chromium 截图并非逐像素一致（阴影模糊、字形微调、断行位置可能不同），需显式开启
+RENDER_BACKENDS = ("playwright", "auto")
+
+# 叠排模式每个文档最多容纳的卡片数（视口高度 = 张数 × 1440，过大占用内存）
+STACK_MAX_CARDS = 8
+
+# 字体来源
+# auto: assets/fonts 下有字体文件时用本地字体，否则用 Google Fonts（会提示：离线环境下每次载入都要等网络超时）
+# local: 只用 assets/fonts 下的本地字体
+# google: 从 fonts.googleapis.com @import
+FONT_MODES = ("auto", "local", "google")
+FONT_MODE = os.environ.get("XHS_FONT_MODE", "auto")
+
+GOOGLE_FONTS_IMPORT = "@import url('https://fonts.googleapis.com/css2?family=Noto+Sans+SC:wght@300;400;500;700;900&display=swap');"
+
+# 本地字体通过该虚拟地址引用，由 page.route 直接返回磁盘上的文件内容
+# （set_content 生成的 about:blank 页面无法加载 file:// 资源）
+LOCAL_FONT_URL = "https://xhs-fonts.local/"
+FONT_FAMILY = "Noto Sans SC"
+FONT_WEIGHTS = {
+    "thin": 100, "extralight": 200, "light": 300, "demilight": 350, "regular": 400,
+    "medium": 500, "semibold": 600, "bold": 700, "extrabold": 800, "black": 900,
+}
+FONT_MIME_TYPES = {".woff2": "font/woff2", ".woff": "font/woff", ".ttf": "font/ttf", ".otf": "font/otf"}
+_font_bytes: Dict[str, bytes] = {}
+
+# 卡片外壳复用：同一页面上样式不变时，只替换 .card-content 和页码，不重新 set_content
+# （XHS_SHELL_REUSE=0 关闭，每次都完整载入文档）
+REUSE_CARD_SHELL = os.environ.get("XHS_SHELL_REUSE", "1") != "0"
+CARD_SLOTS_PATTERN = re.compile(
+    r'<div class="card-content">(.*)</div>\s*</div>\s*<div class="page-number">(.*?)</div>',
+    re.DOTALL,
+)
+# 每个页面当前载入的卡片外壳
+_loaded_shells: "weakref.WeakKeyDictionary[Page, str]" = weakref.WeakKeyDictionary()
+
+# 输出图片格式及扩展名；jpeg/webp 未指定质量时用 DEFAULT_QUALITY
+IMAGE_FORMATS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+DEFAULT_QUALITY = 90
+
+# 渲染缓存默认位置与容量上限
+DEFAULT_CACHE_DIR = os.environ.get("XHS_RENDER_CACHE", str(SCRIPT_DIR / "data" / "render_cache"))
+DEFAULT_CACHE_MAX_MB = 500
+# 淘汰扫描（遍历整个缓存目录）只在新写入量超过上限的 CACHE_PRUNE_FRACTION，
+# 或距上次扫描超过 CACHE_PRUNE_INTERVAL 秒时进行
+CACHE_PRUNE_FRACTION = 0.05
+CACHE_PRUNE_INTERVAL = 600
+
+# 笔记中的本地图片：预处理（缩到卡片内容宽度）后存入缓存目录，页面经路由从 LOCAL_IMAGE_URL 读取
+# 缓存文件名为 <源文件指纹>_<宽>x<高>.<扩展名>，分页预估直接从 URL 取得真实尺寸
+IMAGE_CACHE_DIR = Path(os.environ.get("XHS_IMAGE_CACHE", str(SCRIPT_DIR / "data" / "image_cache")))
+# 图片缓存容量上限，超出后与渲染缓存一样按最近使用淘汰（扫描同样受 CACHE_PRUNE_INTERVAL 节流）
+IMAGE_CACHE_MAX_MB = int(os.environ.get("XHS_IMAGE_CACHE_MAX_MB", "200"))
+LOCAL_IMAGE_URL = "https://xhs-images.local/"
+IMAGE_MAX_WIDTH = 840  # card-content 宽度
+IMAGE_MIME_TYPES = {".png": "image/png", ".jpg": "image/jpeg"}
+IMAGE_SIZE_PATTERN = re.compile(re.escape(LOCAL_IMAGE_URL) + r'[0-9a-f]{2}/[0-9a-f]+_(\d+)x(\d+)\.')
+
+# 渲染服务默认端口（签名服务占用 5006）
+DEFAULT_SERVE_PORT = 5007
+# 渲染服务未指定 output_dir 时输出到服务自己的临时目录，以 path 返回的结果保留 SERVE_OUTPUT_TTL 秒
+SERVE_OUTPUT_TTL = 3600
+SERVE_CLEANUP_INTERVAL = 300
+
 # 样式配置
 STYLES = {
     "purple": {
@@ -98,6 +211,26 @@ STYLES = {
 }
 
 
+# 渲染进度的输出流：默认 stdout；嵌入其他程序时用 progress_output 改到别处，
+# 只对当前任务及其创建的子任务生效，不影响调用方自己的输出
+_progress_stream: ContextVar[Optional[TextIO]] = ContextVar("progress_stream", default=None)
+
+
+def progress(*args, **kwargs):
+    """输出一行渲染进度"""
+    print(*args, file=_progress_stream.get() or sys.stdout, flush=True, **kwargs)
+
+
+@contextmanager
+def progress_output(stream: TextIO):
+    """在 with 块内（及其中创建的任务里）把渲染进度写到 stream"""
+    token = _progress_stream.set(stream)
+    try:
+        yield
+    finally:
+        _progress_stream.reset(token)
+
+
 def parse_markdown_file(file_path: str) -> dict:
     """解析 Markdown 文件，提取 YAML 头部和正文内容"""
     with open(file_path, 'r', encoding='utf-8') as f:
@@ -123,141 +256,551 @@ def parse_markdown_file(file_path: str) -> dict:
     }
 
 
+def is_fence_line(line: str) -> bool:
+    """是否为代码块围栏行（``` 或 ~~~）"""
+    return line.strip().startswith(('```', '~~~'))
+
+
 def split_content_by_separator(body: str) -> list:
-    """按照 --- 分隔符拆分正文为多张卡片内容"""
-    parts = re.split(r'\n---+\n', body)
+    """按照 --- 分隔符拆分正文为多张卡片内容（代码块内的 --- 不算分隔符）"""
+    parts = []
+    current = []
+    in_fence = False
+    for line in body.split('\n'):
+        if is_fence_line(line):
+            in_fence = not in_fence
+        if not in_fence and re.fullmatch(r'---+', line):
+            parts.append('\n'.join(current))
+            current = []
+        else:
+            current.append(line)
+    parts.append('\n'.join(current))
     return [part.strip() for part in parts if part.strip()]
 
 
-def estimate_content_height(content: str) -> int:
-    """预估内容高度（基于字数和元素类型）"""
-    lines = content.split('\n')
-    total_height = 0
+# ─── 高度预估 ───
+
+# 默认字宽（单位 em），按 Noto Sans SC / 思源黑体的比例字形近似（未经实测）；
+# 运行 --calibrate 后以 assets/text_metrics.json 中的实测值为准。
+# 仓库不附带该文件：实测结果取决于实际渲染的字体，需在放好 assets/fonts 的渲染机上生成
+DEFAULT_ASCII_WIDTHS = {
+    0.224: " ",
+    0.25: "il.,:;'|!`",
+    0.33: "fjrt()[]{}\"-/\\I",
+    0.5: "abcdeghknopqsuvxyz?*_^~",
+    0.56: "0123456789$#+<=>",
+    0.62: "ABCDEFGHJKLNOPQRSTUVXYZ&",
+    0.85: "mwMW%@",
+}
+
+# 默认块级排版参数，取自 generate_card_html 中的 CSS（line_height 为像素）
+# card-content 宽度 = 1080 - 50*2 - 60*2 = 840px
+DEFAULT_TEXT_METRICS = {
+    "glyphs": {
+        "ascii": {ch: em for em, chars in DEFAULT_ASCII_WIDTHS.items() for ch in chars},
+        "cjk": 1.0,
+        "emoji": 1.17,
+        "other": 0.6,
+        "mono": 0.6,
+    },
+    "blocks": {
+        "p": {"font_size": 42, "line_height": 71.4, "margin_top": 0, "margin_bottom": 35, "width": 840, "padding": 0},
+        "h1": {"font_size": 72, "line_height": 93.6, "margin_top": 0, "margin_bottom": 40, "width": 840, "padding": 0},
+        "h2": {"font_size": 56, "line_height": 78.4, "margin_top": 50, "margin_bottom": 25, "width": 840, "padding": 0},
+        "h3": {"font_size": 48, "line_height": 69.6, "margin_top": 40, "margin_bottom": 20, "width": 840, "padding": 0},
+        "li": {"font_size": 42, "line_height": 67.2, "margin_top": 0, "margin_bottom": 20, "width": 780, "padding": 0},
+        "list": {"margin_top": 30, "margin_bottom": 30},
+        "blockquote": {"font_size": 42, "line_height": 71.4, "margin_top": 35, "margin_bottom": 35, "width": 762, "padding": 50},
+        "pre": {"font_size": 36, "line_height": 54, "margin_top": 35, "margin_bottom": 35, "width": 760, "padding": 80},
+        "hr": {"height": 2, "margin_top": 50, "margin_bottom": 50},
+        "img": {"height": 300, "margin_top": 35, "margin_bottom": 35},
+        "table_row": {"font_size": 42, "line_height": 73.4, "width": 840},
+        "tags": {"margin_top": 50, "padding": 32, "row_height": 102, "font_size": 34, "tag_padding": 71, "width": 840},
+    },
+}
+
+TEXT_METRICS_FILE = ASSETS_DIR / "text_metrics.json"
+
+
+@lru_cache(maxsize=None)
+def load_text_metrics(style_key: str = "purple") -> dict:
+    """读取某样式的排版参数：默认值叠加 --calibrate 生成的实测值"""
+    metrics = {
+        "glyphs": dict(DEFAULT_TEXT_METRICS["glyphs"]),
+        "blocks": {name: dict(values) for name, values in DEFAULT_TEXT_METRICS["blocks"].items()},
+    }
+    if not TEXT_METRICS_FILE.exists():
+        return metrics
     
-    for line in lines:
-        line = line.strip()
-        if not line:
-            total_height += 20  # 空行
-            continue
-            
-        # 标题
-        if line.startswith('# '):
-            total_height += 130  # h1: font-size 72 + margin
-        elif line.startswith('## '):
-            total_height += 110  # h2
-        elif line.startswith('### '):
-            total_height += 90   # h3
-        # 代码块
-        elif line.startswith('```'):
-            total_height += 80   # 代码块起始/结束
-        # 列表
-        elif line.startswith(('- ', '* ', '+ ')):
-            total_height += 85   # li: line-height ~1.6, font-size 42
-        # 引用
-        elif line.startswith('>'):
-            total_height += 100  # blockquote padding
-        # 图片
-        elif line.startswith('!['):
-            total_height += 300  # 图片高度估计
-        # 普通段落
-        else:
-            # 估算字数
-            char_count = len(line)
-            # 一行约25-30个中文字，行高1.7，字体42px
-            lines_needed = max(1, char_count / 28)
-            total_height += int(lines_needed * 42 * 1.7) + 35  # + margin-bottom
+    try:
+        with open(TEXT_METRICS_FILE, 'r', encoding='utf-8') as f:
+            calibrated = json.load(f).get(style_key, {})
+    except (OSError, ValueError):
+        return metrics
     
-    return total_height
+    metrics["glyphs"].update(calibrated.get("glyphs", {}))
+    for name, values in calibrated.get("blocks", {}).items():
+        metrics["blocks"].setdefault(name, {}).update(values)
+    return metrics
+
 
+def char_width_em(ch: str, glyphs: dict) -> float:
+    """单个字符宽度（em）：ASCII 查表，CJK/全角按 1em，emoji 单独计，组合字符不占宽"""
+    width = glyphs["ascii"].get(ch)
+    if width is not None:
+        return width
+    code = ord(ch)
+    if unicodedata.combining(ch) or code in (0x200D, 0xFE0F):
+        return 0.0
+    if 0x1F000 <= code <= 0x1FAFF or 0x2600 <= code <= 0x27BF:
+        return glyphs["emoji"]
+    if unicodedata.east_asian_width(ch) in ('W', 'F'):
+        return glyphs["cjk"]
+    return glyphs["other"]
 
-def smart_split_content(content: str, max_height: int = SAFE_HEIGHT) -> List[str]:
+
+def count_wrapped_lines(text: str, font_size: float, width: float, glyphs: dict,
+                        monospace: bool = False) -> int:
     """
-    智能拆分内容到多张卡片
-    基于预估高度进行拆分，尽量保持段落完整
+    按浏览器的断行方式估算折行数：CJK 逐字可断，拉丁单词整体换行；
+    代码块（word-break: break-all）逐字符断行
     """
-    # 首先尝试识别内容块（以标题或空行分隔）
-    blocks = []
-    current_block = []
+    if monospace:
+        per_line = max(1, int(width // (glyphs["mono"] * font_size)))
+        return max(1, -(-len(text) // per_line))
+    
+    lines, current = 1, 0.0
+    for token in re.findall(r"[A-Za-z0-9_'\-.,:/]+|.", text):
+        token_width = sum(char_width_em(ch, glyphs) for ch in token) * font_size
+        if current + token_width > width and current > 0:
+            lines += 1
+            current = 0.0 if token.isspace() else token_width
+        else:
+            current += token_width
+        # 超长单词会被强制断开
+        while current > width:
+            lines += 1
+            current -= width
+    return lines
+
+
+def strip_inline_markdown(text: str) -> str:
+    """去掉行内 Markdown 标记，只保留会显示出来的文字"""
+    text = re.sub(r'!\[[^\]]*\]\([^)]*\)', '', text)
+    text = re.sub(r'\[([^\]]*)\]\([^)]*\)', r'\1', text)
+    text = re.sub(r'(\*\*|__|\*|_|`)', '', text)
+    return text
+
+
+def layout_blocks(content: str, style_key: str = "purple") -> List[Tuple[float, float, float]]:
+    """
+    将 Markdown 内容粗排为块序列，返回 (上外边距, 块高度, 下外边距) 列表
+    块划分与 markdown 扩展（extra + nl2br）的输出结构对应
+    """
+    metrics = load_text_metrics(style_key)
+    glyphs, blocks = metrics["glyphs"], metrics["blocks"]
+    
+    def text_height(text_lines, m, monospace=False):
+        return sum(
+            count_wrapped_lines(strip_inline_markdown(t) if not monospace else t,
+                                m["font_size"], m["width"], glyphs, monospace)
+            for t in text_lines
+        ) * m["line_height"]
     
+    result = []
     lines = content.split('\n')
     i = 0
     while i < len(lines):
-        line = lines[i]
+        line = lines[i].strip()
+        
+        if not line:
+            i += 1
+            continue
+        
+        # 代码块：收集到闭合的 ```
+        if line.startswith('```'):
+            code_lines = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith('```'):
+                code_lines.append(lines[i].expandtabs(4))
+                i += 1
+            i += 1
+            m = blocks["pre"]
+            result.append((m["margin_top"], m["padding"] + text_height(code_lines or [''], m, True),
+                           m["margin_bottom"]))
+            continue
+        
+        # 标题（h4 及以下没有单独样式，按段落算）
+        heading = re.match(r'(#{1,6})\s+(.*)', line)
+        if heading:
+            m = blocks.get(f"h{len(heading.group(1))}", blocks["p"])
+            result.append((m["margin_top"], text_height([heading.group(2)], m), m["margin_bottom"]))
+            i += 1
+            continue
+        
+        # 末尾标签行
+        if re.fullmatch(r'(?:#[\w\u4e00-\u9fa5]+\s*)+', line):
+            m = blocks["tags"]
+            tags = re.findall(r'#[\w\u4e00-\u9fa5]+', line)
+            rows, row_width = 1, 0.0
+            for tag in tags:
+                tag_width = sum(char_width_em(ch, glyphs) for ch in tag) * m["font_size"] + m["tag_padding"]
+                if row_width + tag_width > m["width"] and row_width > 0:
+                    rows += 1
+                    row_width = 0.0
+                row_width += tag_width
+            result.append((m["margin_top"], m["padding"] + rows * m["row_height"], 0))
+            i += 1
+            continue
+        
+        # 引用：连续的 > 行为一个块
+        if line.startswith('>'):
+            quote_lines = []
+            while i < len(lines) and lines[i].strip().startswith('>'):
+                quote_lines.append(lines[i].strip().lstrip('>').strip())
+                i += 1
+            m = blocks["blockquote"]
+            result.append((m["margin_top"], m["padding"] + text_height(quote_lines, m), m["margin_bottom"]))
+            continue
+        
+        # 列表：连续的列表项（含缩进续行）为一个块
+        if re.match(r'([-*+]|\d+\.)\s', line):
+            m, list_m = blocks["li"], blocks["list"]
+            item_heights = []
+            while i < len(lines):
+                raw = lines[i]
+                stripped = raw.strip()
+                if re.match(r'([-*+]|\d+\.)\s', stripped):
+                    item_heights.append(text_height([re.sub(r'^([-*+]|\d+\.)\s+', '', stripped)], m))
+                elif stripped and raw[:1].isspace() and item_heights:
+                    item_heights[-1] += text_height([stripped], m)
+                else:
+                    break
+                i += 1
+            # 最后一项的下边距与列表下边距折叠
+            height = sum(item_heights) + m["margin_bottom"] * (len(item_heights) - 1)
+            result.append((list_m["margin_top"], height, max(list_m["margin_bottom"], m["margin_bottom"])))
+            continue
+        
+        # 图片：预处理过的本地图片按真实尺寸（max-width: 100% 等比缩放），其余按默认高度
+        if line.startswith('!['):
+            m = blocks["img"]
+            size = IMAGE_SIZE_PATTERN.search(line)
+            height = m["height"]
+            if size:
+                width, natural_height = int(size.group(1)), int(size.group(2))
+                height = natural_height * min(1.0, blocks["p"]["width"] / max(1, width))
+            result.append((m["margin_top"], height, m["margin_bottom"]))
+            i += 1
+            continue
         
-        # 新标题开始新块（除非是第一个）
-        if line.strip().startswith('#') and current_block:
-            blocks.append('\n'.join(current_block))
-            current_block = [line]
         # 分隔线
-        elif line.strip() == '---':
-            if current_block:
-                blocks.append('\n'.join(current_block))
-                current_block = []
-        else:
-            current_block.append(line)
+        if re.fullmatch(r'(?:\*\s*){3,}|(?:-\s*){3,}|(?:_\s*){3,}', line):
+            m = blocks["hr"]
+            result.append((m["margin_top"], m["height"], m["margin_bottom"]))
+            i += 1
+            continue
+        
+        # 表格：分隔行不显示
+        if line.startswith('|'):
+            m = blocks["table_row"]
+            height = 0.0
+            while i < len(lines) and lines[i].strip().startswith('|'):
+                row = lines[i].strip()
+                if not re.fullmatch(r'[|:\-\s]+', row):
+                    cells = [c for c in row.strip('|').split('|')]
+                    cell_width = m["width"] / max(1, len(cells))
+                    height += max(count_wrapped_lines(strip_inline_markdown(c.strip()), m["font_size"],
+                                                      cell_width, glyphs) for c in cells) * m["line_height"]
+                i += 1
+            result.append((0, height, 0))
+            continue
         
-        i += 1
+        # 段落：直到空行或其他块开始；nl2br 使每个源码行单独成行
+        para_lines = []
+        while i < len(lines):
+            stripped = lines[i].strip()
+            if not stripped or stripped.startswith(('```', '#', '>')):
+                break
+            para_lines.append(stripped)
+            i += 1
+        m = blocks["p"]
+        result.append((m["margin_top"], text_height(para_lines, m), m["margin_bottom"]))
+    
+    return result
+
+
+def estimate_content_height(content: str, style_key: str = "purple") -> int:
+    """
+    预估内容高度（card-content 内，含首尾外边距）
+    按实际字宽表断行，并使用卡片模板 CSS 的字号、行高和外边距（相邻外边距折叠）
+    """
+    total = 0.0
+    prev_margin = None
+    for margin_top, height, margin_bottom in layout_blocks(content, style_key):
+        total += (margin_top if prev_margin is None else max(prev_margin, margin_top)) + height
+        prev_margin = margin_bottom
+    if prev_margin is not None:
+        total += prev_margin
+    return int(round(total))
+
+
+CALIBRATE_MARKDOWN = """# 标题
+
+## 标题
+
+### 标题
+
+段落
+
+- 列表
+
+> 引用
+
+```
+code
+```
+
+---
+
+#标签"""
+
+# 在卡片布局中实测字宽与各块的字号、行高、外边距
+CALIBRATE_JS = """() => {
+    const content = document.querySelector('.card-content');
+    const px = v => parseFloat(v) || 0;
+    const measureEm = (parent, text, n) => {
+        const span = document.createElement('span');
+        span.style.whiteSpace = 'pre';
+        span.textContent = text.repeat(n);
+        parent.appendChild(span);
+        const em = span.getBoundingClientRect().width / n / px(getComputedStyle(span).fontSize);
+        span.remove();
+        return em;
+    };
+
+    const para = content.querySelector('p');
+    const ascii = {};
+    for (let c = 32; c < 127; c++) {
+        const ch = String.fromCharCode(c);
+        ascii[ch] = measureEm(para, ch, 20);
+    }
+    const glyphs = {
+        ascii,
+        cjk: measureEm(para, '汉', 20),
+        emoji: measureEm(para, '😀', 10),
+        other: measureEm(para, 'é', 20),
+        mono: measureEm(content.querySelector('pre code'), 'm', 20),
+    };
+
+    const box = (el) => {
+        const cs = getComputedStyle(el);
+        const padding = px(cs.paddingTop) + px(cs.paddingBottom) + px(cs.borderTopWidth) + px(cs.borderBottomWidth);
+        return {
+            font_size: px(cs.fontSize),
+            line_height: el.getBoundingClientRect().height - padding,
+            margin_top: px(cs.marginTop),
+            margin_bottom: px(cs.marginBottom),
+            width: el.clientWidth - px(cs.paddingLeft) - px(cs.paddingRight),
+            padding,
+        };
+    };
+    const blocks = {};
+    for (const tag of ['h1', 'h2', 'h3', 'p', 'li']) {
+        blocks[tag] = box(content.querySelector(tag));
+    }
+    const list = box(content.querySelector('ul'));
+    blocks.list = {margin_top: list.margin_top, margin_bottom: list.margin_bottom};
+
+    const quote = box(content.querySelector('blockquote'));
+    const quoteText = box(content.querySelector('blockquote p'));
+    blocks.blockquote = {...quote, font_size: quoteText.font_size, line_height: quoteText.line_height,
+                         width: quoteText.width};
+    blocks.pre = box(content.querySelector('pre'));
+
+    const hr = content.querySelector('hr');
+    blocks.hr = {height: hr.offsetHeight, margin_top: box(hr).margin_top, margin_bottom: box(hr).margin_bottom};
+
+    const tags = content.querySelector('.tags-container');
+    const tag = tags.querySelector('.tag');
+    const tagStyle = getComputedStyle(tag);
+    const tagsBox = box(tags);
+    blocks.tags = {
+        margin_top: tagsBox.margin_top,
+        padding: tagsBox.padding,
+        row_height: tag.offsetHeight + px(tagStyle.marginTop) + px(tagStyle.marginBottom),
+        font_size: px(tagStyle.fontSize),
+        tag_padding: px(tagStyle.paddingLeft) + px(tagStyle.paddingRight) + px(tagStyle.marginRight),
+        width: tagsBox.width,
+    };
+    return {glyphs, blocks};
+}"""
+
+
+async def calibrate_text_metrics(style_keys: List[str] = None, browser=None) -> dict:
+    """在浏览器中对每个样式实测一次排版参数，写入 assets/text_metrics.json"""
+    if browser is None:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch()
+            try:
+                return await calibrate_text_metrics(style_keys, browser)
+            finally:
+                await browser.close()
     
-    if current_block:
-        blocks.append('\n'.join(current_block))
+    calibrated = {}
+    page = await new_render_page(browser)
+    try:
+        for style_key in style_keys or list(STYLES.keys()):
+            await set_page_content(page, generate_card_html(CALIBRATE_MARKDOWN, 1, 1, style_key))
+            calibrated[style_key] = await page.evaluate(CALIBRATE_JS)
+            progress(f"  📐 已校准: {style_key}")
+    finally:
+        await page.close()
     
-    # 如果没有明显的块边界，按段落拆分
-    if len(blocks) <= 1:
-        blocks = [b for b in content.split('\n\n') if b.strip()]
+    with open(TEXT_METRICS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(calibrated, f, ensure_ascii=False, indent=1)
+    load_text_metrics.cache_clear()
+    progress(f"✅ 排版参数已写入: {TEXT_METRICS_FILE}")
+    return calibrated
+
+
+def split_paragraphs(content: str) -> List[str]:
+    """按空行拆分段落，代码块内的空行不拆"""
+    paragraphs = []
+    current = []
+    in_fence = False
+    for line in content.split('\n'):
+        if is_fence_line(line):
+            in_fence = not in_fence
+        if not in_fence and not line.strip():
+            if current:
+                paragraphs.append('\n'.join(current))
+                current = []
+        else:
+            current.append(line)
+    if current:
+        paragraphs.append('\n'.join(current))
+    return paragraphs
+
+
+def paginate_optimal(count: int, span: Callable[[int, int], float], capacity: float,
+                     keep_with_next: List[bool] = None) -> List[Tuple[int, int]]:
+    """
+    动态规划分页：把 count 个顺序块分到若干张卡片，返回每张卡片的 [起, 止) 下标
+    目标依次为：卡片数最少 → 卡片数相同时尽量满足 keep_with_next（块 k 与下一块同页）→
+    填充最均匀（各卡剩余高度的平方和最小，避免最后一张只剩一两行）
+    span(i, j): 块 i..j（含）同在一张卡片时的内容高度，i 越小、j 越大越高
+    单个块超过 capacity 时独占一张卡片，由调用方继续拆分
+    每个终点只回看到放不下为止，100+ 块也只需毫秒级
+    """
+    if count == 0:
+        return []
+    keep = keep_with_next or [False] * count
+    worst = (math.inf, math.inf, math.inf)
+    # best[k]: 前 k 块分页的最优代价 (卡片数, 违反次数, 剩余平方和)；prev[k]: 最后一张卡片的起点
+    best = [(0, 0, 0.0)] + [worst] * count
+    prev = [0] * (count + 1)
+    for end in range(1, count + 1):
+        for start in range(end - 1, -1, -1):
+            height = span(start, end - 1)
+            if height > capacity and start < end - 1:
+                break
+            cards, violations, uneven = best[start]
+            if start > 0 and keep[start - 1]:
+                violations += 1
+            slack = max(0.0, capacity - height)
+            cost = (cards + 1, violations, uneven + slack * slack)
+            if cost < best[end]:
+                best[end] = cost
+                prev[end] = start
     
-    # 合并块到卡片，确保每张卡片高度不超过限制
-    cards = []
-    current_card = []
-    current_height = 0
+    ranges = []
+    end = count
+    while end > 0:
+        ranges.append((prev[end], end))
+        end = prev[end]
+    return ranges[::-1]
+
+
+def split_code_lines(block: str) -> Tuple[str, List[str], str]:
+    """围栏代码块 → (开围栏行, 代码行, 闭围栏行)；不是代码块时开闭围栏为空"""
+    lines = block.split('\n')
+    if len(lines) >= 2 and is_fence_line(lines[0]) and is_fence_line(lines[-1]):
+        return lines[0], lines[1:-1], lines[-1]
+    return '', lines, ''
+
+
+def smart_split_content(content: str, max_height: int = SAFE_HEIGHT,
+                        style_key: str = "purple") -> List[str]:
+    """
+    智能拆分内容到多张卡片
+    按段落（代码块整体算一段）预估高度，用 paginate_optimal 求卡片数最少、填充最均匀的分法；
+    不增加卡片数时标题与其后第一段不拆开，代码块放得下时不拆开，放不下时按行拆并给每段补上围栏
+    """
+    # 段落为最小单位（split_paragraphs 不拆开代码块），单独的 --- 分隔线丢弃
+    blocks = [block for block in split_paragraphs(content) if not re.fullmatch(r'\s*---+\s*', block)]
+    if not blocks:
+        return [content]
     
+    # 每段的首尾外边距与中间高度，相邻段的外边距按 CSS 折叠
+    margins_top, margins_bottom, bodies = [], [], []
     for block in blocks:
-        block_height = estimate_content_height(block)
-        
-        # 如果单个块就超过限制，需要进一步拆分
-        if block_height > max_height:
-            # 如果当前卡片有内容，先保存
-            if current_card:
-                cards.append('\n\n'.join(current_card))
-                current_card = []
-                current_height = 0
-            
-            # 将大块按行拆分
-            lines = block.split('\n')
-            sub_block = []
-            sub_height = 0
-            
-            for line in lines:
-                line_height = estimate_content_height(line)
-                
-                if sub_height + line_height > max_height and sub_block:
-                    cards.append('\n'.join(sub_block))
-                    sub_block = [line]
-                    sub_height = line_height
-                else:
-                    sub_block.append(line)
-                    sub_height += line_height
-            
-            if sub_block:
-                cards.append('\n'.join(sub_block))
+        layout = layout_blocks(block, style_key)
+        margin_top = layout[0][0] if layout else 0.0
+        margin_bottom = layout[-1][2] if layout else 0.0
+        margins_top.append(margin_top)
+        margins_bottom.append(margin_bottom)
+        bodies.append(estimate_content_height(block, style_key) - margin_top - margin_bottom)
+    
+    body_prefix = [0.0]
+    gap_prefix = [0.0]
+    for k, body in enumerate(bodies):
+        body_prefix.append(body_prefix[-1] + body)
+        if k + 1 < len(blocks):
+            gap_prefix.append(gap_prefix[-1] + max(margins_bottom[k], margins_top[k + 1]))
+    
+    def span(i: int, j: int) -> float:
+        return (margins_top[i] + body_prefix[j + 1] - body_prefix[i]
+                + gap_prefix[j] - gap_prefix[i] + margins_bottom[j])
+    
+    keep_with_next = [bool(re.fullmatch(r'#{1,6}\s+.*', block.strip())) for block in blocks]
+    
+    cards = []
+    for start, end in paginate_optimal(len(blocks), span, max_height, keep_with_next):
+        if end - start > 1 or span(start, start) <= max_height:
+            cards.append('\n\n'.join(blocks[start:end]))
+            continue
         
-        # 如果当前卡片加上这个块会超，先保存当前卡片
-        elif current_height + block_height > max_height and current_card:
-            cards.append('\n\n'.join(current_card))
-            current_card = [block]
-            current_height = block_height
+        # 单个段落超过一页：按行拆分，代码块的每一段都补上开闭围栏
+        fence_open, lines, fence_close = split_code_lines(blocks[start])
+        def wrap(part_lines: List[str]) -> str:
+            return '\n'.join(filter(None, [fence_open, *part_lines, fence_close]))
         
-        # 否则加入当前卡片
-        else:
-            current_card.append(block)
-            current_height += block_height
-    
-    # 保存最后一个卡片
-    if current_card:
-        cards.append('\n\n'.join(current_card))
+        sub_block = []
+        for line in lines:
+            if sub_block and estimate_content_height(wrap(sub_block + [line]), style_key) > max_height:
+                cards.append(wrap(sub_block))
+                sub_block = [line]
+            else:
+                sub_block.append(line)
+        if sub_block:
+            cards.append(wrap(sub_block))
     
     return cards if cards else [content]
 
 
+def build_tags_html(tags: List[str], style: dict) -> str:
+    """标签 HTML（每个标签一个药丸）"""
+    if not tags:
+        return ""
+    accent = style.get('accent_color', '#6366f1')
+    tags_html = f'<div class="tags-container">'
+    for tag in tags:
+        tags_html += f'<span class="tag" style="background: {accent};">#{tag}</span>'
+    tags_html += '</div>'
+    return tags_html
+
+
 def convert_markdown_to_html(md_content: str, style: dict = None) -> str:
     """将 Markdown 转换为 HTML"""
     style = style or STYLES["purple"]
@@ -271,22 +814,114 @@ def convert_markdown_to_html(md_content: str, style: dict = None) -> str:
         tags_str = tags_match.group(1)
         md_content = md_content[:tags_match.start()].strip()
         tags = re.findall(r'#([\w\u4e00-\u9fa5]+)', tags_str)
-        if tags:
-            accent = style.get('accent_color', '#6366f1')
-            tags_html = f'<div class="tags-container">'
-            for tag in tags:
-                tags_html += f'<span class="tag" style="background: {accent};">#{tag}</span>'
-            tags_html += '</div>'
+        tags_html = build_tags_html(tags, style)
     
     # 转换 Markdown 为 HTML
-    html = markdown.markdown(
-        md_content,
-        extensions=['extra', 'codehilite', 'tables', 'nl2br']
-    )
+    html = markdown.markdown(md_content, extensions=MARKDOWN_EXTENSIONS)
     
     return html + tags_html
 
 
+class _TopLevelSplitter(HTMLParser):
+    """记录 HTML 中每个顶层元素的起始位置与标签名"""
+    
+    VOID_TAGS = {'area', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.depth = 0
+        self.starts: List[Tuple[Tuple[int, int], str, str]] = []
+    
+    def handle_starttag(self, tag, attrs):
+        if self.depth == 0:
+            self.starts.append((self.getpos(), tag, dict(attrs).get('class') or ''))
+        if tag not in self.VOID_TAGS:
+            self.depth += 1
+    
+    def handle_startendtag(self, tag, attrs):
+        if self.depth == 0:
+            self.starts.append((self.getpos(), tag, dict(attrs).get('class') or ''))
+    
+    def handle_endtag(self, tag):
+        if tag not in self.VOID_TAGS:
+            self.depth = max(0, self.depth - 1)
+
+
+def split_top_level_html(html: str) -> List[dict]:
+    """把 HTML 片段按顶层元素切成块：[{'type', 'html'}]"""
+    splitter = _TopLevelSplitter()
+    splitter.feed(html)
+    splitter.close()
+    
+    line_offsets = [0]
+    for line in html.split('\n'):
+        line_offsets.append(line_offsets[-1] + len(line) + 1)
+    offsets = [line_offsets[line - 1] + col for (line, col), _, _ in splitter.starts]
+    
+    blocks = []
+    for i, (_, tag, css_class) in enumerate(splitter.starts):
+        end = offsets[i + 1] if i + 1 < len(offsets) else len(html)
+        block_type = "code" if tag == 'div' and 'codehilite' in css_class else tag
+        blocks.append({"type": block_type, "html": html[offsets[i]:end].strip()})
+    return blocks
+
+
+def extract_trailing_tags(body: str) -> Tuple[str, List[str]]:
+    """从正文末尾取出标签行（#标签1 #标签2），返回 (去掉标签后的正文, 标签列表)"""
+    match = re.search(r'(?:^|\n)((?:#[\w\u4e00-\u9fa5]+[ \t]*\n?)+)\s*\Z', body)
+    if not match:
+        return body, []
+    return body[:match.start()].rstrip(), re.findall(r'#([\w\u4e00-\u9fa5]+)', match.group(1))
+
+
+def parse_note_blocks(body: str, style_key: str = "purple") -> List[List[dict]]:
+    """
+    把正文一次性解析为块列表：按 --- 分成内容段，每段只做一次 Markdown 转换，
+    再按顶层元素切成带类型的 HTML 片段；标签每篇只提取一次，作为最后一段的末尾块
+    """
+    style = STYLES.get(style_key, STYLES["purple"])
+    body, tags = extract_trailing_tags(body)
+    
+    chunks = []
+    for content in split_content_by_separator(body):
+        html = markdown.markdown(content, extensions=MARKDOWN_EXTENSIONS)
+        chunks.append(split_top_level_html(html))
+    
+    if tags:
+        if not chunks:
+            chunks.append([])
+        chunks[-1].append({"type": "tags", "html": build_tags_html(tags, style)})
+    return chunks
+
+
+def cover_palette(style_key: str) -> dict:
+    """封面配色（HTML 模板与 Pillow 快速渲染共用）"""
+    # 暗黑模式特殊处理
+    is_dark = style_key == "dark"
+    return {
+        "text_color": "#ffffff" if is_dark else "#000000",
+        "title_gradient": "linear-gradient(180deg, #ffffff 0%, #cccccc 100%)" if is_dark else "linear-gradient(180deg, #2E67B1 0%, #4C4C4C 100%)",
+        "inner_bg": "#1a1a2e" if is_dark else "#F3F3F3",
+    }
+
+
+def card_palette(style_key: str) -> dict:
+    """正文卡片配色（HTML 模板与 Pillow 快速渲染共用）"""
+    # 暗黑模式特殊处理
+    is_dark = style_key == "dark"
+    return {
+        "card_bg": "rgba(30, 30, 46, 0.95)" if is_dark else "rgba(255, 255, 255, 0.95)",
+        "text_color": "#e0e0e0" if is_dark else "#475569",
+        "heading_color": "#ffffff" if is_dark else "#1e293b",
+        "h2_color": "#e0e0e0" if is_dark else "#334155",
+        "h3_color": "#c0c0c0" if is_dark else "#475569",
+        "pre_bg": "#0f0f23" if is_dark else "#1e293b",
+        "blockquote_bg": "#252540" if is_dark else "#f1f5f9",
+        "blockquote_color": "#a0a0a0" if is_dark else "#64748b",
+        "rule_color": "#333355" if is_dark else "#e2e8f0",
+    }
+
+
 def generate_cover_html(metadata: dict, style_key: str = "purple") -> str:
     """生成封面 HTML"""
     style = STYLES.get(style_key, STYLES["purple"])
@@ -301,11 +936,10 @@ def generate_cover_html(metadata: dict, style_key: str = "purple") -> str:
     if len(subtitle) > 15:
         subtitle = subtitle[:15]
     
-    # 暗黑模式特殊处理
-    is_dark = style_key == "dark"
-    text_color = "#ffffff" if is_dark else "#000000"
-    title_gradient = "linear-gradient(180deg, #ffffff 0%, #cccccc 100%)" if is_dark else "linear-gradient(180deg, #2E67B1 0%, #4C4C4C 100%)"
-    inner_bg = "#1a1a2e" if is_dark else "#F3F3F3"
+    palette = cover_palette(style_key)
+    text_color = palette["text_color"]
+    title_gradient = palette["title_gradient"]
+    inner_bg = palette["inner_bg"]
     
     return f'''<!DOCTYPE html>
 <html lang="zh-CN">
@@ -314,7 +948,7 @@ def generate_cover_html(metadata: dict, style_key: str = "purple") -> str:
     <meta name="viewport" content="width=1080, height=1440">
     <title>小红书封面</title>
     <style>
-        @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+SC:wght@300;400;500;700;900&display=swap');
+        {font_face_css()}
         * {{ margin: 0; padding: 0; box-sizing: border-box; }}
         body {{
             font-family: 'Noto Sans SC', 'Source Han Sans CN', 'PingFang SC', 'Microsoft YaHei', sans-serif;
@@ -368,20 +1002,27 @@ def generate_card_html(content: str, page_number: int = 1, total_pages: int = 1,
     """生成正文卡片 HTML"""
     style = STYLES.get(style_key, STYLES["purple"])
     html_content = convert_markdown_to_html(content, style)
+    return build_card_html(html_content, page_number, total_pages, style_key)
+
+
+def build_card_html(html_content: str, page_number: int = 1, total_pages: int = 1,
+                    style_key: str = "purple") -> str:
+    """用已转换好的 HTML 片段生成正文卡片 HTML"""
+    style = STYLES.get(style_key, STYLES["purple"])
     page_text = f"{page_number}/{total_pages}" if total_pages > 1 else ""
     
-    # 暗黑模式特殊处理
     is_dark = style_key == "dark"
-    card_bg = "rgba(30, 30, 46, 0.95)" if is_dark else "rgba(255, 255, 255, 0.95)"
-    text_color = "#e0e0e0" if is_dark else "#475569"
-    heading_color = "#ffffff" if is_dark else "#1e293b"
-    h2_color = "#e0e0e0" if is_dark else "#334155"
-    h3_color = "#c0c0c0" if is_dark else "#475569"
-    code_bg = "#0f0f23" if is_dark else "#1e293b"
-    pre_bg = "#0f0f23" if is_dark else "#1e293b"
-    blockquote_bg = "#252540" if is_dark else "#f1f5f9"
+    palette = card_palette(style_key)
+    card_bg = palette["card_bg"]
+    text_color = palette["text_color"]
+    heading_color = palette["heading_color"]
+    h2_color = palette["h2_color"]
+    h3_color = palette["h3_color"]
+    pre_bg = palette["pre_bg"]
+    blockquote_bg = palette["blockquote_bg"]
     blockquote_border = style['accent_color']
-    blockquote_color = "#a0a0a0" if is_dark else "#64748b"
+    blockquote_color = palette["blockquote_color"]
+    rule_color = palette["rule_color"]
     
     return f'''<!DOCTYPE html>
 <html lang="zh-CN">
@@ -390,7 +1031,7 @@ def generate_card_html(content: str, page_number: int = 1, total_pages: int = 1,
     <meta name="viewport" content="width=1080">
     <title>小红书卡片</title>
     <style>
-        @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+SC:wght@300;400;500;700;900&display=swap');
+        {font_face_css()}
         * {{ margin: 0; padding: 0; box-sizing: border-box; }}
         body {{
             font-family: 'Noto Sans SC', 'Source Han Sans CN', 'PingFang SC', 'Microsoft YaHei', sans-serif;
@@ -477,12 +1118,12 @@ def generate_card_html(content: str, page_number: int = 1, total_pages: int = 1,
         }}
         .card-content hr {{
             border: none; height: 2px;
-            background: {'#333355' if is_dark else '#e2e8f0'};
+            background: {rule_color};
             margin: 50px 0;
         }}
         .tags-container {{
             margin-top: 50px; padding-top: 30px;
-            border-top: 2px solid {'#333355' if is_dark else '#e2e8f0'};
+            border-top: 2px solid {rule_color};
         }}
         .tag {{
             display: inline-block;
@@ -515,10 +1156,153 @@ def generate_card_html(content: str, page_number: int = 1, total_pages: int = 1,
 </html>'''
 
 
+@lru_cache(maxsize=None)
+def discover_local_fonts() -> Tuple[Tuple[Path, str], ...]:
+    """扫描 assets/fonts，返回 (字体文件, CSS font-weight) 列表；文件名无字重时按可变字体处理"""
+    if not FONTS_DIR.is_dir():
+        return ()
+    
+    fonts = []
+    for font_file in sorted(FONTS_DIR.iterdir()):
+        if font_file.suffix.lower() not in FONT_MIME_TYPES:
+            continue
+        stem = re.sub(r'[^a-z0-9]', '', font_file.stem.lower().split('-')[-1])
+        if stem.isdigit():
+            weight = stem
+        elif stem in FONT_WEIGHTS:
+            weight = str(FONT_WEIGHTS[stem])
+        else:
+            weight = "100 900"
+        fonts.append((font_file, weight))
+    return tuple(fonts)
+
+
+def use_local_fonts() -> bool:
+    """当前是否使用本地字体"""
+    if FONT_MODE == "local":
+        return True
+    return FONT_MODE == "auto" and bool(discover_local_fonts())
+
+
+@lru_cache(maxsize=None)
+def warn_google_fonts_fallback():
+    """auto 模式找不到本地字体、改用 Google Fonts 时提示一次（仓库不附带字体文件，需自行放入 assets/fonts）"""
+    progress(f"⚠️ {FONTS_DIR} 下没有字体文件，改从 fonts.googleapis.com 加载字体；"
+             f"离线环境每次载入页面都会等到网络超时。放入 Noto Sans SC 字体文件（见 README）"
+             f"或用 --font-mode local 改用系统字体")
+
+
+def font_face_css() -> str:
+    """生成模板中的字体声明：本地 @font-face 或 Google Fonts @import"""
+    if not use_local_fonts():
+        if FONT_MODE == "auto":
+            warn_google_fonts_fallback()
+        return GOOGLE_FONTS_IMPORT
+    
+    rules = []
+    for font_file, weight in discover_local_fonts():
+        rules.append(
+            f"@font-face {{ font-family: '{FONT_FAMILY}'; font-weight: {weight}; "
+            f"font-display: block; src: url('{LOCAL_FONT_URL}{font_file.name}'); }}"
+        )
+    return "\n        ".join(rules)
+
+
+def font_fingerprint() -> str:
+    """当前字体集合的指纹（本地字体文件名、大小、修改时间），用于缓存键"""
+    if not use_local_fonts():
+        return "google"
+    parts = []
+    for font_file, weight in discover_local_fonts():
+        stat = font_file.stat()
+        parts.append(f"{font_file.name}:{weight}:{stat.st_size}:{stat.st_mtime_ns}")
+    return ";".join(parts)
+
+
+async def _serve_local_font(route):
+    """page.route 回调：从 assets/fonts 返回字体文件（每个文件只读一次磁盘）；只认目录下直接存放的字体文件"""
+    name = route.request.url[len(LOCAL_FONT_URL):].split('?')[0]
+    font_file = FONTS_DIR / name
+    if name != Path(name).name or font_file.suffix.lower() not in FONT_MIME_TYPES or not font_file.is_file():
+        await route.abort()
+        return
+    if name not in _font_bytes:
+        _font_bytes[name] = font_file.read_bytes()
+    await route.fulfill(
+        body=_font_bytes[name],
+        content_type=FONT_MIME_TYPES.get(font_file.suffix.lower(), "application/octet-stream"),
+        headers={"Cache-Control": "max-age=31536000"},
+    )
+
+
+async def new_render_page(browser, width: int = CARD_WIDTH, height: int = CARD_HEIGHT) -> Page:
+    """创建渲染用页面，使用本地字体时挂上字体路由"""
+    page = await browser.new_page(viewport={'width': width, 'height': height})
+    metrics_count("pages")
+    if use_local_fonts():
+        await page.route(f"{LOCAL_FONT_URL}**", _serve_local_font)
+    await page.route(f"{LOCAL_IMAGE_URL}**", _serve_local_image)
+    return page
+
+
+def split_card_html(html_content: str) -> Optional[Tuple[str, str, str]]:
+    """把卡片 HTML 拆成 (外壳, .card-content 内容, 页码文字)；不是卡片 HTML 时返回 None"""
+    match = CARD_SLOTS_PATTERN.search(html_content)
+    if not match:
+        return None
+    shell = (html_content[:match.start(1)] + html_content[match.end(1):match.start(2)]
+             + html_content[match.end(2):])
+    return shell, match.group(1), match.group(2)
+
+
+# 在已载入的卡片外壳中替换内容和页码，等待图片与字体就绪后返回 .card-inner 高度
+SWAP_CARD_JS = """async ([html, pageText]) => {
+    document.querySelector('.card-content').innerHTML = html;
+    document.querySelector('.page-number').textContent = pageText;
+    await Promise.all([...document.images].filter(img => !img.complete).map(
+        img => new Promise(resolve => { img.onload = img.onerror = resolve; })
+    ));
+    document.body.getBoundingClientRect();
+    await document.fonts.ready;
+    return document.querySelector('.card-inner').scrollHeight;
+}"""
+
+
+async def set_page_content(page: Page, html_content: str) -> Optional[int]:
+    """
+    载入 HTML，并以 document.fonts.ready 作为字体就绪信号（取代 networkidle + 固定等待）
+    页面上已是同一样式的卡片外壳时，只替换 .card-content 与页码（一次 evaluate，不重新导航），
+    此时返回 .card-inner 的 scrollHeight；完整载入时返回 None
+    """
+    parts = split_card_html(html_content) if REUSE_CARD_SHELL else None
+    if parts is not None and _loaded_shells.get(page) == parts[0]:
+        metrics_count("shell_swaps")
+        return await page.evaluate(SWAP_CARD_JS, [parts[1], parts[2]])
+    
+    metrics_count("full_loads")
+    await page.set_content(html_content, wait_until='load')
+    await page.evaluate('''() => {
+        document.body.getBoundingClientRect();
+        return document.fonts.ready.then(() => true);
+    }''')
+    if parts is not None:
+        _loaded_shells[page] = parts[0]
+    else:
+        _loaded_shells.pop(page, None)
+    return None
+
+
 async def measure_content_height(page: Page, html_content: str) -> int:
-    """使用 Playwright 测量实际内容高度"""
-    await page.set_content(html_content, wait_until='networkidle')
-    await page.wait_for_timeout(300)  # 等待字体渲染
+    """使用 Playwright 测量实际内容高度（复用卡片外壳时替换内容即得高度，无需再次 evaluate）"""
+    metrics_count("measurements")
+    with metrics_phase("measure"):
+        return await _measure_content_height(page, html_content)
+
+
+async def _measure_content_height(page: Page, html_content: str) -> int:
+    height = await set_page_content(page, html_content)
+    if height is not None:
+        return height
     
     height = await page.evaluate('''() => {
         const inner = document.querySelector('.card-inner');
@@ -532,148 +1316,2024 @@ async def measure_content_height(page: Page, html_content: str) -> int:
     return height
 
 
-async def render_html_to_image(html_content: str, output_path: str, 
-                                width: int = CARD_WIDTH, height: int = CARD_HEIGHT):
-    """使用 Playwright 将 HTML 渲染为图片"""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch()
-        page = await browser.new_page(viewport={'width': width, 'height': height})
-        
-        try:
-            await page.set_content(html_content, wait_until='networkidle')
-            await page.wait_for_timeout(300)
-            
-            # 截图固定尺寸
-            await page.screenshot(
-                path=output_path,
-                clip={'x': 0, 'y': 0, 'width': width, 'height': height},
-                type='png'
-            )
-            
-            print(f"  ✅ 已生成: {output_path}")
-            
-        finally:
-            await browser.close()
+# ─── 本地图片预处理 ───
+
+MARKDOWN_IMAGE_PATTERN = re.compile(r'(!\[[^\]]*\]\(\s*)<?([^)\s>]+)>?((?:\s+"[^"]*")?\s*\))')
+
+
+def resolve_image_source(src: str, base_dir: Path) -> Optional[Path]:
+    """Markdown 图片地址 → 本地文件（相对路径相对于笔记所在目录）；远程图片或文件不存在时返回 None"""
+    parsed = urlparse(src)
+    if parsed.scheme == "file":
+        path = Path(unquote(parsed.path))
+    elif parsed.scheme or src.startswith(LOCAL_IMAGE_URL):
+        return None
+    else:
+        path = Path(unquote(src)).expanduser()
+        if not path.is_absolute():
+            path = base_dir / path
+    return path if path.is_file() else None
 
 
-async def process_and_render_cards(card_contents: List[str], output_dir: str, 
-                                   style_key: str) -> List[str]:
+def image_cache_key(path: Path) -> str:
+    """源文件指纹：绝对路径 + 修改时间 + 大小 + 目标宽度，文件改动后自动换新"""
+    stat = path.stat()
+    raw = f"{path.resolve()}|{stat.st_mtime_ns}|{stat.st_size}|{IMAGE_MAX_WIDTH}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def cached_image_name(key: str) -> Optional[str]:
+    """缓存中该指纹的文件名（同时刷新其最近使用时间），没有则返回 None"""
+    for cached in IMAGE_CACHE_DIR.glob(f"{key[:2]}/{key}_*"):
+        if cached.suffix in IMAGE_MIME_TYPES:
+            try:
+                os.utime(cached)
+            except FileNotFoundError:
+                continue
+            return f"{key[:2]}/{cached.name}"
+    return None
+
+
+def _preprocess_image(source: str, key: str) -> str:
     """
-    处理卡片内容，检测高度并自动分页，然后渲染
-    返回最终生成的所有卡片文件路径
+    worker 进程中执行：按 EXIF 方向摆正、缩到卡片内容宽度后写入缓存，返回缓存文件名
+    有透明通道存 PNG，否则存 JPEG；本身不超宽且无需旋转的 PNG/JPEG 直接复制
     """
-    async with async_playwright() as p:
-        browser = await p.chromium.launch()
-        page = await browser.new_page(viewport={'width': CARD_WIDTH, 'height': CARD_HEIGHT})
-        
-        all_cards = []
-        
-        try:
-            for content in card_contents:
-                # 预估内容高度
-                estimated_height = estimate_content_height(content)
-                
-                # 如果预估高度超过安全高度，尝试拆分
-                if estimated_height > SAFE_HEIGHT:
-                    split_contents = smart_split_content(content, SAFE_HEIGHT)
-                else:
-                    split_contents = [content]
-                
-                # 验证每个拆分后的内容
-                for split_content in split_contents:
-                    # 生成临时 HTML 测量
-                    temp_html = generate_card_html(split_content, 1, 1, style_key)
-                    actual_height = await measure_content_height(page, temp_html)
-                    
-                    # 如果仍然超出，进一步按行拆分
-                    if actual_height > CARD_HEIGHT - 100:
-                        lines = split_content.split('\n')
-                        sub_contents = []
-                        sub_lines = []
-                        sub_height = 0
-                        
-                        for line in lines:
-                            test_lines = sub_lines + [line]
-                            test_html = generate_card_html('\n'.join(test_lines), 1, 1, style_key)
-                            test_height = await measure_content_height(page, test_html)
-                            
-                            if test_height > CARD_HEIGHT - 100 and sub_lines:
-                                sub_contents.append('\n'.join(sub_lines))
-                                sub_lines = [line]
-                            else:
-                                sub_lines = test_lines
-                        
-                        if sub_lines:
-                            sub_contents.append('\n'.join(sub_lines))
-                        
-                        all_cards.extend(sub_contents)
-                    else:
-                        all_cards.append(split_content)
+    from PIL import Image, ImageOps
+    with Image.open(source) as img:
+        oriented = img.getexif().get(0x0112, 1) not in (0, 1)
+        original_format = img.format
+        image = ImageOps.exif_transpose(img) if oriented else img
+        if image.width > IMAGE_MAX_WIDTH:
+            height = max(1, round(image.height * IMAGE_MAX_WIDTH / image.width))
+            image = image.resize((IMAGE_MAX_WIDTH, height), Image.LANCZOS)
+            resized = True
+        else:
+            resized = False
         
-        finally:
-            await browser.close()
-    
-    return all_cards
+        alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        ext = ".png" if alpha or original_format == "PNG" else ".jpg"
+        name = f"{key[:2]}/{key}_{image.width}x{image.height}{ext}"
+        target = IMAGE_CACHE_DIR / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+        if not resized and not oriented and original_format in ("PNG", "JPEG"):
+            shutil.copyfile(source, tmp_path)
+        elif ext == ".png":
+            image.save(tmp_path, format='PNG')
+        else:
+            image.convert('RGB').save(tmp_path, format='JPEG', quality=DEFAULT_QUALITY)
+    os.replace(tmp_path, target)
+    return name
 
 
-async def render_markdown_to_cards(md_file: str, output_dir: str, style_key: str = "purple"):
-    """主渲染函数：将 Markdown 文件渲染为多张卡片图片"""
-    print(f"\n🎨 开始渲染: {md_file}")
-    print(f"🎨 使用样式: {STYLES[style_key]['name']}")
-    
-    # 确保输出目录存在
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # 解析 Markdown 文件
-    data = parse_markdown_file(md_file)
-    metadata = data['metadata']
-    body = data['body']
+def iter_image_matches(lines: List[str]):
+    """逐个产出正文中图片语法的 (行号, 匹配)，代码块内的不算"""
+    in_fence = False
+    for line_number, line in enumerate(lines):
+        if is_fence_line(line):
+            in_fence = not in_fence
+            continue
+        if in_fence:
+            continue
+        for match in MARKDOWN_IMAGE_PATTERN.finditer(line):
+            yield line_number, match
+
+
+def note_image_files(md_file: str) -> List[Path]:
+    """笔记引用的本地图片文件（监听模式据此发现图片改动）；读取失败时返回空列表"""
+    try:
+        body = parse_markdown_file(md_file)['body']
+    except (OSError, UnicodeDecodeError):
+        return []
+    base_dir = Path(md_file).resolve().parent
+    files = (resolve_image_source(match.group(2), base_dir) for _, match in iter_image_matches(body.split('\n')))
+    return sorted({file for file in files if file is not None})
+
+
+def resolve_note_images(body: str, base_dir: Path, workers: int = None) -> str:
+    """
+    预处理正文中的本地图片：未缓存的在进程池中缩放，返回把图片地址换成 LOCAL_IMAGE_URL 的正文
+    图片地址中带有真实尺寸（见 IMAGE_SIZE_PATTERN），img 同时带上 width/height 属性，
+    浏览器解码前即可按最终尺寸布局；远程图片与找不到的文件保持原样。需要 Pillow，未安装时不处理
+    """
+    lines = body.split('\n')
+    references = []  # (行号, 匹配, 源文件)
+    for line_number, match in iter_image_matches(lines):
+        source = resolve_image_source(match.group(2), base_dir)
+        if source is None:
+            if not urlparse(match.group(2)).scheme:
+                progress(f"  ⚠️ 图片不存在: {match.group(2)}")
+            continue
+        references.append((line_number, match, source))
+    if not references:
+        return body
     
-    # 分割正文内容（基于用户手动分隔符）
-    card_contents = split_content_by_separator(body)
-    print(f"  📄 检测到 {len(card_contents)} 个内容块")
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        progress("  ⚠️ 未安装 Pillow，本地图片不做预处理（pip install pillow）")
+        return body
     
-    # 处理内容，智能分页
-    print("  🔍 分析内容高度并智能分页...")
-    processed_cards = await process_and_render_cards(card_contents, output_dir, style_key)
-    total_cards = len(processed_cards)
-    print(f"  📄 将生成 {total_cards} 张卡片")
+    names: Dict[str, str] = {}
+    pending: Dict[str, str] = {}  # 指纹 → 源文件
+    for _, _, source in references:
+        key = image_cache_key(source)
+        name = cached_image_name(key)
+        if name is None:
+            pending[key] = str(source)
+        else:
+            names[str(source)] = name
     
-    # 生成封面
-    if metadata.get('emoji') or metadata.get('title'):
-        print("  📷 生成封面...")
-        cover_html = generate_cover_html(metadata, style_key)
-        cover_path = os.path.join(output_dir, 'cover.png')
-        await render_html_to_image(cover_html, cover_path)
+    if len(pending) == 1:
+        [(key, source)] = pending.items()
+        names[source] = _preprocess_image(source, key)
+    elif pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {source: pool.submit(_preprocess_image, source, key) for key, source in pending.items()}
+            names.update({source: future.result() for source, future in futures.items()})
+    if pending:
+        progress(f"  🖼️ 预处理 {len(pending)} 张图片（缓存 {len(references) - len(pending)} 张）")
+        if prune_due(IMAGE_CACHE_DIR):
+            prune_cache_dir(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB * 1024 * 1024, IMAGE_MIME_TYPES,
+                            keep=[IMAGE_CACHE_DIR / name for name in names.values()])
     
-    # 生成正文卡片
-    async with async_playwright() as p:
-        browser = await p.chromium.launch()
-        page = await browser.new_page(viewport={'width': CARD_WIDTH, 'height': CARD_HEIGHT})
-        
+    # 从行尾往前替换，匹配位置不受影响
+    for line_number, match, source in reversed(references):
+        name = names[str(source)]
+        width, height = IMAGE_SIZE_PATTERN.match(LOCAL_IMAGE_URL + name).groups()
+        line = lines[line_number]
+        replacement = (f"{match.group(1)}{LOCAL_IMAGE_URL}{name}{match.group(3)}"
+                       f'{{: width="{width}" height="{height}"}}')
+        lines[line_number] = line[:match.start()] + replacement + line[match.end():]
+    return '\n'.join(lines)
+
+
+async def _serve_local_image(route):
+    """page.route 回调：从图片缓存目录返回预处理后的图片"""
+    name = route.request.url[len(LOCAL_IMAGE_URL):].split('?')[0]
+    image_file = IMAGE_CACHE_DIR / name
+    if '..' in Path(name).parts or not image_file.is_file():
+        await route.abort()
+        return
+    await route.fulfill(
+        body=image_file.read_bytes(),
+        content_type=IMAGE_MIME_TYPES.get(image_file.suffix, "application/octet-stream"),
+        headers={"Cache-Control": "max-age=31536000"},
+    )
+
+
+# ─── 渲染指标 ───
+
+# 当前笔记的指标收集器（--metrics 时设置）；asyncio 任务各自继承上下文，服务模式并发渲染互不干扰
+_current_metrics: ContextVar[Optional["RenderMetrics"]] = ContextVar("render_metrics", default=None)
+
+
+class RenderMetrics:
+    """
+    单篇笔记的分阶段耗时与计数，渲染结束后输出一行 JSON
+    阶段: parse 解析与 Markdown 转换 / paginate 分页（与 split、measure 及 dom 模式的转换重叠）/
+          split smart_split_content / measure 浏览器测量 / screenshot 截图 / optimize PNG 重压缩
+    计数: measurements 测量次数 / re_splits 拆分产生的额外卡片数 / pages 打开的页面数 /
+          full_loads 完整载入文档次数 / shell_swaps 复用外壳替换内容次数 /
+          cache_hits / cache_misses / raster_cards Pillow 快速渲染张数 / unchanged 监听模式下未变而跳过的张数 /
+          chunks 内容块数 / cards 生成卡片数
+    """
+    
+    PHASES = ("parse", "paginate", "split", "measure", "screenshot", "optimize")
+    COUNTERS = ("measurements", "re_splits", "pages", "full_loads", "shell_swaps",
+                "cache_hits", "cache_misses", "raster_cards", "unchanged", "chunks", "cards")
+    
+    def __init__(self, md_file: str, style_key: str, paginate_mode: str):
+        self.md_file = md_file
+        self.style_key = style_key
+        self.paginate_mode = paginate_mode
+        self.seconds = dict.fromkeys(self.PHASES, 0.0)
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.started = time.perf_counter()
+        self.error = None
+    
+    def to_dict(self) -> dict:
+        record = {
+            "file": self.md_file,
+            "style": self.style_key,
+            "paginate": self.paginate_mode,
+            "ok": self.error is None,
+            "ms": {phase: round(seconds * 1000, 1) for phase, seconds in self.seconds.items()},
+            **self.counters,
+        }
+        record["ms"]["total"] = round((time.perf_counter() - self.started) * 1000, 1)
+        if self.error is not None:
+            record["error"] = self.error
+        return record
+    
+    def emit(self, target: str):
+        """target 为 '-' 时写到 stderr，否则追加到文件（每篇一行 JSON，多进程追加安全）"""
+        line = json.dumps(self.to_dict(), ensure_ascii=False) + "\n"
+        if target == "-":
+            sys.stderr.write(line)
+            sys.stderr.flush()
+        else:
+            with open(target, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+def metrics_count(name: str, n: int = 1):
+    """给当前笔记的计数加 n（未开启 --metrics 时什么都不做）"""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.counters[name] += n
+
+
+@contextmanager
+def metrics_phase(name: str):
+    """累计当前笔记某阶段的耗时（未开启 --metrics 时什么都不做）"""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.seconds[name] += time.perf_counter() - start
+
+
+# ─── 渲染缓存 ───
+
+def prune_due(cache_dir: Path) -> bool:
+    """距上次扫描是否已超过 CACHE_PRUNE_INTERVAL 秒（扫描时间记在缓存目录的 .pruned 标记文件上，多进程共用）"""
+    try:
+        return time.time() - (cache_dir / ".pruned").stat().st_mtime >= CACHE_PRUNE_INTERVAL
+    except FileNotFoundError:
+        return cache_dir.exists()
+
+
+def prune_cache_dir(cache_dir: Path, max_bytes: int, suffixes, keep=()):
+    """
+    缓存目录（<指纹前两位>/<文件>）中 suffixes 类文件总大小超过上限时，按最近使用时间（mtime）从旧到新淘汰
+    keep 中的文件（正在使用的）计入总大小但不删除
+    """
+    keep = {Path(path) for path in keep}
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    (cache_dir / ".pruned").touch()
+    entries = []
+    total = 0
+    for cached in cache_dir.glob('*/*'):
+        if cached.suffix not in suffixes:
+            continue
         try:
-            for i, content in enumerate(processed_cards, 1):
-                print(f"  📷 生成卡片 {i}/{total_cards}...")
-                card_html = generate_card_html(content, i, total_cards, style_key)
-                card_path = os.path.join(output_dir, f'card_{i}.png')
-                
-                await page.set_content(card_html, wait_until='networkidle')
-                await page.wait_for_timeout(300)
-                
-                await page.screenshot(
-                    path=card_path,
-                    clip={'x': 0, 'y': 0, 'width': CARD_WIDTH, 'height': CARD_HEIGHT},
-                    type='png'
-                )
-                print(f"  ✅ 已生成: {card_path}")
+            stat = cached.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, cached))
+        total += stat.st_size
+    
+    for _, size, cached in sorted(entries):
+        if total <= max_bytes:
+            break
+        if cached in keep:
+            continue
+        try:
+            cached.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+class RenderCache:
+    """
+    按内容寻址的图片缓存
+    键 = 最终 HTML（已含样式、页码、内容和字体声明）+ 视口尺寸 + 输出格式与质量 + 本地字体文件指纹，
+    命中时硬链接（跨设备则复制）到输出路径；按最近使用时间（mtime）做 LRU 淘汰
+    """
+    
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stored_bytes = 0
+    
+    def key_for(self, html_content: str, width: int, height: int, variant: str = "") -> str:
+        digest = hashlib.sha256()
+        digest.update(html_content.encode('utf-8'))
+        digest.update(f"|{width}x{height}|{variant}|{font_fingerprint()}".encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _path(self, key: str, output_path: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}{Path(output_path).suffix}"
+    
+    def fetch(self, key: str, output_path: str) -> bool:
+        """命中则把缓存图片放到 output_path 并返回 True"""
+        cached = self._path(key, output_path)
+        try:
+            if os.path.exists(output_path):
+                if os.path.samefile(cached, output_path):
+                    os.utime(cached)
+                    self.hits += 1
+                    return True
+                os.remove(output_path)
+            try:
+                os.link(cached, output_path)
+            except OSError:
+                shutil.copyfile(cached, output_path)
+            os.utime(cached)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+    
+    def store(self, key: str, output_path: str):
+        """把刚渲染的图片存入缓存（先写临时文件再原子替换，多进程并发安全）"""
+        cached = self._path(key, output_path)
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")
+        shutil.copyfile(output_path, tmp_path)
+        os.replace(tmp_path, cached)
+        self.stored_bytes += os.path.getsize(cached)
+    
+    def maybe_prune(self):
+        """到了扫描时机（见 prune_due）或新写入量够多时才 prune"""
+        if not self.cache_dir.exists():
+            return
+        if prune_due(self.cache_dir) or self.stored_bytes >= self.max_bytes * CACHE_PRUNE_FRACTION:
+            self.prune()
+    
+    def prune(self):
+        """总大小超过上限时，按最近使用时间从旧到新淘汰"""
+        self.stored_bytes = 0
+        prune_cache_dir(self.cache_dir, self.max_bytes, IMAGE_FORMATS.values())
+
+
+def image_format_for(output_path: str) -> str:
+    """按扩展名确定截图格式"""
+    suffix = Path(output_path).suffix.lower()
+    if suffix in ('.jpg', '.jpeg'):
+        return "jpeg"
+    if suffix == '.webp':
+        return "webp"
+    return "png"
+
+
+async def capture_screenshot(page: Page, output_path: str, width: int = CARD_WIDTH,
+                             height: int = CARD_HEIGHT, quality: int = None, top: int = 0):
+    """截取从 top 开始的固定尺寸区域；Playwright 不支持 webp，改走 CDP 的 Page.captureScreenshot"""
+    image_format = image_format_for(output_path)
+    clip = {'x': 0, 'y': top, 'width': width, 'height': height}
+    if image_format != "png" and quality is None:
+        quality = DEFAULT_QUALITY
+    
+    if image_format == "webp":
+        client = await page.context.new_cdp_session(page)
+        try:
+            result = await client.send('Page.captureScreenshot', {
+                'format': 'webp',
+                'quality': quality,
+                'clip': {**clip, 'scale': 1},
+            })
+        finally:
+            await client.detach()
+        Path(output_path).write_bytes(base64.b64decode(result['data']))
+    elif image_format == "jpeg":
+        await page.screenshot(path=output_path, clip=clip, type='jpeg', quality=quality)
+    else:
+        await page.screenshot(path=output_path, clip=clip, type='png')
+
+
+def _optimize_png(path: str) -> Tuple[str, int, int]:
+    """无损重压缩单张 PNG（worker 进程中执行），仅在变小时替换原文件"""
+    from PIL import Image
+    before = os.path.getsize(path)
+    tmp_path = f"{path}.opt.tmp"
+    with Image.open(path) as img:
+        img.save(tmp_path, format='PNG', optimize=True)
+    after = os.path.getsize(tmp_path)
+    if after < before:
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+        after = before
+    return path, before, after
+
+
+async def optimize_pngs(paths: List[str], workers: int = None) -> List[dict]:
+    """在进程池中无损重压缩 PNG，打印并返回每张节省的字节数（需要 Pillow）"""
+    paths = [path for path in paths if image_format_for(path) == "png"]
+    if not paths:
+        return []
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        progress("  ⚠️ 未安装 Pillow，跳过 PNG 压缩（pip install pillow）")
+        return []
+    
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = await asyncio.gather(*(loop.run_in_executor(pool, _optimize_png, path) for path in paths))
+    
+    report = []
+    for path, before, after in results:
+        saved = before - after
+        progress(f"  🗜️ {os.path.basename(path)}: {before / 1024:.0f}KB → {after / 1024:.0f}KB "
+                 f"(-{saved / 1024:.0f}KB, {saved / before:.0%})")
+        report.append({"file": path, "bytes_before": before, "bytes_after": after, "bytes_saved": saved})
+    total_saved = sum(item["bytes_saved"] for item in report)
+    progress(f"  🗜️ PNG 压缩共节省 {total_saved / 1024:.0f}KB")
+    return report
+
+
+async def render_html_to_image(html_content: str, output_path: str,
+                                width: int = CARD_WIDTH, height: int = CARD_HEIGHT,
+                                page: Page = None, cache: RenderCache = None, quality: int = None):
+    """
+    使用 Playwright 将 HTML 渲染为图片（传入 page 时复用已有页面，不再启动浏览器）
+    图片格式由 output_path 扩展名决定（.png/.jpg/.webp），quality 仅对 jpeg/webp 生效
+    传入 cache 时，相同 HTML 的图片直接从缓存取出，不再渲染
+    """
+    if cache is not None:
+        cache_key = cache.key_for(html_content, width, height,
+                                  f"{image_format_for(output_path)}:{quality}")
+        if cache.fetch(cache_key, output_path):
+            metrics_count("cache_hits")
+            progress(f"  ♻️ 命中缓存: {output_path}")
+            return
+        metrics_count("cache_misses")
+    
+    if page is None:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch()
+            try:
+                page = await new_render_page(browser, width, height)
+                await render_html_to_image(html_content, output_path, width, height, page, cache, quality)
+            finally:
+                await browser.close()
+        return
+    
+    await set_page_content(page, html_content)
+    await capture_screenshot(page, output_path, width, height, quality)
+    
+    if cache is not None:
+        cache.store(cache_key, output_path)
+    
+    progress(f"  ✅ 已生成: {output_path}")
+
+
+async def split_overflow_linear(page: Page, lines: List[str], style_key: str) -> List[str]:
+    """逐行累加并测量，超出时另起一张卡片（每行一次渲染）"""
+    sub_contents = []
+    sub_lines = []
+    
+    for line in lines:
+        test_lines = sub_lines + [line]
+        test_html = generate_card_html('\n'.join(test_lines), 1, 1, style_key)
+        test_height = await measure_content_height(page, test_html)
+        
+        if test_height > MAX_INNER_HEIGHT and sub_lines:
+            sub_contents.append('\n'.join(sub_lines))
+            sub_lines = [line]
+        else:
+            sub_lines = test_lines
+    
+    if sub_lines:
+        sub_contents.append('\n'.join(sub_lines))
+    
+    return sub_contents
+
+
+async def split_overflow_bisect(page: Page, lines: List[str], style_key: str) -> List[str]:
+    """
+    二分查找每张卡片可容纳的最多行数
+    与 split_overflow_linear 的贪心结果一致（高度随行数单调不减时），
+    但每张卡片只需 O(log 行数) 次测量
+    """
+    sub_contents = []
+    start = 0
+    
+    while start < len(lines):
+        # 至少放一行，即使单行本身就超出（与逐行模式行为一致）
+        lo, hi = 1, len(lines) - start
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            test_html = generate_card_html('\n'.join(lines[start:start + mid]), 1, 1, style_key)
+            if await measure_content_height(page, test_html) > MAX_INNER_HEIGHT:
+                hi = mid - 1
+            else:
+                lo = mid
         
+        sub_contents.append('\n'.join(lines[start:start + lo]))
+        start += lo
+    
+    return sub_contents
+
+
+async def process_and_render_cards(card_contents: List[str], output_dir: str,
+                                   style_key: str, page: Page = None,
+                                   split_mode: str = "bisect") -> List[str]:
+    """
+    处理卡片内容，检测高度并自动分页，然后渲染
+    返回最终生成的所有卡片文件路径
+    传入 page 时复用调用方的页面，否则自行启动浏览器
+    split_mode: 溢出块的按行拆分方式，见 SPLIT_MODES
+    """
+    if page is None:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch()
+            try:
+                page = await new_render_page(browser)
+                return await process_and_render_cards(card_contents, output_dir, style_key, page,
+                                                      split_mode)
+            finally:
+                await browser.close()
+    
+    all_cards = []
+    
+    for content in card_contents:
+        # 预估内容高度
+        estimated_height = estimate_content_height(content, style_key)
+        
+        # 如果预估高度超过安全高度，尝试拆分
+        if estimated_height > SAFE_HEIGHT:
+            with metrics_phase("split"):
+                split_contents = smart_split_content(content, SAFE_HEIGHT, style_key)
+            metrics_count("re_splits", len(split_contents) - 1)
+        else:
+            split_contents = [content]
+        
+        # 验证每个拆分后的内容
+        for split_content in split_contents:
+            # 生成临时 HTML 测量
+            temp_html = generate_card_html(split_content, 1, 1, style_key)
+            actual_height = await measure_content_height(page, temp_html)
+            
+            # 如果仍然超出，进一步按行拆分
+            if actual_height > MAX_INNER_HEIGHT:
+                lines = split_content.split('\n')
+                if split_mode == "linear":
+                    sub_contents = await split_overflow_linear(page, lines, style_key)
+                else:
+                    sub_contents = await split_overflow_bisect(page, lines, style_key)
+                metrics_count("re_splits", len(sub_contents) - 1)
+                all_cards.extend(sub_contents)
+            else:
+                all_cards.append(split_content)
+    
+    return all_cards
+
+
+# 浏览器内分页：整段内容只布局一次，读出顶层块的几何信息（含折叠后的外边距），
+# 装箱由 Python 端 paginate_optimal 完成。
+# 单个块超出一页时，按列表项 / 段落行 / 代码行 / 表格行拆分后逐片试排，直接给出整卡片段。
+# 返回 {available, items}：items 按顺序为 {html, top, bottom, keep}（普通块，标题 keep 为真）
+# 或 {pieces}（超高块拆出的整卡 HTML 片段）。
+DOM_PAGINATE_JS = """(limit) => {
+    const content = document.querySelector('.card-content');
+    const inner = document.querySelector('.card-inner');
+    const px = v => parseFloat(v) || 0;
+    const innerStyle = getComputedStyle(inner);
+    const available = limit - px(innerStyle.paddingTop) - px(innerStyle.paddingBottom);
+
+    // 子元素的外边距可能穿透父元素折叠出来（如 div.codehilite > pre），取折叠后的有效值
+    const collapsedMargin = (el, side) => {
+        const cs = getComputedStyle(el);
+        let m = px(cs['margin' + side]);
+        if (px(cs['padding' + side]) === 0 && px(cs['border' + side + 'Width']) === 0) {
+            const child = side === 'Top' ? el.firstElementChild : el.lastElementChild;
+            if (child && ['block', 'list-item'].includes(getComputedStyle(child).display)) {
+                m = Math.max(m, collapsedMargin(child, side));
+            }
+        }
+        return m;
+    };
+
+    const blocks = [...content.children].map(el => ({
+        el,
+        html: el.outerHTML,
+        top: el.offsetTop - collapsedMargin(el, 'Top'),
+        bottom: el.offsetTop + el.offsetHeight + collapsedMargin(el, 'Bottom'),
+    }));
+    if (blocks.length === 0) return {available, items: [{pieces: [content.innerHTML]}]};
+
+    // 把超高的块拆成若干原子，wrap(原子片段, 起始下标) 还原成可独立渲染的 HTML
+    const splitBlock = (block) => {
+        const chain = [];
+        let host = block;
+        while (host.tagName === 'DIV' && host.children.length === 1) {
+            chain.push(host);
+            host = host.firstElementChild;
+        }
+        let atoms, build;
+        const tag = host.tagName;
+        if (tag === 'UL' || tag === 'OL' || tag === 'BLOCKQUOTE') {
+            atoms = [...host.children].map(c => c.outerHTML);
+            build = (part, start) => {
+                const shell = host.cloneNode(false);
+                if (tag === 'OL') shell.setAttribute('start', (host.start || 1) + start);
+                shell.innerHTML = part.join('');
+                return shell;
+            };
+        } else if (tag === 'P') {
+            atoms = host.innerHTML.split(/<br\\s*\\/?>/i);
+            build = (part) => {
+                const shell = host.cloneNode(false);
+                shell.innerHTML = part.join('<br>');
+                return shell;
+            };
+        } else if (tag === 'PRE') {
+            const code = host.querySelector('code');
+            atoms = (code || host).textContent.replace(/\\n$/, '').split('\\n');
+            build = (part) => {
+                const shell = host.cloneNode(false);
+                const target = code ? shell.appendChild(code.cloneNode(false)) : shell;
+                target.textContent = part.join('\\n');
+                return shell;
+            };
+        } else if (tag === 'TABLE' && host.tBodies.length) {
+            atoms = [...host.tBodies[0].rows].map(r => r.outerHTML);
+            build = (part) => {
+                const shell = host.cloneNode(false);
+                if (host.tHead) shell.appendChild(host.tHead.cloneNode(true));
+                shell.appendChild(document.createElement('tbody')).innerHTML = part.join('');
+                return shell;
+            };
+        } else {
+            return null;
+        }
+        return {
+            atoms,
+            wrap: (part, start) => {
+                let node = build(part, start);
+                for (let i = chain.length - 1; i >= 0; i--) {
+                    const shell = chain[i].cloneNode(false);
+                    shell.appendChild(node);
+                    node = shell;
+                }
+                return node.outerHTML;
+            },
+        };
+    };
+
+    const fits = (html) => {
+        content.innerHTML = html;
+        return inner.scrollHeight <= limit;
+    };
+
+    // 先只读几何信息（一次布局），超高块的试排放在最后，避免读写交错触发多次重排
+    const items = blocks.map(b => b.bottom - b.top > available
+        ? {oversized: b}
+        : {html: b.html, top: b.top, bottom: b.bottom, keep: /^H[1-6]$/.test(b.el.tagName)});
+
+    // 超高块逐片试排，每张卡片放尽可能多的原子（至少一个）
+    for (const item of items) {
+        if (!item.oversized) continue;
+        const block = item.oversized;
+        delete item.oversized;
+        const split = splitBlock(block.el);
+        if (!split || split.atoms.length < 2) {
+            item.pieces = [block.html];
+            continue;
+        }
+        item.pieces = [];
+        let from = 0;
+        while (from < split.atoms.length) {
+            let to = from + 1;
+            while (to < split.atoms.length && fits(split.wrap(split.atoms.slice(from, to + 1), from))) to++;
+            item.pieces.push(split.wrap(split.atoms.slice(from, to), from));
+            from = to;
+        }
+    }
+    return {available, items};
+}"""
+
+
+async def paginate_content_in_dom(page: Page, html_fragment: str, style_key: str) -> List[str]:
+    """
+    在卡片布局中整段渲染一次内容（已转换好的 HTML 片段），由浏览器一次性计算分页
+    普通块按几何信息用 paginate_optimal 装箱（不增加卡片时标题不与下一块拆开），超高块的拆分结果原样接入
+    返回每张卡片的 HTML 片段
+    """
+    metrics_count("measurements")
+    with metrics_phase("measure"):
+        await set_page_content(page, build_card_html(html_fragment, 1, 1, style_key))
+        layout = await page.evaluate(DOM_PAGINATE_JS, MAX_INNER_HEIGHT)
+    
+    cards = []
+    flow = []
+    
+    def flush_flow():
+        for start, end in paginate_optimal(len(flow), lambda i, j: flow[j]["bottom"] - flow[i]["top"],
+                                           layout["available"], [item["keep"] for item in flow]):
+            cards.append('\n'.join(item["html"] for item in flow[start:end]))
+        flow.clear()
+    
+    for item in layout["items"]:
+        if "pieces" in item:
+            flush_flow()
+            cards.extend(item["pieces"])
+        else:
+            flow.append(item)
+    flush_flow()
+    return cards
+
+
+async def paginate_cards(body: str, style_key: str, page: Page,
+                         paginate_mode: str = "dom", split_mode: str = "bisect") -> List[str]:
+    """
+    对正文分页，返回每张卡片 .card-content 内的 HTML 片段
+    paginate_mode: 见 PAGINATE_MODES；split_mode 仅对 estimate 模式生效
+    dom 模式下正文只解析一次（parse_note_blocks），卡片由块的 HTML 片段拼接而成
+    """
+    if paginate_mode == "dom":
+        fragments = []
+        with metrics_phase("parse"):
+            chunks = parse_note_blocks(body, style_key)
+        for blocks in chunks:
+            chunk_html = '\n'.join(block["html"] for block in blocks)
+            chunk_fragments = await paginate_content_in_dom(page, chunk_html, style_key)
+            metrics_count("re_splits", len(chunk_fragments) - 1)
+            fragments.extend(chunk_fragments)
+        return fragments
+    
+    style = STYLES.get(style_key, STYLES["purple"])
+    card_contents = split_content_by_separator(body)
+    cards = await process_and_render_cards(card_contents, None, style_key, page, split_mode)
+    return [convert_markdown_to_html(card, style) for card in cards]
+
+
+async def render_jobs(browser, page: Page, jobs: List[Tuple[str, str, str]], concurrency: int = 1,
+                      cache: RenderCache = None, quality: int = None,
+                      on_image: Callable[[int, str], None] = None):
+    """
+    渲染 (名称, HTML, 输出路径) 列表
+    concurrency > 1 时在同一浏览器内开页面池并行截图，输出文件名与顺序无关
+    on_image: 可选，每张图片写完即调用 on_image(任务下标, 输出路径)（并行时完成顺序不定）
+    """
+    pool_size = max(1, min(concurrency, len(jobs)))
+    extra_pages = [await new_render_page(browser) for _ in range(pool_size - 1)]
+    pool: asyncio.Queue = asyncio.Queue()
+    for pool_page in [page] + extra_pages:
+        pool.put_nowait(pool_page)
+    
+    async def run(index: int, label: str, html: str, output_path: str):
+        pool_page = await pool.get()
+        try:
+            progress(f"  📷 生成{label}...")
+            await render_html_to_image(html, output_path, page=pool_page, cache=cache, quality=quality)
         finally:
-            await browser.close()
+            pool.put_nowait(pool_page)
+        if on_image is not None:
+            on_image(index, output_path)
+    
+    try:
+        await asyncio.gather(*(run(index, *job) for index, job in enumerate(jobs)))
+    finally:
+        for extra_page in extra_pages:
+            await extra_page.close()
+
+
+# 叠排渲染：每张卡片（含封面）放进一个 1080x1440 的 iframe，纵向排在同一文档里；
+# iframe 的视口与单卡片页面相同，布局和像素与逐张渲染一致。
+# 载入完成后等每个 iframe 的图片与字体就绪
+STACK_READY_JS = """async () => {
+    await Promise.all([...document.querySelectorAll('iframe')].map(frame => {
+        const doc = frame.contentDocument;
+        doc.body.getBoundingClientRect();
+        return doc.fonts.ready;
+    }));
+    return true;
+}"""
+
+
+def build_stacked_html(documents: List[str]) -> str:
+    """把多份完整的卡片/封面 HTML 纵向叠排到一个文档中（每份一个 iframe）"""
+    frames = '\n'.join(
+        f'<iframe srcdoc="{escape_html(document)}" width="{CARD_WIDTH}" height="{CARD_HEIGHT}"></iframe>'
+        for document in documents
+    )
+    return f'''<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <style>
+        * {{ margin: 0; padding: 0; }}
+        body {{ width: {CARD_WIDTH}px; overflow: hidden; }}
+        iframe {{ display: block; border: 0; width: {CARD_WIDTH}px; height: {CARD_HEIGHT}px; }}
+    </style>
+</head>
+<body>
+{frames}
+</body>
+</html>'''
+
+
+async def render_jobs_stacked(page: Page, jobs: List[Tuple[str, str, str]], cache: RenderCache = None,
+                              quality: int = None, on_image: Callable[[int, str], None] = None):
+    """
+    叠排模式渲染 (名称, HTML, 输出路径) 列表：每 STACK_MAX_CARDS 张载入一次，按区域逐张截图
+    命中缓存的任务不进叠排文档；on_image 同 render_jobs
+    """
+    pending = []
+    for index, (label, html_content, output_path) in enumerate(jobs):
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.key_for(html_content, CARD_WIDTH, CARD_HEIGHT,
+                                      f"{image_format_for(output_path)}:{quality}")
+            if cache.fetch(cache_key, output_path):
+                metrics_count("cache_hits")
+                progress(f"  ♻️ 命中缓存: {output_path}")
+                if on_image is not None:
+                    on_image(index, output_path)
+                continue
+            metrics_count("cache_misses")
+        pending.append((index, label, html_content, output_path, cache_key))
+    
+    if not pending:
+        return
+    
+    # 视口拉高到整组卡片，所有 iframe 都在可视区域内，截图时无需滚动
+    _loaded_shells.pop(page, None)
+    try:
+        for start in range(0, len(pending), STACK_MAX_CARDS):
+            group = pending[start:start + STACK_MAX_CARDS]
+            await page.set_viewport_size({'width': CARD_WIDTH, 'height': CARD_HEIGHT * len(group)})
+            metrics_count("full_loads")
+            await page.set_content(build_stacked_html([job[2] for job in group]), wait_until='load')
+            await page.evaluate(STACK_READY_JS)
+            
+            for slot, (index, label, _, output_path, cache_key) in enumerate(group):
+                progress(f"  📷 生成{label}...")
+                await capture_screenshot(page, output_path, CARD_WIDTH, CARD_HEIGHT, quality,
+                                         top=slot * CARD_HEIGHT)
+                if cache_key is not None:
+                    cache.store(cache_key, output_path)
+                progress(f"  ✅ 已生成: {output_path}")
+                if on_image is not None:
+                    on_image(index, output_path)
+    finally:
+        await page.set_viewport_size({'width': CARD_WIDTH, 'height': CARD_HEIGHT})
+
+
+# ─── Pillow 快速渲染 ───
+
+# 卡片几何（与 build_card_html 的样式一致）：card-container padding 50，card-inner padding 60
+RASTER_CONTAINER_PADDING = 50
+RASTER_INNER_PADDING = 60
+RASTER_CONTENT_LEFT = RASTER_CONTAINER_PADDING + RASTER_INNER_PADDING
+RASTER_CONTENT_WIDTH = CARD_WIDTH - 2 * RASTER_CONTENT_LEFT
+
+# 文本块样式：(字号, 字重, 行高倍数, 上外边距, 下外边距, 配色键)
+RASTER_TEXT_BLOCKS = {
+    "p": (42, 400, 1.7, 0, 35, "text_color"),
+    "h1": (72, 700, 1.3, 0, 40, "heading_color"),
+    "h2": (56, 600, 1.4, 50, 25, "h2_color"),
+    "h3": (48, 600, 1.7, 40, 20, "h3_color"),
+    "li": (42, 400, 1.6, 0, 20, "text_color"),
+}
+RASTER_LIST_MARGIN = 30
+RASTER_LIST_INDENT = 60
+RASTER_STRONG_WEIGHT = 700
+
+# 行首禁则（不能出现在行首，跟随前一个字）与行尾禁则（不能出现在行尾，跟随后一个字）
+NO_LINE_START = "，。！？、；：）》」』】〉”’…—～·,.!?;:)]}%"
+NO_LINE_END = "（《「『【〈“‘([{"
+
+
+def raster_available() -> bool:
+    """Pillow 已安装且本地字体可被 Pillow 载入时才能快速渲染（字形与浏览器使用同一字体）"""
+    if not use_local_fonts():
+        return False
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return _raster_font(400, 42) is not None
+
+
+def match_font_weight(available: List[int], desired: int) -> int:
+    """CSS 字重匹配：400/500 先互相找，>500 先找更粗的，<400 先找更细的"""
+    heavier = sorted(w for w in available if w > desired)
+    lighter = sorted((w for w in available if w < desired), reverse=True)
+    if desired in available:
+        return desired
+    if desired == 400 and 500 in available:
+        return 500
+    if desired == 500 and 400 in available:
+        return 400
+    if desired > 500:
+        return (heavier or lighter)[0]
+    return (lighter or heavier)[0]
+
+
+@lru_cache(maxsize=None)
+def _raster_font(weight: int, size: int):
+    """从 assets/fonts 取与字重最接近的字体（可变字体按 wght 轴设置）；无法载入时返回 None"""
+    from PIL import ImageFont
+    fonts = discover_local_fonts()
+    static = {int(w): path for path, w in fonts if w.isdigit()}
+    variable = [path for path, w in fonts if not w.isdigit()]
+    try:
+        if static:
+            path = static[match_font_weight(sorted(static), weight)]
+            return ImageFont.truetype(str(path), size)
+        if variable:
+            font = ImageFont.truetype(str(variable[0]), size)
+            try:
+                font.set_variation_by_axes([weight])
+            except (OSError, AttributeError):
+                pass
+            return font
+    except OSError:
+        pass
+    return None
+
+
+@lru_cache(maxsize=None)
+def _raster_notdef(weight: int) -> Tuple[Tuple[int, int], bytes]:
+    """字体中缺字时绘出的 .notdef 字形"""
+    mask = _raster_font(weight, 32).getmask('\U0010FFFD')
+    return mask.size, bytes(mask)
+
+
+def _is_emoji(ch: str) -> bool:
+    code = ord(ch)
+    return (code >= 0x1F000 or 0x2600 <= code <= 0x27BF or 0x2B00 <= code <= 0x2BFF
+            or ch in '\u200d\u20e3\ufe0e\ufe0f')
+
+
+@lru_cache(maxsize=8192)
+def raster_has_glyph(ch: str, weight: int = 400) -> bool:
+    """本地字体能否绘制该字符；emoji 在浏览器中走彩色 emoji 字体，这里一律视为不支持"""
+    if ch.isspace():
+        return True
+    if _is_emoji(ch):
+        return False
+    mask = _raster_font(weight, 32).getmask(ch)
+    return (mask.size, bytes(mask)) != _raster_notdef(weight)
+
+
+def parse_css_color(value: str) -> Tuple[int, int, int, int]:
+    """#rgb / #rrggbb / rgba(r, g, b, a) → RGBA"""
+    from PIL import ImageColor
+    match = re.fullmatch(r'rgba?\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*(?:,\s*([\d.]+)\s*)?\)', value.strip())
+    if match:
+        alpha = float(match.group(4)) if match.group(4) is not None else 1.0
+        return (int(match.group(1)), int(match.group(2)), int(match.group(3)), round(alpha * 255))
+    return ImageColor.getrgb(value.strip())[:3] + (255,)
+
+
+def linear_gradient_image(css: str, width: int, height: int):
+    """按 CSS linear-gradient(<角度>deg, <颜色> 0%, <颜色> 100%) 生成渐变图；其他写法返回 None"""
+    from PIL import Image
+    match = re.fullmatch(r'linear-gradient\(\s*(-?[\d.]+)deg\s*,\s*(#[0-9a-fA-F]{3,6})\s+0%\s*,'
+                         r'\s*(#[0-9a-fA-F]{3,6})\s+100%\s*\)', css.strip())
+    if not match:
+        return None
+    angle = math.radians(float(match.group(1)))
+    sin, cos = math.sin(angle), math.cos(angle)
+    length = abs(width * sin) + abs(height * cos)
+    # 渐变位置 t = ((x - w/2)·sin - (y - h/2)·cos) / length + 0.5，
+    # 用仿射变换从 linear_gradient('L')（第 n 行的值为 n）取第 255·t 行
+    offset = 0.5 - (width / 2 * sin - height / 2 * cos) / length
+    mask = Image.linear_gradient('L').transform(
+        (width, height), Image.Transform.AFFINE,
+        (0, 0, 128, 255 * sin / length, -255 * cos / length, 255 * offset),
+        resample=Image.Resampling.BILINEAR,
+    )
+    start = Image.new('RGB', (width, height), parse_css_color(match.group(2))[:3])
+    end = Image.new('RGB', (width, height), parse_css_color(match.group(3))[:3])
+    return Image.composite(end, start, mask)
+
+
+class _RasterBlockParser(HTMLParser):
+    """
+    把卡片 HTML 片段解析为可用 Pillow 绘制的块：
+    p/h1/h2/h3 与 ul/ol（列表项内只有文本和加粗）为 {'type', 'runs': [(文本, 加粗)]}，
+    分割线 {'type': 'hr'}，标签 {'type': 'tags', 'tags': [runs]}；出现其他元素时 supported=False
+    """
+
+    TEXT_TAGS = {'p', 'h1', 'h2', 'h3'}
+    VOID_TAGS = {'br', 'hr', 'img', 'input', 'wbr'}
+
+    def __init__(self):
+        super().__init__()
+        self.blocks: List[dict] = []
+        self.supported = True
+        self.stack: List[str] = []
+        self.runs = None
+        self.bold = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        parent = self.stack[-1] if self.stack else None
+        if tag in self.VOID_TAGS:
+            if tag == 'br' and self.runs is not None:
+                self.runs.append(('\n', bool(self.bold)))
+            elif tag == 'hr' and parent is None:
+                self.blocks.append({"type": "hr"})
+            else:
+                self.supported = False
+            return
+
+        if tag in self.TEXT_TAGS and parent is None:
+            self.runs = []
+            self.blocks.append({"type": tag, "runs": self.runs})
+        elif tag in ('ul', 'ol') and parent is None:
+            self.blocks.append({"type": tag, "items": [], "start": int(attrs.get('start') or 1)})
+        elif tag == 'li' and parent in ('ul', 'ol'):
+            self.runs = []
+            self.blocks[-1]["items"].append(self.runs)
+        elif tag in ('strong', 'b') and self.runs is not None:
+            self.bold += 1
+        elif tag == 'div' and parent is None and attrs.get('class') == 'tags-container':
+            self.blocks.append({"type": "tags", "tags": []})
+        elif tag == 'span' and parent == 'div' and attrs.get('class') == 'tag':
+            self.runs = []
+            self.blocks[-1]["tags"].append(self.runs)
+        else:
+            self.supported = False
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.VOID_TAGS or not self.stack:
+            return
+        self.stack.pop()
+        if tag in ('strong', 'b'):
+            self.bold = max(0, self.bold - 1)
+        elif tag in self.TEXT_TAGS or tag in ('li', 'span'):
+            self.runs = None
+
+    def handle_data(self, data):
+        if self.runs is not None:
+            # 折叠空白（与 HTML 一致），<br> 已单独记为 '\n'
+            self.runs.append((re.sub(r'\s+', ' ', data), bool(self.bold)))
+        elif data.strip():
+            self.supported = False
+
+
+def parse_raster_blocks(html_fragment: str) -> Optional[List[dict]]:
+    """卡片片段只含支持的元素时返回块列表，否则返回 None"""
+    parser = _RasterBlockParser()
+    parser.feed(html_fragment)
+    parser.close()
+    return parser.blocks if parser.supported else None
+
+
+def _runs_to_chars(runs: List[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
+    """[(文本, 加粗)] → [(字符, 加粗)]，去掉行首和重复的空格"""
+    chars = []
+    for text, bold in runs:
+        for ch in text:
+            if ch == ' ' and (not chars or chars[-1][0] in ' \n'):
+                continue
+            chars.append((ch, bold))
+    return chars
+
+
+def _is_word_char(ch: str) -> bool:
+    """西文单词内的字符（不可在其间换行）"""
+    return ch.isalnum() and ord(ch) < 0x2E80 or ch in "-_/'@#&"
+
+
+def break_lines(chars: List[Tuple[str, bool]], max_width: float, measure,
+                break_all: bool = False) -> List[List[Tuple[str, bool]]]:
+    """
+    CJK 感知的贪心断行：汉字之间可断，西文单词整体换行，遵守行首/行尾禁则
+    measure([(字符, 加粗)]) 返回片段宽度；break_all 时任意字符间可断（同 CSS word-break: break-all）
+    """
+    tokens: List[Optional[List[Tuple[str, bool]]]] = []
+    for ch, bold in chars:
+        if ch == '\n':
+            tokens.append(None)
+            continue
+        prev = tokens[-1] if tokens else None
+        joinable = prev is not None and ch != ' ' and prev[-1][0] != ' ' and (
+            ch in NO_LINE_START or prev[-1][0] in NO_LINE_END
+            or (not break_all and _is_word_char(ch) and _is_word_char(prev[-1][0]))
+        )
+        if joinable:
+            prev.append((ch, bold))
+        else:
+            tokens.append([(ch, bold)])
+
+    lines = [[]]
+    width = 0.0
+    for token in tokens:
+        if token is None:
+            lines.append([])
+            width = 0.0
+            continue
+        if token[0][0] == ' ' and not lines[-1]:
+            continue
+        token_width = measure(token)
+        if lines[-1] and width + token_width > max_width and token[0][0] != ' ':
+            lines.append([])
+            width = 0.0
+        lines[-1].extend(token)
+        width += token_width
+
+    for line in lines:
+        while line and line[-1][0] == ' ':
+            line.pop()
+    return lines
+
+
+def _line_segments(line: List[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
+    """把一行的字符按加粗与否合并为连续片段"""
+    segments = []
+    for ch, bold in line:
+        if segments and segments[-1][1] == bold:
+            segments[-1] = (segments[-1][0] + ch, bold)
+        else:
+            segments.append((ch, bold))
+    return segments
+
+
+class _RasterCanvas:
+    """记录绘制指令（先排版算高度，放得下再真正绘制）"""
+
+    def __init__(self):
+        self.ops = []
+
+    def text(self, x: float, baseline: float, text: str, weight: int, size: int, fill):
+        self.ops.append(("text", x, baseline, text, weight, size, fill))
+
+    def rect(self, box, fill, radius: float = 0):
+        self.ops.append(("rect", box, fill, radius))
+
+    def draw(self, image, dx: float, dy: float):
+        from PIL import ImageDraw
+        draw = ImageDraw.Draw(image, 'RGBA' if image.mode == 'RGB' else None)
+        for op in self.ops:
+            if op[0] == "text":
+                _, x, baseline, text, weight, size, fill = op
+                draw.text((x + dx, baseline + dy), text, font=_raster_font(weight, size), fill=fill, anchor='ls')
+            else:
+                _, (x0, y0, x1, y1), fill, radius = op
+                draw.rounded_rectangle((x0 + dx, y0 + dy, x1 + dx - 1, y1 + dy - 1), radius=radius, fill=fill)
+
+
+def _baseline_offset(weight: int, size: int, line_height: float) -> float:
+    """行框内基线位置：半行距 + ascent（同 CSS 行内排版）"""
+    ascent, descent = _raster_font(weight, size).getmetrics()
+    return (line_height - ascent - descent) / 2 + ascent
+
+
+def _layout_text(canvas: _RasterCanvas, chars, x: float, y: float, width: float, size: int,
+                 weight: int, line_height: float, fill, bold_fill, break_all: bool = False) -> float:
+    """排一段文字，返回占用的高度"""
+    def measure(piece):
+        return sum(_raster_font(RASTER_STRONG_WEIGHT if bold else weight, size).getlength(text)
+                   for text, bold in _line_segments(piece))
+
+    lines = break_lines(chars, width, measure, break_all)
+    baseline = _baseline_offset(weight, size, line_height)
+    for i, line in enumerate(lines):
+        cursor = x
+        for text, bold in _line_segments(line):
+            run_weight = RASTER_STRONG_WEIGHT if bold else weight
+            canvas.text(cursor, y + i * line_height + baseline, text, run_weight, size,
+                        bold_fill if bold else fill)
+            cursor += _raster_font(run_weight, size).getlength(text)
+    return len(lines) * line_height
+
+
+def _chars_drawable(chars, weight: int) -> bool:
+    return all(raster_has_glyph(ch, RASTER_STRONG_WEIGHT if bold else weight) for ch, bold in chars)
+
+
+def layout_raster_card(blocks: List[dict], style_key: str) -> Optional[Tuple[float, _RasterCanvas]]:
+    """按卡片样式排版，返回 (内容高度, 绘制指令)；有字体缺字时返回 None"""
+    style = STYLES.get(style_key, STYLES["purple"])
+    palette = card_palette(style_key)
+    colors = {key: parse_css_color(value) for key, value in palette.items()}
+    accent = parse_css_color(style['accent_color'])
+    canvas = _RasterCanvas()
+    y = 0.0
+    prev_margin = None
+
+    def advance(margin_top: float):
+        # 相邻块的上下外边距折叠
+        nonlocal y
+        y += margin_top if prev_margin is None else max(prev_margin, margin_top)
+
+    for block in blocks:
+        kind = block["type"]
+        if kind in ("p", "h1", "h2", "h3"):
+            size, weight, ratio, margin_top, margin_bottom, color_key = RASTER_TEXT_BLOCKS[kind]
+            chars = _runs_to_chars(block["runs"])
+            if not _chars_drawable(chars, weight):
+                return None
+            advance(margin_top)
+            y += _layout_text(canvas, chars, 0, y, RASTER_CONTENT_WIDTH, size, weight, size * ratio,
+                              colors[color_key], colors["heading_color"])
+            prev_margin = margin_bottom
+
+        elif kind in ("ul", "ol"):
+            size, weight, ratio, _, item_margin, color_key = RASTER_TEXT_BLOCKS["li"]
+            font = _raster_font(weight, size)
+            advance(RASTER_LIST_MARGIN)
+            for n, runs in enumerate(block["items"], block["start"]):
+                chars = _runs_to_chars(runs)
+                marker = "• " if kind == "ul" else f"{n}. "
+                if not _chars_drawable(chars + [(ch, False) for ch in marker], weight):
+                    return None
+                if n > block["start"]:
+                    y += item_margin
+                # 列表标记在内容左侧（list-style-position: outside）
+                canvas.text(RASTER_LIST_INDENT - font.getlength(marker), y + _baseline_offset(weight, size, size * ratio),
+                            marker, weight, size, colors[color_key])
+                y += _layout_text(canvas, chars, RASTER_LIST_INDENT, y, RASTER_CONTENT_WIDTH - RASTER_LIST_INDENT,
+                                  size, weight, size * ratio, colors[color_key], colors["heading_color"])
+            prev_margin = max(item_margin, RASTER_LIST_MARGIN) if block["items"] else RASTER_LIST_MARGIN
+
+        elif kind == "hr":
+            advance(50)
+            canvas.rect((0, y, RASTER_CONTENT_WIDTH, y + 2), colors["rule_color"])
+            y += 2
+            prev_margin = 50
+
+        elif kind == "tags":
+            # .tags-container: margin-top 50, border-top 2, padding-top 30；.tag: 34px/500，
+            # padding 12 28，margin 10 15 10 0，圆角 30，行高继承 1.7
+            size, weight, pad_x, pad_y, gap, margin_y = 34, 500, 28, 12, 15, 10
+            pill_height = size * 1.7 + 2 * pad_y
+            row_height = pill_height + 2 * margin_y
+            advance(50)
+            canvas.rect((0, y, RASTER_CONTENT_WIDTH, y + 2), colors["rule_color"])
+            y += 2 + 30
+            font = _raster_font(weight, size)
+            baseline = _baseline_offset(weight, size, size * 1.7)
+            x = 0.0
+            for runs in block["tags"]:
+                text = ''.join(ch for ch, _ in _runs_to_chars(runs)).strip()
+                if not _chars_drawable([(ch, False) for ch in text], weight):
+                    return None
+                pill_width = font.getlength(text) + 2 * pad_x
+                if x > 0 and x + pill_width > RASTER_CONTENT_WIDTH:
+                    x = 0.0
+                    y += row_height
+                top = y + margin_y
+                canvas.rect((x, top, x + pill_width, top + pill_height), accent, radius=30)
+                canvas.text(x + pad_x, top + pad_y + baseline, text, weight, size, (255, 255, 255, 255))
+                x += pill_width + gap
+            y += row_height
+            prev_margin = 0
+
+    return y + (prev_margin or 0), canvas
+
+
+def raster_card_image(html_fragment: str, page_number: int, total_pages: int, style_key: str):
+    """
+    用 Pillow 按 build_card_html 的模板绘制正文卡片（渐变背景、圆角内框、标签、页码）
+    含不支持的元素、缺字或内容超出一页时返回 None，由浏览器渲染
+    """
+    from PIL import Image, ImageFilter
+    blocks = parse_raster_blocks(html_fragment)
+    if not blocks:
+        return None
+    layout = layout_raster_card(blocks, style_key)
+    if layout is None or layout[0] + 2 * RASTER_INNER_PADDING > MAX_INNER_HEIGHT:
+        return None
+    content_height, canvas = layout
+
+    style = STYLES.get(style_key, STYLES["purple"])
+    image = linear_gradient_image(style['card_bg'], CARD_WIDTH, CARD_HEIGHT)
+    if image is None:
+        return None
+
+    # card-inner：box-shadow 0 8px 32px rgba(0,0,0,0.1) + 半透明圆角底
+    inner_box = (RASTER_CONTAINER_PADDING, RASTER_CONTAINER_PADDING,
+                 CARD_WIDTH - RASTER_CONTAINER_PADDING, CARD_HEIGHT - RASTER_CONTAINER_PADDING)
+    shadow = Image.new('L', image.size, 0)
+    shadow_canvas = _RasterCanvas()
+    shadow_canvas.rect(inner_box, 26, radius=20)
+    shadow_canvas.draw(shadow, 0, 8)
+    image.paste((0, 0, 0), mask=shadow.filter(ImageFilter.GaussianBlur(16)))
+
+    frame = _RasterCanvas()
+    frame.rect(inner_box, parse_css_color(card_palette(style_key)["card_bg"]), radius=20)
+    if total_pages > 1:
+        # .page-number: 36px/500，距右下各 80px
+        page_text = f"{page_number}/{total_pages}"
+        if not all(raster_has_glyph(ch, 500) for ch in page_text):
+            return None
+        font = _raster_font(500, 36)
+        ascent, descent = font.getmetrics()
+        frame.text(CARD_WIDTH - 80 - font.getlength(page_text), CARD_HEIGHT - 80 - descent,
+                   page_text, 500, 36, (255, 255, 255, 204))
+    frame.draw(image, 0, 0)
+    canvas.draw(image, RASTER_CONTENT_LEFT, RASTER_CONTENT_LEFT)
+    return image
+
+
+def raster_cover_image(metadata: dict, style_key: str):
+    """用 Pillow 按 generate_cover_html 的模板绘制封面；emoji 或缺字时返回 None"""
+    from PIL import Image
+    style = STYLES.get(style_key, STYLES["purple"])
+    palette = cover_palette(style_key)
+    emoji = metadata.get('emoji', '📝')
+    title = metadata.get('title', '标题')[:15]
+    subtitle = metadata.get('subtitle', '')[:15]
+    if not (all(raster_has_glyph(ch, 400) for ch in emoji) and all(raster_has_glyph(ch, 900) for ch in title)
+            and all(raster_has_glyph(ch, 350) for ch in subtitle)):
+        return None
+
+    image = linear_gradient_image(style['cover_bg'], CARD_WIDTH, CARD_HEIGHT)
+    if image is None:
+        return None
+
+    # .cover-inner: 950x1310，距左上 65，圆角 25，padding 80 85；纵向 flex：emoji / 标题(flex: 1) / 副标题(贴底)
+    left, top, inner_width, inner_height = 65, 65, 950, 1310
+    content_left, content_top = left + 85, top + 80
+    content_width, content_bottom = inner_width - 2 * 85, top + inner_height - 80
+    frame = _RasterCanvas()
+    frame.rect((left, top, left + inner_width, top + inner_height), parse_css_color(palette["inner_bg"]), radius=25)
+
+    y = content_top
+    if emoji:
+        y += _layout_text(frame, [(ch, False) for ch in emoji], content_left, y, content_width,
+                          180, 400, 180 * 1.2, parse_css_color(palette["text_color"]), None)
+    y += 50
+
+    subtitle_canvas = _RasterCanvas()
+    subtitle_height = 0.0
+    if subtitle:
+        subtitle_height = _layout_text(subtitle_canvas, [(ch, False) for ch in subtitle], 0, 0, content_width,
+                                       72, 350, 72 * 1.4, parse_css_color(palette["text_color"]), None)
+    subtitle_top = content_bottom - subtitle_height
+
+    # 标题：900 字重 130px，任意字符间可断行；文字用 180deg 渐变填充（background-clip: text）
+    title_canvas = _RasterCanvas()
+    _layout_text(title_canvas, [(ch, False) for ch in title], 0, 0, content_width,
+                 130, 900, 130 * 1.4, 255, None, break_all=True)
+    title_box = (content_width, max(1, round(subtitle_top - y)))
+    title_fill = linear_gradient_image(palette["title_gradient"], *title_box)
+    if title_fill is None:
+        return None
+    title_mask = Image.new('L', title_box, 0)
+    title_canvas.draw(title_mask, 0, 0)
+
+    frame.draw(image, 0, 0)
+    image.paste(title_fill, (content_left, round(y)), mask=title_mask)
+    subtitle_canvas.draw(image, content_left, subtitle_top)
+    return image
+
+
+def save_raster_image(image, output_path: str, quality: int = None):
+    """按输出扩展名保存 Pillow 图片（jpeg/webp 未指定质量时用 DEFAULT_QUALITY）"""
+    image_format = image_format_for(output_path)
+    if image_format == "png":
+        image.save(output_path, format='PNG')
+    else:
+        image.save(output_path, format=image_format.upper(), quality=quality or DEFAULT_QUALITY)
+
+
+def render_jobs_raster(jobs: List[Tuple[str, str, str]], sources: List[Optional[Callable]],
+                       quality: int = None, on_image: Callable[[int, str], None] = None) -> List[int]:
+    """
+    能快速渲染的任务直接用 Pillow 出图（sources[i]() 返回图片或 None），
+    返回仍需浏览器渲染的任务下标
+    """
+    remaining = []
+    for index, ((label, _, output_path), source) in enumerate(zip(jobs, sources)):
+        image = source() if source is not None else None
+        if image is None:
+            remaining.append(index)
+            continue
+        save_raster_image(image, output_path, quality)
+        metrics_count("raster_cards")
+        progress(f"  ⚡ 快速生成{label}: {output_path}")
+        if on_image is not None:
+            on_image(index, output_path)
+    return remaining
+
+
+async def render_markdown_to_cards(md_file: str, output_dir: str, style_key: str = "purple",
+                                   browser=None, split_mode: str = "bisect",
+                                   paginate_mode: str = "dom", concurrency: int = 1,
+                                   cache: RenderCache = None, image_format: str = "png",
+                                   quality: int = None, optimize_png: bool = False,
+                                   metrics: str = None, on_image: Callable[[int, str], None] = None,
+                                   render_mode: str = "pages", backend: str = "playwright",
+                                   fingerprints: Dict[str, str] = None, base_dir: str = None):
+    """
+    主渲染函数：将 Markdown 文件渲染为多张卡片图片
+    
+    browser: 可选，已启动的 Playwright Browser。批量调用时传入以复用同一个 Chromium，
+             不传则本次渲染内部启动一次，分页测量、封面和卡片共用同一个页面。
+    split_mode: 溢出块的按行拆分方式，见 SPLIT_MODES
+    paginate_mode: 分页引擎，见 PAGINATE_MODES
+    concurrency: 同时截图的页面数（封面和卡片在同一浏览器的页面池中并行渲染）
+    cache: 可选，RenderCache；HTML 未变的封面/卡片直接取缓存图片
+    image_format / quality: 输出格式（见 IMAGE_FORMATS）与 jpeg/webp 质量
+    optimize_png: 渲染后在进程池中无损重压缩 PNG 并报告节省的字节数
+    metrics: 可选，'-' 或文件路径；渲染结束后输出本篇的分阶段耗时与计数（见 RenderMetrics）
+    on_image: 可选，每张图片完成即调用 on_image(下标, 路径)，下标 0 起、封面在前；
+              开启 optimize_png 时在压缩完成后统一调用。按顺序逐张取用见 iter_card_images
+    render_mode: 截图方式，见 RENDER_MODES（stacked 时不使用 concurrency）
+    backend: 出图后端，见 RENDER_BACKENDS
+    fingerprints: 可选，输出路径 → 上次写出该图片时的指纹（见 job_fingerprint）；指纹未变且文件还在的
+                  封面/卡片不重新截图、文件不动（--watch 用）。渲染完成后原地更新为本次的全部图片
+    base_dir: 可选，笔记中相对图片路径的基准目录，默认为 md_file 所在目录
+    """
+    if metrics and _current_metrics.get() is None:
+        note_metrics = RenderMetrics(md_file, style_key, paginate_mode)
+        token = _current_metrics.set(note_metrics)
+        try:
+            return await render_markdown_to_cards(
+                md_file, output_dir, style_key, browser,
+                split_mode=split_mode, paginate_mode=paginate_mode, concurrency=concurrency,
+                cache=cache, image_format=image_format, quality=quality, optimize_png=optimize_png,
+                metrics=metrics, on_image=on_image, render_mode=render_mode, backend=backend,
+                fingerprints=fingerprints, base_dir=base_dir,
+            )
+        except Exception as e:
+            note_metrics.error = str(e)
+            raise
+        finally:
+            _current_metrics.reset(token)
+            note_metrics.emit(metrics)
+    
+    if browser is None:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch()
+            try:
+                return await render_markdown_to_cards(
+                    md_file, output_dir, style_key, browser,
+                    split_mode=split_mode, paginate_mode=paginate_mode, concurrency=concurrency,
+                    cache=cache, image_format=image_format, quality=quality, optimize_png=optimize_png,
+                    metrics=metrics, on_image=on_image, render_mode=render_mode, backend=backend,
+                    fingerprints=fingerprints, base_dir=base_dir,
+                )
+            finally:
+                await browser.close()
+    
+    progress(f"\n🎨 开始渲染: {md_file}")
+    progress(f"🎨 使用样式: {STYLES[style_key]['name']}")
+    
+    # 确保输出目录存在
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # 解析 Markdown 文件
+    with metrics_phase("parse"):
+        data = parse_markdown_file(md_file)
+        metadata = data['metadata']
+        body = resolve_note_images(data['body'], Path(base_dir) if base_dir else Path(md_file).parent)
+        
+        # 分割正文内容（基于用户手动分隔符）
+        card_contents = split_content_by_separator(body)
+    metrics_count("chunks", len(card_contents))
+    progress(f"  📄 检测到 {len(card_contents)} 个内容块")
+    
+    page = await new_render_page(browser)
+    
+    try:
+        # 处理内容，智能分页
+        progress("  🔍 分析内容高度并智能分页...")
+        with metrics_phase("paginate"):
+            processed_cards = await paginate_cards(body, style_key, page, paginate_mode, split_mode)
+        total_cards = len(processed_cards)
+        metrics_count("cards", total_cards)
+        progress(f"  📄 将生成 {total_cards} 张卡片")
+        
+        jobs = []
+        # 每个任务对应的 Pillow 快速渲染函数
+        raster_sources = []
+        
+        # 生成封面
+        if metadata.get('emoji') or metadata.get('title'):
+            cover_html = generate_cover_html(metadata, style_key)
+            cover_path = os.path.join(output_dir, f'cover{IMAGE_FORMATS[image_format]}')
+            jobs.append(("封面", cover_html, cover_path))
+            raster_sources.append(lambda: raster_cover_image(metadata, style_key))
+        
+        # 生成正文卡片
+        for i, content in enumerate(processed_cards, 1):
+            card_html = build_card_html(content, i, total_cards, style_key)
+            card_path = os.path.join(output_dir, f'card_{i}{IMAGE_FORMATS[image_format]}')
+            jobs.append((f"卡片 {i}/{total_cards}", card_html, card_path))
+            raster_sources.append(lambda content=content, i=i: raster_card_image(content, i, total_cards, style_key))
+        
+        # 监听模式：HTML 与上次相同且文件还在的图片保持原样
+        targets = list(range(len(jobs)))
+        if fingerprints is not None:
+            current = {output_path: job_fingerprint(html, quality) for _, html, output_path in jobs}
+            targets = [index for index, (_, _, output_path) in enumerate(jobs)
+                       if fingerprints.get(output_path) != current[output_path] or not os.path.exists(output_path)]
+            unchanged = len(jobs) - len(targets)
+            metrics_count("unchanged", unchanged)
+            if unchanged:
+                progress(f"  ⏭️ {unchanged} 张未变化，跳过")
+            # 本次要重写的图片先作废旧指纹，中途出错时下次会重新渲染
+            for index in targets:
+                fingerprints.pop(jobs[index][2], None)
+            if on_image is not None:
+                for index in sorted(set(range(len(jobs))) - set(targets)):
+                    on_image(index, jobs[index][2])
+        
+        # 压缩会替换文件，开启时等压缩完再交给调用方
+        notify = None if optimize_png else on_image
+        
+        def remap(indices: List[int]) -> Optional[Callable[[int, str], None]]:
+            """子任务列表的下标 → 全部任务中的下标"""
+            if notify is None:
+                return None
+            return lambda index, path: notify(indices[index], path)
+        
+        with metrics_phase("screenshot"):
+            if backend == "auto" and raster_available():
+                remaining = render_jobs_raster([jobs[index] for index in targets],
+                                               [raster_sources[index] for index in targets],
+                                               quality, remap(targets))
+                targets = [targets[index] for index in remaining]
+            browser_jobs = [jobs[index] for index in targets]
+            browser_notify = remap(targets)
+            if render_mode == "stacked":
+                if concurrency > 1:
+                    progress(f"  ⚠️ stacked 模式在一个页面内逐张截图，忽略 concurrency={concurrency}")
+                await render_jobs_stacked(page, browser_jobs, cache, quality, browser_notify)
+            else:
+                await render_jobs(browser, page, browser_jobs, concurrency, cache, quality, browser_notify)
+    
+    finally:
+        await page.close()
     
-    print(f"\n✨ 渲染完成！共生成 {total_cards} 张卡片，保存到: {output_dir}")
+    if optimize_png:
+        with metrics_phase("optimize"):
+            await optimize_pngs([output_path for _, _, output_path in jobs if fingerprints is None
+                                 or output_path not in fingerprints])
+        if on_image is not None:
+            for index, (_, _, output_path) in enumerate(jobs):
+                if fingerprints is None or output_path not in fingerprints:
+                    on_image(index, output_path)
+    
+    if fingerprints is not None:
+        fingerprints.clear()
+        fingerprints.update(current)
+    
+    if cache is not None:
+        cache.maybe_prune()
+    
+    progress(f"\n✨ 渲染完成！共生成 {total_cards} 张卡片，保存到: {output_dir}")
     return total_cards
 
 
+async def iter_card_images(md_file: str, output_dir: str, style_key: str = "purple",
+                           browser=None, **options) -> AsyncIterator[str]:
+    """
+    流式渲染：异步生成器，按顺序（封面在前，然后 card_1、card_2…）逐张产出图片路径
+    每张截图完成即可取到，调用方（如发布上传）可与剩余卡片的渲染同时进行
+    options 同 render_markdown_to_cards；开启 optimize_png 时压缩完成后才开始产出
+    
+        async for path in iter_card_images("note.md", "./output"):
+            await upload(path)
+    """
+    finished: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(render_markdown_to_cards(
+        md_file, output_dir, style_key, browser,
+        on_image=lambda index, path: finished.put_nowait((index, path)), **options
+    ))
+    task.add_done_callback(lambda _: finished.put_nowait(None))
+    
+    # 并行截图时完成顺序不定，先到的暂存，按下标顺序产出
+    ready: Dict[int, str] = {}
+    next_index = 0
+    try:
+        while True:
+            item = await finished.get()
+            if item is None:
+                break
+            ready[item[0]] = item[1]
+            while next_index in ready:
+                yield ready.pop(next_index)
+                next_index += 1
+        # 渲染出错时在这里抛出
+        await task
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+# ─── 批量渲染 ───
+
+# 批量模式下每个 worker 进程常驻的事件循环与浏览器
+_worker_loop = None
+_worker_playwright = None
+_worker_browser = None
+
+
+def collect_markdown_files(pattern: str) -> List[str]:
+    """目录则取其中所有 .md，否则按 glob 匹配"""
+    if os.path.isdir(pattern):
+        return sorted(str(p) for p in Path(pattern).glob('*.md'))
+    return sorted(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+
+
+def _batch_worker_init(font_mode: str):
+    """worker 进程初始化：启动一次浏览器，之后该进程处理的所有笔记共用"""
+    global FONT_MODE, _worker_loop, _worker_playwright, _worker_browser
+    FONT_MODE = font_mode
+    _worker_loop = asyncio.new_event_loop()
+    _worker_playwright = _worker_loop.run_until_complete(async_playwright().start())
+    _worker_browser = _worker_loop.run_until_complete(_worker_playwright.chromium.launch())
+    # worker 退出时 atexit 不会执行，改用 multiprocessing 的退出回调
+    Finalize(None, _batch_worker_shutdown, exitpriority=10)
+
+
+def _batch_worker_shutdown():
+    _worker_loop.run_until_complete(_worker_browser.close())
+    _worker_loop.run_until_complete(_worker_playwright.stop())
+    _worker_loop.close()
+
+
+def _batch_render_note(md_file: str, output_dir: str, style_key: str, options: dict) -> dict:
+    """在 worker 进程中渲染一篇笔记，返回该笔记的汇总记录"""
+    start = time.perf_counter()
+    record = {"file": md_file, "output_dir": output_dir}
+    try:
+        cards = _worker_loop.run_until_complete(
+            render_markdown_to_cards(md_file, output_dir, style_key, _worker_browser, **options)
+        )
+        record.update(ok=True, cards=cards)
+    except Exception as e:
+        record.update(ok=False, cards=0, error=str(e))
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def _batch_failure_record(md_file: str, output_dir: str, error: Exception) -> dict:
+    """worker 没能返回结果（进程崩溃、浏览器启动失败导致进程池失效等）的笔记汇总记录"""
+    return {"file": md_file, "output_dir": output_dir, "ok": False, "cards": 0,
+            "error": f"{type(error).__name__}: {error}", "seconds": 0.0}
+
+
+def render_batch(pattern: str, output_root: str, style_key: str = "purple",
+                 workers: int = 2, **options) -> dict:
+    """
+    批量渲染目录或 glob 匹配到的所有笔记
+    笔记分发到 workers 个进程，每个进程常驻一个浏览器；每篇输出到 output_root/<文件名>/，
+    并在 output_root/batch_summary.json 写入每篇的卡片数与耗时
+    worker 崩溃或浏览器启动失败时，受影响的笔记记为失败，汇总照常写出
+    """
+    md_files = collect_markdown_files(pattern)
+    if not md_files:
+        print(f"❌ 错误: 未找到 Markdown 文件 - {pattern}")
+        return {"ok": False, "notes": []}
+    
+    # 同名文件（来自不同目录）追加序号，避免输出目录冲突
+    targets = []
+    used_names = set()
+    for md_file in md_files:
+        name = Path(md_file).stem
+        candidate, n = name, 2
+        while candidate in used_names:
+            candidate, n = f"{name}_{n}", n + 1
+        used_names.add(candidate)
+        targets.append((md_file, os.path.join(output_root, candidate)))
+    
+    workers = max(1, min(workers, len(targets)))
+    print(f"\n📚 批量渲染 {len(targets)} 篇笔记，{workers} 个 worker")
+    os.makedirs(output_root, exist_ok=True)
+    
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_batch_worker_init,
+                             initargs=(FONT_MODE,)) as pool:
+        futures = []
+        for md_file, output_dir in targets:
+            try:
+                future = pool.submit(_batch_render_note, md_file, output_dir, style_key, options)
+            except BrokenProcessPool as e:
+                # 提交时进程池已失效（先启动的 worker 初始化失败）
+                future = Future()
+                future.set_exception(e)
+            futures.append(future)
+        notes = []
+        for (md_file, output_dir), future in zip(targets, futures):
+            try:
+                notes.append(future.result())
+            except Exception as e:
+                print(f"  ❌ {md_file}: {type(e).__name__}: {e}")
+                notes.append(_batch_failure_record(md_file, output_dir, e))
+    
+    failed = sum(1 for note in notes if not note["ok"])
+    summary = {
+        "ok": failed == 0,
+        "style": style_key,
+        "workers": workers,
+        "total_notes": len(notes),
+        "total_cards": sum(note["cards"] for note in notes),
+        "failed": failed,
+        "seconds": round(time.perf_counter() - start, 3),
+        "notes": notes,
+    }
+    summary_path = os.path.join(output_root, "batch_summary.json")
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    
+    print(f"\n✨ 批量渲染完成！{len(notes) - failed}/{len(notes)} 篇成功，"
+          f"共 {summary['total_cards']} 张卡片，汇总: {summary_path}")
+    return summary
+
+
+# ─── 渲染服务 ───
+
+def note_output_files(metadata: dict, output_dir: str, total_cards: int,
+                      image_format: str = "png") -> List[str]:
+    """一篇笔记渲染出的所有图片路径（封面在前）"""
+    ext = IMAGE_FORMATS[image_format]
+    files = []
+    if metadata.get('emoji') or metadata.get('title'):
+        files.append(os.path.join(output_dir, f'cover{ext}'))
+    files.extend(os.path.join(output_dir, f'card_{i}{ext}') for i in range(1, total_cards + 1))
+    return files
+
+
+async def serve(host: str = "127.0.0.1", port: int = DEFAULT_SERVE_PORT, max_in_flight: int = 2,
+                max_queue: int = 16, style_key: str = "purple", **options):
+    """
+    常驻渲染服务：浏览器只启动一次，通过 HTTP/JSON 提供渲染
+    
+    POST /render  {"markdown": "..." | "file": "note.md", "base_dir", "style", "output_dir",
+                   "return": "path"|"base64"}
+    POST /cover   {"title", "emoji", "subtitle", "style", "output_dir", "return": "path"|"base64"}
+    GET  /styles  样式列表
+    GET  /health  健康检查（含排队情况）
+    
+    同时渲染的请求数不超过 max_in_flight，排队超过 max_queue 时直接返回 503
+    笔记中的相对图片路径按 base_dir 解析（默认：file 所在目录；直接传 markdown 时为服务的工作目录）
+    未指定 output_dir 时输出到服务的临时目录：base64 返回或渲染失败后立即删除，
+    path 返回的保留 SERVE_OUTPUT_TTL 秒后由定时清理删除
+    """
+    from aiohttp import web
+    
+    playwright = await async_playwright().start()
+    browser = await playwright.chromium.launch()
+    in_flight = asyncio.Semaphore(max_in_flight)
+    pending = 0
+    work_dir = tempfile.mkdtemp(prefix="xhs_serve_")
+    
+    async def cleanup_outputs():
+        """定时删除超过 SERVE_OUTPUT_TTL 的临时输出目录"""
+        while True:
+            await asyncio.sleep(SERVE_CLEANUP_INTERVAL)
+            expired_before = time.time() - SERVE_OUTPUT_TTL
+            for entry in Path(work_dir).iterdir():
+                try:
+                    if entry.stat().st_mtime < expired_before:
+                        shutil.rmtree(entry, ignore_errors=True)
+                except FileNotFoundError:
+                    pass
+    
+    async def limited(coro):
+        nonlocal pending
+        if pending >= max_in_flight + max_queue:
+            coro.close()
+            raise web.HTTPServiceUnavailable(
+                text=json.dumps({"ok": False, "error": "render queue full"}),
+                content_type="application/json",
+            )
+        pending += 1
+        try:
+            async with in_flight:
+                return await coro
+        finally:
+            pending -= 1
+    
+    def respond(files: List[str], payload: dict, started: float, **extra):
+        result = {"ok": True, **extra, "ms": round((time.perf_counter() - started) * 1000, 1)}
+        if payload.get("return") == "base64":
+            result["images"] = [
+                {"name": os.path.basename(path), "base64": base64.b64encode(Path(path).read_bytes()).decode()}
+                for path in files
+            ]
+        else:
+            result["files"] = files
+        return web.json_response(result)
+    
+    def keeps_output(payload: dict, response) -> bool:
+        """临时输出目录是否要保留（成功且以 path 返回）"""
+        return response is not None and response.status == 200 and payload.get("return") != "base64"
+    
+    def resolve_request(payload: dict):
+        request_style = payload.get("style", style_key)
+        if request_style not in STYLES:
+            raise web.HTTPBadRequest(
+                text=json.dumps({"ok": False, "error": f"unknown style: {request_style}"}),
+                content_type="application/json",
+            )
+        output_dir = payload.get("output_dir")
+        is_temp = not output_dir
+        if is_temp:
+            output_dir = tempfile.mkdtemp(prefix="render_", dir=work_dir)
+        return request_style, output_dir, is_temp
+    
+    async def handle_render(request):
+        started = time.perf_counter()
+        payload, output_dir, is_temp, response = {}, None, False, None
+        try:
+            payload = await request.json()
+            base_dir = payload.get("base_dir")
+            if base_dir is not None and not os.path.isdir(base_dir):
+                response = web.json_response({"ok": False, "error": f"base_dir is not a directory: {base_dir}"},
+                                             status=400)
+                return response
+            request_style, output_dir, is_temp = resolve_request(payload)
+            md_file = payload.get("file")
+            temp_md = None
+            if payload.get("markdown") is not None:
+                fd, temp_md = tempfile.mkstemp(suffix='.md', prefix='note_', dir=work_dir)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(payload["markdown"])
+                md_file = temp_md
+                base_dir = base_dir or os.getcwd()
+            elif not md_file or not os.path.exists(md_file):
+                response = web.json_response({"ok": False, "error": "markdown or existing file is required"},
+                                             status=400)
+                return response
+            try:
+                metadata = parse_markdown_file(md_file)['metadata']
+                total_cards = await limited(
+                    render_markdown_to_cards(md_file, output_dir, request_style, browser,
+                                             base_dir=base_dir, **options)
+                )
+            finally:
+                if temp_md:
+                    os.remove(temp_md)
+            files = note_output_files(metadata, output_dir, total_cards, options.get('image_format', 'png'))
+            response = respond(files, payload, started, cards=total_cards)
+            return response
+        except web.HTTPException:
+            raise
+        except Exception as e:
+            response = web.json_response({"ok": False, "error": str(e)}, status=500)
+            return response
+        finally:
+            if is_temp and not keeps_output(payload, response):
+                shutil.rmtree(output_dir, ignore_errors=True)
+    
+    async def handle_cover(request):
+        started = time.perf_counter()
+        payload, output_dir, is_temp, response = {}, None, False, None
+        try:
+            payload = await request.json()
+            request_style, output_dir, is_temp = resolve_request(payload)
+            os.makedirs(output_dir, exist_ok=True)
+            cover_path = os.path.join(output_dir, f"cover{IMAGE_FORMATS[options.get('image_format', 'png')]}")
+            cover_html = generate_cover_html(payload, request_style)
+            
+            async def render_cover():
+                page = await new_render_page(browser)
+                try:
+                    await render_html_to_image(cover_html, cover_path, page=page, cache=options.get('cache'),
+                                               quality=options.get('quality'))
+                finally:
+                    await page.close()
+            
+            await limited(render_cover())
+            response = respond([cover_path], payload, started)
+            return response
+        except web.HTTPException:
+            raise
+        except Exception as e:
+            response = web.json_response({"ok": False, "error": str(e)}, status=500)
+            return response
+        finally:
+            if is_temp and not keeps_output(payload, response):
+                shutil.rmtree(output_dir, ignore_errors=True)
+    
+    async def handle_styles(request):
+        return web.json_response({
+            "ok": True,
+            "styles": [{"key": key, "name": style["name"]} for key, style in STYLES.items()],
+        })
+    
+    async def handle_health(request):
+        return web.json_response({"status": "ok", "port": port, "pending": pending,
+                                  "max_in_flight": max_in_flight})
+    
+    app = web.Application()
+    app.router.add_post('/render', handle_render)
+    app.router.add_post('/cover', handle_cover)
+    app.router.add_get('/styles', handle_styles)
+    app.router.add_get('/health', handle_health)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    print(f"\n🎉 渲染服务已启动: http://{host}:{port}（最多并行 {max_in_flight} 个请求）")
+    print("按 Ctrl+C 停止服务\n")
+    
+    cleanup_task = asyncio.create_task(cleanup_outputs())
+    try:
+        # 保持运行
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        cleanup_task.cancel()
+        await runner.cleanup()
+        await browser.close()
+        await playwright.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# ─── 监听模式 ───
+
+WATCH_INTERVAL = 0.5
+OUTPUT_IMAGE_PATTERN = re.compile(r'(cover|card_\d+)\.(png|jpg|webp)')
+
+
+def job_fingerprint(html_content: str, quality: int = None) -> str:
+    """一张图片的指纹：最终 HTML + 质量 + 字体指纹，相同则图片像素相同"""
+    digest = hashlib.sha256()
+    digest.update(html_content.encode('utf-8'))
+    digest.update(f"|{quality}|{font_fingerprint()}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def snapshot_files(*paths: Path) -> Dict[str, Tuple[int, int]]:
+    """文件（目录则递归）的 (修改时间, 大小) 快照，不存在的路径不出现"""
+    snapshot = {}
+    for path in paths:
+        path = Path(path)
+        files = sorted(path.rglob('*')) if path.is_dir() else [path]
+        for file in files:
+            try:
+                stat = file.stat()
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if not file.is_dir():
+                snapshot[str(file)] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def reload_assets():
+    """assets 变化后丢弃字体与排版参数的缓存，下次渲染重新读取"""
+    load_text_metrics.cache_clear()
+    discover_local_fonts.cache_clear()
+    warn_google_fonts_fallback.cache_clear()
+    _raster_font.cache_clear()
+    _raster_notdef.cache_clear()
+    raster_has_glyph.cache_clear()
+
+
+def remove_stale_images(output_dir: str, keep: List[str]) -> List[str]:
+    """删除输出目录中不再属于本篇的封面/卡片（如卡片变少后多出的 card_N）"""
+    keep = {os.path.abspath(path) for path in keep}
+    removed = []
+    for name in sorted(os.listdir(output_dir)):
+        path = os.path.join(output_dir, name)
+        if OUTPUT_IMAGE_PATTERN.fullmatch(name) and os.path.abspath(path) not in keep:
+            os.remove(path)
+            removed.append(path)
+    return removed
+
+
+async def watch(md_file: str, output_dir: str, style_key: str = "purple",
+                interval: float = WATCH_INTERVAL, **options):
+    """
+    监听模式：浏览器常驻，Markdown 文件、其引用的本地图片或 assets 目录有变化就重新解析、分页，
+    只重新截图内容或页码变化的卡片（front matter 不变则封面不动），未变化的图片文件不会被改写
+    options 同 render_markdown_to_cards
+    """
+    fingerprints: Dict[str, str] = {}
+    note_snapshot = assets_snapshot = None
+    
+    async with async_playwright() as p:
+        browser = await p.chromium.launch()
+        try:
+            while True:
+                # 图片列表每轮按正文重新提取：新增/删除引用与图片文件本身的改动都会触发重渲染
+                current_note = snapshot_files(md_file, *note_image_files(md_file))
+                current_assets = snapshot_files(ASSETS_DIR)
+                if current_note and (current_note != note_snapshot or current_assets != assets_snapshot):
+                    if assets_snapshot is not None and current_assets != assets_snapshot:
+                        print("\n🔄 assets 有变化，重新载入字体与排版参数")
+                        reload_assets()
+                    note_snapshot, assets_snapshot = current_note, current_assets
+                    
+                    started = time.perf_counter()
+                    try:
+                        await render_markdown_to_cards(md_file, output_dir, style_key, browser,
+                                                       fingerprints=fingerprints, **options)
+                    except Exception as e:
+                        # 草稿可能处于半成品状态，报错后继续监听
+                        print(f"❌ 渲染失败: {e}")
+                    else:
+                        for path in remove_stale_images(output_dir, list(fingerprints)):
+                            print(f"  🗑️ 删除多余图片: {os.path.basename(path)}")
+                        print(f"  ⏱️ 用时 {time.perf_counter() - started:.2f}s")
+                    print(f"👀 监听 {md_file} 与 {ASSETS_DIR}（Ctrl+C 退出）")
+                await asyncio.sleep(interval)
+        finally:
+            await browser.close()
+
+
 def list_styles():
     """列出所有可用样式"""
     print("\n📋 可用样式列表：")
@@ -683,7 +3343,19 @@ def list_styles():
     print("-" * 40)
 
 
+def quality_arg(value: str) -> int:
+    """--quality 取值检查：1-100 的整数"""
+    try:
+        quality = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"不是整数: {value}")
+    if not 1 <= quality <= 100:
+        raise argparse.ArgumentTypeError(f"应在 1-100 之间: {quality}")
+    return quality
+
+
 def main():
+    global FONT_MODE
     parser = argparse.ArgumentParser(
         description='将 Markdown 文件渲染为小红书风格的图片卡片（智能分页版）',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -691,13 +3363,18 @@ def main():
 示例:
   python render_xhs_v2.py note.md
   python render_xhs_v2.py note.md -o ./output --style xiaohongshu
+  python render_xhs_v2.py --batch ./notes -o ./output --workers 4
+  python render_xhs_v2.py --batch "./notes/**/*.md" -o ./output
+  python render_xhs_v2.py --serve --port 5007 --max-in-flight 2
+  python render_xhs_v2.py note.md --metrics 2> metrics.jsonl
+  python render_xhs_v2.py note.md -o ./output --watch
   python render_xhs_v2.py --list-styles
         '''
     )
     parser.add_argument(
         'markdown_file',
         nargs='?',
-        help='Markdown 文件路径'
+        help='Markdown 文件路径（--batch 时为目录或 glob）'
     )
     parser.add_argument(
         '--output-dir', '-o',
@@ -710,27 +3387,199 @@ def main():
         choices=list(STYLES.keys()),
         help='样式主题（默认: purple）'
     )
+    parser.add_argument(
+        '--paginate',
+        default='dom',
+        choices=PAGINATE_MODES,
+        help='分页引擎：dom 浏览器内单次布局分页（默认），estimate 字数预估 + 逐块实测'
+    )
+    parser.add_argument(
+        '--split-mode',
+        default='bisect',
+        choices=SPLIT_MODES,
+        help='estimate 分页下溢出内容按行拆分方式：bisect 二分测量（默认），linear 逐行测量'
+    )
+    parser.add_argument(
+        '--render-mode',
+        default='pages',
+        choices=RENDER_MODES,
+        help='截图方式：pages 每张卡片单独载入（默认），stacked 多张叠排在一个文档中载入一次后分区截图'
+    )
+    parser.add_argument(
+        '--backend',
+        default='playwright',
+        choices=RENDER_BACKENDS,
+        help='出图后端：playwright 全部用浏览器（默认），auto 纯文字卡片用 Pillow 直接绘制、其余用浏览器'
+             '（更快，需要 Pillow 与本地字体，画面与浏览器截图有细微差别）'
+    )
+    parser.add_argument(
+        '--concurrency', '-j',
+        type=int,
+        default=1,
+        help='并行截图的页面数（默认: 1）'
+    )
+    parser.add_argument(
+        '--font-mode',
+        default=FONT_MODE,
+        choices=FONT_MODES,
+        help='字体来源：auto 有 assets/fonts 则用本地字体（默认），local 仅本地，google 使用 Google Fonts'
+    )
+    parser.add_argument(
+        '--format',
+        default='png',
+        choices=list(IMAGE_FORMATS.keys()),
+        help='输出图片格式（默认: png）'
+    )
+    parser.add_argument(
+        '--quality',
+        type=quality_arg,
+        default=None,
+        help=f'jpeg/webp 质量 1-100（默认: {DEFAULT_QUALITY}）'
+    )
+    parser.add_argument(
+        '--optimize-png',
+        action='store_true',
+        help='渲染后在进程池中无损重压缩 PNG（需要 Pillow），并报告每张节省的字节数'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='不使用渲染缓存，所有封面和卡片重新截图'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        default=DEFAULT_CACHE_DIR,
+        help='渲染缓存目录（默认: data/render_cache，可用 XHS_RENDER_CACHE 覆盖）'
+    )
+    parser.add_argument(
+        '--cache-size-mb',
+        type=int,
+        default=DEFAULT_CACHE_MAX_MB,
+        help=f'渲染缓存容量上限，超出按最近使用淘汰（默认: {DEFAULT_CACHE_MAX_MB}）'
+    )
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help='批量模式：渲染目录或 glob 下的所有笔记，每篇输出到 <输出目录>/<文件名>/'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=max(1, (os.cpu_count() or 2) // 2),
+        help='批量模式的 worker 进程数，每个进程常驻一个浏览器（默认: CPU 核数的一半）'
+    )
+    parser.add_argument(
+        '--watch', '-w',
+        action='store_true',
+        help='监听模式：浏览器常驻，笔记或 assets 变化时只重新渲染有变化的卡片'
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='以常驻 HTTP 服务运行（需要 aiohttp），浏览器保持预热'
+    )
+    parser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='渲染服务监听地址（默认: 127.0.0.1）'
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=DEFAULT_SERVE_PORT,
+        help=f'渲染服务端口（默认: {DEFAULT_SERVE_PORT}）'
+    )
+    parser.add_argument(
+        '--max-in-flight',
+        type=int,
+        default=2,
+        help='渲染服务同时处理的请求数上限，其余排队（默认: 2）'
+    )
+    parser.add_argument(
+        '--max-queue',
+        type=int,
+        default=16,
+        help='渲染服务排队请求数上限，超出返回 503（默认: 16）'
+    )
+    parser.add_argument(
+        '--metrics',
+        nargs='?',
+        const='-',
+        default=None,
+        metavar='FILE',
+        help='每篇笔记输出一行 JSON 指标（分阶段耗时、测量/拆分/页面/缓存/卡片计数），'
+             '默认写到 stderr，指定文件则追加写入'
+    )
+    parser.add_argument(
+        '--calibrate',
+        action='store_true',
+        help='在浏览器中实测各样式的字宽与排版参数，写入 assets/text_metrics.json 供高度预估使用'
+    )
     parser.add_argument(
         '--list-styles',
         action='store_true',
         help='列出所有可用样式'
     )
-    
+
     args = parser.parse_args()
-    
+
+    if args.render_mode == "stacked" and args.concurrency > 1:
+        parser.error("--render-mode stacked 在一个页面内逐张截图，不能与 --concurrency 同时使用")
+
     if args.list_styles:
         list_styles()
         return
-    
+
+    FONT_MODE = args.font_mode
+    if FONT_MODE == "local" and not discover_local_fonts():
+        print(f"⚠️ 未在 {FONTS_DIR} 找到字体文件，将使用系统字体")
+
+    if args.calibrate:
+        asyncio.run(calibrate_text_metrics())
+        return
+
+    options = {
+        'split_mode': args.split_mode,
+        'paginate_mode': args.paginate,
+        'concurrency': args.concurrency,
+        'render_mode': args.render_mode,
+        'backend': args.backend,
+        'cache': None if args.no_cache else RenderCache(args.cache_dir, args.cache_size_mb * 1024 * 1024),
+        'image_format': args.format,
+        'quality': args.quality,
+        'optimize_png': args.optimize_png,
+        'metrics': args.metrics,
+    }
+
+    if args.serve:
+        try:
+            asyncio.run(serve(args.host, args.port, args.max_in_flight, args.max_queue, args.style, **options))
+        except KeyboardInterrupt:
+            print("\n👋 服务已停止")
+        return
+
     if not args.markdown_file:
         parser.print_help()
         sys.exit(1)
-    
-    if not os.path.exists(args.markdown_file):
+
+    if not args.batch and not os.path.exists(args.markdown_file):
         print(f"❌ 错误: 文件不存在 - {args.markdown_file}")
         sys.exit(1)
-    
-    asyncio.run(render_markdown_to_cards(args.markdown_file, args.output_dir, args.style))
+
+    if args.watch:
+        if args.batch:
+            parser.error("--watch 只支持单篇笔记，不能与 --batch 同时使用")
+        try:
+            asyncio.run(watch(args.markdown_file, args.output_dir, args.style, **options))
+        except KeyboardInterrupt:
+            print("\n👋 已停止监听")
+        return
+
+    if args.batch:
+        summary = render_batch(args.markdown_file, args.output_dir, args.style, args.workers, **options)
+        sys.exit(0 if summary["ok"] else 1)
+
+    asyncio.run(render_markdown_to_cards(args.markdown_file, args.output_dir, args.style, **options))
 
 
 if __name__ == '__main__':
@@ -30,6 +30,19 @@
   # 限制回复数量 + 间隔秒数
   python3 xhs_comment.py auto-reply --note-id <note_id> --max-replies 10 --delay 12 --confirm
 
+  # 每 8 条评论合成一次模型调用（人设只发送一次）
+  python3 xhs_comment.py auto-reply --note-id <note_id> --batch-size 8
+
+守护进程（可选）:
+  # 常驻进程保持 CDP 连接和一组已注入 stealth 的标签页，通过 Unix socket 接收 JSON-RPC
+  python3 xhs_comment.py daemon --tabs 2
+  python3 xhs_comment.py daemon --status
+  python3 xhs_comment.py daemon --stop
+
+  守护进程在运行时，上面的命令自动交给它执行（输出与退出码不变），
+  否则照旧直连浏览器；加 --direct 强制直连:
+  python3 xhs_comment.py --direct list --note-id <note_id>
+
 退出码:
   0 = 成功
   1 = 参数错误
@@ -40,31 +53,66 @@
 
 import argparse
 import asyncio
+import atexit
+import hashlib
 import json
 import os
 import random
-import subprocess
+import shutil
+import signal
 import sys
 import time
+import unicodedata
+from contextvars import ContextVar
 from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：回复缓存写盘不加文件锁
+    fcntl = None
 
 CDP_ENDPOINT = os.environ.get("XHS_CDP_ENDPOINT", "http://127.0.0.1:18800")
 STEALTH_JS = Path(__file__).parent / "stealth.min.js"
 DEFAULT_PERSONA = Path(__file__).parent.parent / "persona.md"
 REPLY_LOG_DIR = Path(__file__).parent.parent / "data" / "reply_logs"
+DAEMON_SOCKET = Path(os.environ.get("XHS_COMMENT_SOCKET",
+                                    str(Path(__file__).parent.parent / "data" / "xhs_comment.sock")))
+DEFAULT_DAEMON_TABS = 2
+# auto-reply 同时生成回复的评论数
+DEFAULT_GENERATE_CONCURRENCY = 4
+# 模型路由的健康状态（跨次运行保留）
+PROVIDER_STATE_FILE = Path(__file__).parent.parent / "data" / "provider_health.json"
+# 已生成回复的缓存（键含笔记 ID 和人设哈希）
+REPLY_CACHE_FILE = Path(__file__).parent.parent / "data" / "reply_cache.json"
+# 单条 JSON-RPC 消息（一行）的长度上限
+RPC_LINE_LIMIT = 16 * 1024 * 1024
+
+# 进度日志的去向：直连模式写 stderr，守护进程中转发给发起命令的客户端
+_log_sink: ContextVar[Optional[Callable[[str], None]]] = ContextVar("log_sink", default=None)
+
+
+def log_event(msg: str):
+    """输出一行进度日志 {"log": ...}"""
+    sink = _log_sink.get()
+    if sink is not None:
+        sink(msg)
+    else:
+        print(json.dumps({"log": msg}), file=sys.stderr, flush=True)
+
 
 # ─── Browser helpers ───
 
 async def connect_browser():
+    """启动 Playwright 并通过 CDP 连接浏览器；失败时抛出异常"""
     from playwright.async_api import async_playwright
     pw = await async_playwright().start()
     try:
         browser = await pw.chromium.connect_over_cdp(CDP_ENDPOINT)
         return pw, browser
-    except Exception as e:
+    except Exception:
         await pw.stop()
-        print(json.dumps({"ok": False, "error": f"CDP connect failed: {e}"}))
-        sys.exit(2)
+        raise
 
 
 async def inject_stealth(page):
@@ -204,6 +252,15 @@ EXTRACT_MY_NICKNAME_JS = """() => {
 
 # ─── AI reply generation ───
 
+REPLY_RULES = """- 风格：短句、口语化、符合人设
+- 如果评论是夸奖/感谢 → 接梗 + 轻松回应
+- 如果评论是提问 → 简短回答 + 收尾
+- 如果评论是杠精/无意义 → 轻飘飘带过"""
+
+# 批量回复中单条回复的长度上限（超出视为无效，改为单独生成）
+REPLY_MAX_CHARS = 200
+
+
 def _build_reply_prompt(comment_user: str, comment_content: str, note_title: str,
                         note_desc: str, persona_text: str) -> str:
     return f"""{persona_text}
@@ -217,14 +274,72 @@ def _build_reply_prompt(comment_user: str, comment_content: str, note_title: str
 【评论内容】{comment_content}
 
 请根据上方人设，生成 1 条回复（≤ 100 字）。
-- 风格：短句、口语化、符合人设
-- 如果评论是夸奖/感谢 → 接梗 + 轻松回应
-- 如果评论是提问 → 简短回答 + 收尾
-- 如果评论是杠精/无意义 → 轻飘飘带过
+{REPLY_RULES}
 - 不要加引号，直接输出回复文本
 """
 
 
+def _build_batch_prompt(comments: list, note_title: str, note_desc: str, persona_text: str) -> str:
+    """人设与帖子只出现一次，评论按 1..N 编号，要求只输出 JSON 数组"""
+    numbered = "\n".join(
+        f"{i}. 【评论者】{c['user']}【评论内容】{' '.join(c['content'].split())}"
+        for i, c in enumerate(comments, 1)
+    )
+    return f"""{persona_text}
+
+---
+你正在回复自己小红书帖子下的多条评论。
+
+【帖子标题】{note_title}
+【帖子内容摘要】{note_desc[:200]}
+
+【评论列表】
+{numbered}
+
+请根据上方人设，为每条评论各生成 1 条回复（每条 ≤ 100 字）。
+{REPLY_RULES}
+
+只输出一个 JSON 数组，不要输出任何其他文字或代码块标记，格式：
+[{{"index": 1, "reply": "回复内容"}}, {{"index": 2, "reply": "回复内容"}}]
+数组须包含全部 {len(comments)} 条，index 与评论编号一一对应，reply 内不要再加引号。
+"""
+
+
+def _parse_batch_replies(text: str, count: int) -> dict:
+    """
+    解析批量回复 → {编号: 回复}，只保留编号在 1..count、回复非空且不超长的项（同一编号取第一个）
+    兼容前后多余文字 / 代码块标记；纯字符串数组仅在条数正好为 count 时按位置对应
+    """
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(items, list):
+        return {}
+
+    replies = {}
+    for position, item in enumerate(items, 1):
+        if isinstance(item, dict):
+            index, reply = item.get("index"), item.get("reply")
+        elif len(items) == count:
+            index, reply = position, item
+        else:
+            continue
+        if isinstance(index, str) and index.strip().isdigit():
+            index = int(index)
+        if isinstance(index, bool) or not isinstance(index, int) or not 1 <= index <= count:
+            continue
+        if index in replies or not isinstance(reply, str):
+            continue
+        reply = _clean_reply(reply)
+        if reply and len(reply) <= REPLY_MAX_CHARS:
+            replies[index] = reply
+    return replies
+
+
 def _clean_reply(text: str) -> str:
     """清理 AI 回复的多余引号/空白"""
     text = text.strip()
@@ -234,7 +349,18 @@ def _clean_reply(text: str) -> str:
     return text
 
 
-def _call_openclaw_gateway(prompt: str, model: str) -> str | None:
+# 模型调用超时：单条回复（max_tokens=200）用基础超时；批量生成输出更长，
+# 多出来的 token 按 CALL_SECONDS_PER_TOKEN 追加（约 20 token/s），与 max_tokens 随批量大小同步放宽
+CALL_TIMEOUT_BASE_TOKENS = 200
+CALL_SECONDS_PER_TOKEN = 0.05
+
+
+def call_timeout(base_seconds: float, max_tokens: int) -> float:
+    """单条回复的基础超时按 max_tokens 放宽后的秒数"""
+    return base_seconds + max(0, max_tokens - CALL_TIMEOUT_BASE_TOKENS) * CALL_SECONDS_PER_TOKEN
+
+
+def _call_openclaw_gateway(prompt: str, model: str, max_tokens: int = 200) -> str | None:
     """
     通过 OpenClaw Gateway 的 chat completions endpoint 调用模型。
     自动使用 OpenClaw 已配置的 auth，无需单独配 API key。
@@ -254,9 +380,9 @@ def _call_openclaw_gateway(prompt: str, model: str) -> str | None:
             json={
                 "model": model,
                 "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": 200
+                "max_tokens": max_tokens
             },
-            timeout=30
+            timeout=call_timeout(30, max_tokens)
         )
         if resp.status_code == 200:
             return _clean_reply(resp.json()["choices"][0]["message"]["content"])
@@ -265,27 +391,31 @@ def _call_openclaw_gateway(prompt: str, model: str) -> str | None:
     return None
 
 
-def _try_claude_sonnet(prompt: str) -> str | None:
-    """首选：Claude Sonnet 4 via CLI"""
+async def _try_claude_sonnet(prompt: str, max_tokens: int = 200) -> str | None:
+    """首选：Claude Sonnet 4 via CLI（异步子进程，超时或取消时结束进程；CLI 不限输出长度，max_tokens 只用于放宽超时）"""
     try:
-        result = subprocess.run(
-            ["claude", "-p", prompt, "--model", "claude-sonnet-4-20250514"],
-            capture_output=True, text=True, timeout=30
+        proc = await asyncio.create_subprocess_exec(
+            "claude", "-p", prompt, "--model", "claude-sonnet-4-20250514",
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
         )
-        if result.returncode == 0 and result.stdout.strip():
-            return _clean_reply(result.stdout)
-    except (subprocess.TimeoutExpired, FileNotFoundError):
-        pass
+    except (FileNotFoundError, PermissionError):
+        return None
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=call_timeout(30, max_tokens))
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    text = stdout.decode("utf-8", errors="replace")
+    if proc.returncode == 0 and text.strip():
+        return _clean_reply(text)
     return None
 
 
-def _try_minimax(prompt: str) -> str | None:
-    """Fallback 1: MiniMax M2.1 Lightning via OpenClaw gateway or direct API"""
-    # 先走 gateway
-    result = _call_openclaw_gateway(prompt, "minimax/MiniMax-M2.1-lightning")
-    if result:
-        return result
-    # 直接 API fallback
+def _minimax_api(prompt: str, max_tokens: int = 200) -> str | None:
+    """MiniMax 直连 API（未配置 MINIMAX_API_KEY 时不可用）"""
     try:
         api_key = os.environ.get("MINIMAX_API_KEY", "")
         group_id = os.environ.get("MINIMAX_GROUP_ID", "2017621601956144027")
@@ -298,9 +428,9 @@ def _try_minimax(prompt: str) -> str | None:
             json={
                 "model": "MiniMax-Text-01",
                 "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": 200
+                "max_tokens": max_tokens
             },
-            timeout=20
+            timeout=call_timeout(20, max_tokens)
         )
         if resp.status_code == 200:
             return _clean_reply(resp.json()["choices"][0]["message"]["content"])
@@ -309,13 +439,8 @@ def _try_minimax(prompt: str) -> str | None:
     return None
 
 
-def _try_qwen(prompt: str) -> str | None:
-    """Fallback 2: Qwen 3.5 Plus via OpenClaw gateway or direct API"""
-    # 先走 gateway
-    result = _call_openclaw_gateway(prompt, "dashscope/qwen3.5-plus")
-    if result:
-        return result
-    # 直接 API fallback
+def _qwen_api(prompt: str, max_tokens: int = 200) -> str | None:
+    """Qwen 直连 API（未配置 DASHSCOPE_API_KEY 时不可用）"""
     try:
         api_key = os.environ.get("DASHSCOPE_API_KEY", "")
         if not api_key:
@@ -327,9 +452,9 @@ def _try_qwen(prompt: str) -> str | None:
             json={
                 "model": "qwen3.5-plus",
                 "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": 200
+                "max_tokens": max_tokens
             },
-            timeout=20
+            timeout=call_timeout(20, max_tokens)
         )
         if resp.status_code == 200:
             return _clean_reply(resp.json()["choices"][0]["message"]["content"])
@@ -338,158 +463,508 @@ def _try_qwen(prompt: str) -> str | None:
     return None
 
 
-def generate_reply_with_ai(comment_user: str, comment_content: str, note_title: str,
-                           note_desc: str, persona_text: str) -> str:
+# ─── Provider router ───
+# 每条调用路径（CLI / gateway / 直连 API）单独统计成功延迟（EWMA）与错误率（EWMA），状态存盘跨次保留。
+# 连续失败 CIRCUIT_FAILURES 次即熔断，CIRCUIT_COOLDOWN 秒后放行一次试探（半开），成功则恢复；
+# 路由时只用健康的路径，按 延迟 × (1 + 错误率) 从快到慢排序，没有数据的按原链路顺序排在最前先试一次。
+# 同步的路径（requests）在线程里执行：对冲落败或命令取消时只是不再等待结果，线程中的请求无法中断，
+# 会一直占用一个线程池线程，直到请求自身超时（20-30 秒，批量时按输出长度放宽，见 call_timeout）后结束，结果被丢弃
+
+PROVIDERS = {
+    # 名称: (调用函数, 是否协程, 是否可用)
+    "claude-cli": (lambda prompt, max_tokens: _try_claude_sonnet(prompt, max_tokens), True,
+                   lambda: shutil.which("claude") is not None),
+    "minimax-gateway": (lambda prompt, max_tokens: _call_openclaw_gateway(
+        prompt, "minimax/MiniMax-M2.1-lightning", max_tokens), False, lambda: True),
+    "minimax-api": (_minimax_api, False, lambda: bool(os.environ.get("MINIMAX_API_KEY"))),
+    "qwen-gateway": (lambda prompt, max_tokens: _call_openclaw_gateway(
+        prompt, "dashscope/qwen3.5-plus", max_tokens), False, lambda: True),
+    "qwen-api": (_qwen_api, False, lambda: bool(os.environ.get("DASHSCOPE_API_KEY"))),
+}
+CIRCUIT_FAILURES = 3
+CIRCUIT_COOLDOWN = 300
+EWMA_ALPHA = 0.3
+# 统计状态最多每隔 ROUTER_SAVE_INTERVAL 秒写一次盘；熔断打开/恢复时立即写，退出时补写
+ROUTER_SAVE_INTERVAL = 5
+
+
+class ProviderRouter:
+    """按健康状态选择模型调用路径，可选对冲（hedge_ms 内未返回就同时调用下一个）"""
+
+    def __init__(self, state_file: Path = PROVIDER_STATE_FILE):
+        self.state_file = state_file
+        self.state = {}
+        self.probing = set()
+        self.dirty = False
+        self.saved_at = 0.0
+        try:
+            self.state = json.loads(state_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            pass
+
+    def stats(self, name: str) -> dict:
+        return self.state.setdefault(name, {
+            "latency_ms": None, "error_rate": 0.0, "successes": 0, "failures": 0,
+            "consecutive_failures": 0, "opened_at": None,
+        })
+
+    def save(self):
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_file.with_name(f"{self.state_file.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self.state, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.state_file)
+        self.dirty = False
+        self.saved_at = time.monotonic()
+
+    def flush(self):
+        """有未写盘的统计时写盘"""
+        if self.dirty:
+            self.save()
+
+    def _changed(self, urgent: bool = False):
+        """统计有变化：熔断状态变化（urgent）立即写盘，其余距上次写盘超过 ROUTER_SAVE_INTERVAL 才写"""
+        self.dirty = True
+        if urgent or time.monotonic() - self.saved_at >= ROUTER_SAVE_INTERVAL:
+            self.save()
+
+    def record(self, name: str, ok: bool, elapsed_ms: float):
+        s = self.stats(name)
+        opened_at = s["opened_at"]
+        s["error_rate"] = round((1 - EWMA_ALPHA) * s["error_rate"] + EWMA_ALPHA * (0.0 if ok else 1.0), 4)
+        if ok:
+            s["successes"] += 1
+            s["consecutive_failures"] = 0
+            s["opened_at"] = None
+            s["latency_ms"] = round(elapsed_ms if s["latency_ms"] is None
+                                    else (1 - EWMA_ALPHA) * s["latency_ms"] + EWMA_ALPHA * elapsed_ms, 1)
+        else:
+            s["failures"] += 1
+            s["consecutive_failures"] += 1
+            if s["consecutive_failures"] >= CIRCUIT_FAILURES:
+                s["opened_at"] = time.time()
+        self.probing.discard(name)
+        self._changed(urgent=s["opened_at"] != opened_at)
+
+    def record_slow(self, name: str, elapsed_ms: float):
+        """被对冲抢先时没有结果，只把已耗时作为延迟下限计入（不算错误）"""
+        s = self.stats(name)
+        s["latency_ms"] = round(elapsed_ms if s["latency_ms"] is None
+                                else max(s["latency_ms"], (1 - EWMA_ALPHA) * s["latency_ms"] + EWMA_ALPHA * elapsed_ms), 1)
+        self.probing.discard(name)
+        self._changed()
+
+    def ranked(self, claim: bool = False) -> list:
+        """
+        可用且未熔断的路径（熔断冷却结束的放行一次试探），从快到慢
+        claim=True 时在返回前同步占用其中的试探名额（记入 probing），并发的调用不会同时试探同一路径；
+        占用后没有真正调用的由调用方 release
+        """
+        now = time.time()
+        order = list(PROVIDERS)
+        healthy, cooling = [], []
+        for name in order:
+            if not PROVIDERS[name][2]():
+                continue
+            s = self.stats(name)
+            if s["opened_at"] is None:
+                healthy.append(name)
+            elif name in self.probing:
+                continue
+            elif now - s["opened_at"] >= CIRCUIT_COOLDOWN:
+                healthy.append(name)
+            else:
+                cooling.append(name)
+        if not healthy and cooling:
+            # 全部熔断时只试探最早熔断的一个，不再逐个耗尽超时
+            healthy = [min(cooling, key=lambda n: self.stats(n)["opened_at"])]
+
+        def score(name):
+            s = self.stats(name)
+            if s["latency_ms"] is None:
+                return (0, order.index(name))
+            return (1, s["latency_ms"] * (1 + s["error_rate"]))
+        result = sorted(healthy, key=score)
+        if claim:
+            self.probing.update(name for name in result if self.stats(name)["opened_at"] is not None)
+        return result
+
+    async def _call(self, name: str, prompt: str, max_tokens: int) -> str | None:
+        call, is_async, _ = PROVIDERS[name]
+        start = time.monotonic()
+        try:
+            if is_async:
+                text = await call(prompt, max_tokens)
+            else:
+                text = await asyncio.to_thread(call, prompt, max_tokens)
+        except asyncio.CancelledError:
+            self.record_slow(name, (time.monotonic() - start) * 1000)
+            raise
+        except Exception:
+            text = None
+        self.record(name, bool(text), (time.monotonic() - start) * 1000)
+        return text
+
+    async def complete(self, prompt: str, max_tokens: int = 200, tag: str = "",
+                       hedge_ms: float = None) -> str | None:
+        """
+        按排序依次调用直到拿到结果；hedge_ms 内未返回时同时启动下一个，先成功者胜出
+        落败的调用被取消，但线程中的同步请求不会真正中断（见上方说明）
+        """
+        log = lambda msg: log_event(tag + msg)
+        queue = self.ranked(claim=True)
+        probes = {name for name in queue if self.stats(name)["opened_at"] is not None}
+        if not queue:
+            log("⛔ No provider available")
+            return None
+        pending = {}
+
+        def launch():
+            name = queue.pop(0)
+            log(f"Trying {name}...")
+            pending[asyncio.ensure_future(self._call(name, prompt, max_tokens))] = name
+
+        try:
+            while queue or pending:
+                if not pending:
+                    launch()
+                timeout = hedge_ms / 1000 if hedge_ms and queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    log(f"⚡ {', '.join(pending.values())} over {hedge_ms:.0f}ms, hedging")
+                    launch()
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    text = task.result()
+                    if text:
+                        log(f"✅ {name} success")
+                        return text
+                    log(f"{name} failed")
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            # 没轮到调用的路径退还试探名额
+            self.probing.difference_update(probes.intersection(queue))
+
+
+_router: ProviderRouter | None = None
+
+
+def get_router() -> ProviderRouter:
+    """进程内共用一个路由（守护进程中跨命令保留状态）"""
+    global _router
+    if _router is None:
+        _router = ProviderRouter()
+        atexit.register(_router.flush)
+    return _router
+
+
+async def _complete_with_fallbacks(prompt: str, tag: str = "", max_tokens: int = 200,
+                                   hedge_ms: float = None) -> str | None:
+    """经 ProviderRouter 调用模型，返回第一个成功的文本（已经过 _clean_reply），全部失败返回 None"""
+    return await get_router().complete(prompt, max_tokens, tag, hedge_ms)
+
+
+FALLBACK_REPLIES = (
+    "谢谢关注～我继续打工了 🦞",
+    "行行行，收到！",
+    "哈哈 感谢支持～",
+    "我不说太多，懂的都懂 😼",
+)
+
+
+async def generate_reply_with_ai(comment_user: str, comment_content: str, note_title: str,
+                                 note_desc: str, persona_text: str, tag: str = "",
+                                 hedge_ms: float = None) -> str:
     """
-    AI 生成小红书风格回复。
-    链路: Claude Sonnet 4 → Kimi (k2.5) → Qwen 3.5 Plus → 模板兜底
+    AI 生成小红书风格回复（不阻塞事件循环，可多条并发）。
+    模型由 ProviderRouter 选择（Claude CLI / MiniMax / Qwen），全部失败时用模板兜底
     """
     prompt = _build_reply_prompt(comment_user, comment_content, note_title, note_desc, persona_text)
-
-    log = lambda msg: print(json.dumps({"log": msg}), file=sys.stderr, flush=True)
-
-    # 1) Claude Sonnet 4
-    log("Trying Claude Sonnet 4...")
-    reply = _try_claude_sonnet(prompt)
+    reply = await _complete_with_fallbacks(prompt, tag, hedge_ms=hedge_ms)
     if reply:
-        log("✅ Claude Sonnet 4 success")
         return reply
 
-    # 2) MiniMax M2.1 Lightning
-    log("Claude failed, trying MiniMax...")
-    reply = _try_minimax(prompt)
-    if reply:
-        log("✅ MiniMax success")
-        return reply
+    # 模板兜底
+    log_event(tag + "⚠️ All models failed, using template fallback")
+    return random.choice(FALLBACK_REPLIES)
+
+
+async def generate_replies_batched(comments: list, note_title: str, note_desc: str, persona_text: str,
+                                   tag: str = "", hedge_ms: float = None) -> list:
+    """
+    一次调用为多条评论生成回复（人设和帖子只发送一次），返回与 comments 对齐的
+    [(回复或异常, "batch" | "single")]；批量结果中缺失或无效的条目逐条单独生成
+    """
+    prompt = _build_batch_prompt(comments, note_title, note_desc, persona_text)
+    text = await _complete_with_fallbacks(prompt, tag, max_tokens=200 * len(comments) + 100, hedge_ms=hedge_ms)
+    replies = _parse_batch_replies(text or "", len(comments))
+    missing = [i for i in range(1, len(comments) + 1) if i not in replies]
+    if missing:
+        log_event(f"{tag}Batch returned {len(replies)}/{len(comments)} valid replies, "
+                  f"retrying {len(missing)} one by one")
+
+    results = [(replies[i], "batch") if i in replies else None for i in range(1, len(comments) + 1)]
+    for i in missing:
+        c = comments[i - 1]
+        try:
+            reply = await generate_reply_with_ai(c["user"], c["content"], note_title, note_desc,
+                                                 persona_text, tag=f"{tag}[{i}] ", hedge_ms=hedge_ms)
+        except Exception as e:
+            reply = e
+        results[i - 1] = (reply, "single")
+    return results
+
+
+# ─── Reply cache & near-duplicate grouping ───
+
+REPLY_CACHE_TTL = 7 * 24 * 3600
+REPLY_CACHE_MAX_ENTRIES = 2000
+# MinHash 签名长度与判定为近似重复的 Jaccard 相似度阈值
+MINHASH_PERMUTATIONS = 32
+CLUSTER_THRESHOLD = 0.6
+# 只归并短评论；长评论多是具体问题，内容相近也需要各自回答
+CLUSTER_MAX_CHARS = 12
+_MINHASH_PRIME = (1 << 61) - 1
+_minhash_rng = random.Random(20260225)
+MINHASH_PARAMS = tuple((_minhash_rng.randrange(1, _MINHASH_PRIME), _minhash_rng.randrange(_MINHASH_PRIME))
+                       for _ in range(MINHASH_PERMUTATIONS))
+# 同一条回复重复使用时在本地做的变化（前缀 × 结尾），不再调用模型
+VARIANT_PREFIXES = ("", "嘿嘿 ", "哈哈 ")
+VARIANT_SUFFIXES = ("～", "！", " 🦞", " 😼", "哈")
+
+
+def normalize_comment(text: str) -> str:
+    """
+    归一化评论：全半角/大小写统一，去掉空白和标点，连续重复的字合并为一个
+    （"哈哈哈哈" → "哈"）；纯表情评论只保留表情集合（与顺序、次数无关）
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    kept = "".join(ch for ch in text if unicodedata.category(ch)[0] in "LN")
+    if not kept:
+        return "".join(sorted({ch for ch in text if unicodedata.category(ch)[0] == "S"}))
+    collapsed = [ch for i, ch in enumerate(kept) if i == 0 or ch != kept[i - 1]]
+    return "".join(collapsed)
 
-    # 3) Qwen 3.5 Plus
-    log("Kimi failed, trying Qwen 3.5 Plus...")
-    reply = _try_qwen(prompt)
-    if reply:
-        log("✅ Qwen success")
-        return reply
 
-    # 4) 模板兜底
-    log("⚠️ All models failed, using template fallback")
-    templates = [
-        "谢谢关注～我继续打工了 🦞",
-        "行行行，收到！",
-        "哈哈 感谢支持～",
-        "我不说太多，懂的都懂 😼",
-    ]
-    return random.choice(templates)
+def minhash_signature(text: str) -> tuple:
+    """字符 2-gram 的 MinHash 签名（单字文本取该字本身）"""
+    grams = {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+    hashes = [int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big") for g in grams]
+    return tuple(min((a * h + b) % _MINHASH_PRIME for h in hashes) for a, b in MINHASH_PARAMS)
+
+
+def cluster_comments(normalized: list) -> list:
+    """
+    近似重复分组：按顺序把每条评论并入签名最相近（估计相似度 ≥ CLUSTER_THRESHOLD）的已有组，
+    否则自成一组。返回与输入对齐的组长下标；空文本和过长的评论不参与归并
+    """
+    leaders = []
+    result = []
+    for idx, text in enumerate(normalized):
+        if not text or len(text) > CLUSTER_MAX_CHARS:
+            result.append(idx)
+            continue
+        signature = minhash_signature(text)
+        best, best_score = idx, CLUSTER_THRESHOLD
+        for leader, leader_signature in leaders:
+            if normalized[leader] == text:
+                best = leader
+                break
+            score = sum(x == y for x, y in zip(signature, leader_signature)) / MINHASH_PERMUTATIONS
+            if score >= best_score:
+                best, best_score = leader, score
+        if best == idx:
+            leaders.append((idx, signature))
+        result.append(best)
+    return result
+
+
+def vary_reply(reply: str, n: int) -> str:
+    """同一条回复的第 n 个变体（n=0 为原文）：换结尾语气词/表情，必要时加前缀"""
+    if n <= 0:
+        return reply
+    base = reply.rstrip("～~！!。. ")
+    variants = [f"{'' if base.startswith(prefix.strip()) else prefix}{base}{suffix}"
+                for prefix in VARIANT_PREFIXES for suffix in VARIANT_SUFFIXES]
+    variants = [v for v in dict.fromkeys(variants) if v != reply]
+    return variants[(n - 1) % len(variants)]
+
+
+def persona_hash(persona_text: str) -> str:
+    return hashlib.sha256(persona_text.encode("utf-8")).hexdigest()[:16]
+
+
+class ReplyCache:
+    """已生成回复的本地缓存：键为归一化评论 + 笔记 ID + 人设哈希，过期按 TTL，超出容量淘汰最久未用的"""
+
+    def __init__(self, cache_file: Path = REPLY_CACHE_FILE, ttl: float = REPLY_CACHE_TTL,
+                 max_entries: int = REPLY_CACHE_MAX_ENTRIES):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        try:
+            self.entries = json.loads(cache_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def key(note_id: str, persona_digest: str, normalized: str) -> str:
+        return hashlib.sha256(f"{note_id}\n{persona_digest}\n{normalized}".encode("utf-8")).hexdigest()[:32]
+
+    def get(self, key: str) -> dict | None:
+        """命中返回条目 {"reply", "uses", ...}（uses 为已用掉的变体数），过期视为未命中"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        if now - entry["created_at"] > self.ttl:
+            del self.entries[key]
+            return None
+        entry["used_at"] = now
+        return entry
+
+    def put(self, key: str, reply: str, uses: int = 0):
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is None or entry["reply"] != reply:
+            entry = self.entries[key] = {"reply": reply, "uses": 0, "created_at": now}
+        entry["uses"] = max(entry["uses"], uses)
+        entry["used_at"] = now
+
+    def merge(self, entries: dict):
+        """并入另一份缓存内容：同一回复取较大的 uses 与较新的使用时间，回复不同时保留较新生成的"""
+        for key, theirs in entries.items():
+            ours = self.entries.get(key)
+            if ours is None:
+                self.entries[key] = theirs
+            elif ours["reply"] == theirs["reply"]:
+                ours["uses"] = max(ours["uses"], theirs["uses"])
+                ours["used_at"] = max(ours["used_at"], theirs["used_at"])
+            elif theirs["created_at"] > ours["created_at"]:
+                self.entries[key] = theirs
+
+    def save(self):
+        """在文件锁内与磁盘上的内容合并后写回，同时运行的 auto-reply（守护进程内外）不会互相覆盖"""
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_file.with_name(f"{self.cache_file.name}.lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                on_disk = json.loads(self.cache_file.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                on_disk = {}
+            if isinstance(on_disk, dict):
+                self.merge(on_disk)
+            now = time.time()
+            live = [(k, e) for k, e in self.entries.items() if now - e["created_at"] <= self.ttl]
+            live.sort(key=lambda item: item[1]["used_at"], reverse=True)
+            self.entries = dict(live[:self.max_entries])
+            tmp_path = self.cache_file.with_name(f"{self.cache_file.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(self.entries, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, self.cache_file)
+
+
+_reply_cache: ReplyCache | None = None
+
+
+def get_reply_cache() -> ReplyCache:
+    """进程内共用一个回复缓存（守护进程中并发的命令看到彼此的条目和 uses）"""
+    global _reply_cache
+    if _reply_cache is None:
+        _reply_cache = ReplyCache()
+    return _reply_cache
 
 
 # ─── Commands ───
+# 每个命令在传入的标签页上执行并返回输出的 JSON，失败时抛出 CommandError；
+# 直连模式（run_direct）和守护进程（serve_daemon）共用这些函数
 
-async def cmd_list_comments(note_id: str, limit: int = 20):
-    pw, browser = await connect_browser()
-    try:
-        page = await get_page(browser)
-        await inject_stealth(page)
+class CommandError(Exception):
+    """命令失败：result 为输出的 JSON，exit_code 为退出码"""
 
-        url = f"https://www.xiaohongshu.com/explore/{note_id}"
-        await page.goto(url, wait_until="domcontentloaded", timeout=15000)
-        await page.wait_for_timeout(3000)
+    def __init__(self, result: dict, exit_code: int = 3):
+        super().__init__(result.get("error", ""))
+        self.result = result
+        self.exit_code = exit_code
 
-        # Scroll down to load comments
-        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-        await page.wait_for_timeout(2000)
 
-        my_nickname = await page.evaluate(EXTRACT_MY_NICKNAME_JS)
-        comments = await page.evaluate(EXTRACT_COMMENTS_JS, {"myNickname": my_nickname, "limit": limit})
-        note_info = await page.evaluate(EXTRACT_NOTE_INFO_JS)
+async def cmd_list_comments(page, note_id: str, limit: int = 20) -> dict:
+    url = f"https://www.xiaohongshu.com/explore/{note_id}"
+    await page.goto(url, wait_until="domcontentloaded", timeout=15000)
+    await page.wait_for_timeout(3000)
 
-        result = {
-            "ok": True,
-            "note_id": note_id,
-            "note_info": note_info,
-            "my_nickname": my_nickname,
-            "comments_count": len(comments),
-            "comments": comments
-        }
-        print(json.dumps(result, ensure_ascii=False, indent=2))
+    # Scroll down to load comments
+    await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+    await page.wait_for_timeout(2000)
 
-    except Exception as e:
-        print(json.dumps({"ok": False, "error": str(e)}))
-        sys.exit(3)
-    finally:
-        await pw.stop()
+    my_nickname = await page.evaluate(EXTRACT_MY_NICKNAME_JS)
+    comments = await page.evaluate(EXTRACT_COMMENTS_JS, {"myNickname": my_nickname, "limit": limit})
+    note_info = await page.evaluate(EXTRACT_NOTE_INFO_JS)
 
+    return {
+        "ok": True,
+        "note_id": note_id,
+        "note_info": note_info,
+        "my_nickname": my_nickname,
+        "comments_count": len(comments),
+        "comments": comments
+    }
 
-async def cmd_notifications():
-    pw, browser = await connect_browser()
-    try:
-        page = await get_page(browser)
-        await inject_stealth(page)
 
-        await page.goto("https://www.xiaohongshu.com/notification",
-                        wait_until="domcontentloaded", timeout=15000)
-        await page.wait_for_timeout(3000)
+async def cmd_notifications(page) -> dict:
+    await page.goto("https://www.xiaohongshu.com/notification",
+                    wait_until="domcontentloaded", timeout=15000)
+    await page.wait_for_timeout(3000)
 
-        notifications = await page.evaluate("""() => {
-            const results = [];
-            const items = document.querySelectorAll(
-                '.notification-item, [class*="notify"], [class*="notification"], .message-item'
-            );
-            if (items.length === 0) {
-                const body = document.querySelector('.main, .content, [class*="notification"]');
-                if (body) {
-                    return [{type: "raw_text", content: body.innerText.substring(0, 3000)}];
-                }
-                return [{type: "error", message: "No notification elements found"}];
-            }
-            for (let i = 0; i < Math.min(items.length, 30); i++) {
-                const el = items[i];
-                const userEl = el.querySelector('.user-name, .nickname, [class*="name"]');
-                const contentEl = el.querySelector('.content, .text, [class*="content"]');
-                const timeEl = el.querySelector('.time, .date, [class*="time"]');
-                results.push({
-                    index: i + 1,
-                    user: userEl ? userEl.textContent.trim() : "unknown",
-                    content: contentEl ? contentEl.textContent.trim() : el.innerText.trim().substring(0, 200),
-                    time: timeEl ? timeEl.textContent.trim() : "",
-                    type: "structured"
-                });
+    notifications = await page.evaluate("""() => {
+        const results = [];
+        const items = document.querySelectorAll(
+            '.notification-item, [class*="notify"], [class*="notification"], .message-item'
+        );
+        if (items.length === 0) {
+            const body = document.querySelector('.main, .content, [class*="notification"]');
+            if (body) {
+                return [{type: "raw_text", content: body.innerText.substring(0, 3000)}];
             }
-            return results;
-        }""")
+            return [{type: "error", message: "No notification elements found"}];
+        }
+        for (let i = 0; i < Math.min(items.length, 30); i++) {
+            const el = items[i];
+            const userEl = el.querySelector('.user-name, .nickname, [class*="name"]');
+            const contentEl = el.querySelector('.content, .text, [class*="content"]');
+            const timeEl = el.querySelector('.time, .date, [class*="time"]');
+            results.push({
+                index: i + 1,
+                user: userEl ? userEl.textContent.trim() : "unknown",
+                content: contentEl ? contentEl.textContent.trim() : el.innerText.trim().substring(0, 200),
+                time: timeEl ? timeEl.textContent.trim() : "",
+                type: "structured"
+            });
+        }
+        return results;
+    }""")
 
-        print(json.dumps({"ok": True, "count": len(notifications), "notifications": notifications},
-                         ensure_ascii=False, indent=2))
-    except Exception as e:
-        print(json.dumps({"ok": False, "error": str(e)}))
-        sys.exit(3)
-    finally:
-        await pw.stop()
+    return {"ok": True, "count": len(notifications), "notifications": notifications}
 
 
-async def cmd_reply_single(note_id: str, comment_text: str, body: str, confirm: bool):
-    pw, browser = await connect_browser()
-    try:
-        page = await get_page(browser)
-        await inject_stealth(page)
-
-        url = f"https://www.xiaohongshu.com/explore/{note_id}"
-        await page.goto(url, wait_until="domcontentloaded", timeout=15000)
-        await page.wait_for_timeout(3000)
-
-        if not confirm:
-            print(json.dumps({
-                "ok": True, "status": "preview", "note_id": note_id,
-                "target_comment": comment_text[:50], "reply_body": body,
-                "message": "Pass --confirm to send."
-            }, ensure_ascii=False))
-            return
+async def cmd_reply_single(page, note_id: str, comment_text: str, body: str, confirm: bool) -> dict:
+    url = f"https://www.xiaohongshu.com/explore/{note_id}"
+    await page.goto(url, wait_until="domcontentloaded", timeout=15000)
+    await page.wait_for_timeout(3000)
 
-        success = await _do_reply_on_page(page, comment_text, body)
-        print(json.dumps(success, ensure_ascii=False))
+    if not confirm:
+        return {
+            "ok": True, "status": "preview", "note_id": note_id,
+            "target_comment": comment_text[:50], "reply_body": body,
+            "message": "Pass --confirm to send."
+        }
 
-    except Exception as e:
-        print(json.dumps({"ok": False, "error": str(e)}))
-        sys.exit(3)
-    finally:
-        await pw.stop()
+    return await _do_reply_on_page(page, comment_text, body)
 
 
 async def _do_reply_on_page(page, comment_text: str, body: str) -> dict:
@@ -582,15 +1057,21 @@ async def _do_reply_on_page(page, comment_text: str, body: str) -> dict:
         return {"ok": False, "error": "Send button not found or disabled"}
 
 
-async def cmd_auto_reply(note_id: str, confirm: bool, persona_path: str,
-                         max_replies: int, delay_seconds: float):
+async def cmd_auto_reply(page, note_id: str, confirm: bool, persona_path: str,
+                         max_replies: int, delay_seconds: float,
+                         concurrency: int = DEFAULT_GENERATE_CONCURRENCY, batch_size: int = 1,
+                         hedge_ms: float = None, reply_cache: bool = True, cluster: bool = True) -> dict:
     """
     自动回复笔记下所有未回复的评论。
 
     流程：
     1. 打开笔记页，滚动加载评论
     2. 提取所有评论，识别哪些已被自己回复过
-    3. 对未回复的评论，逐条用 AI 生成回复
+    3. 对未回复的评论并发用 AI 生成回复（最多 concurrency 条同时进行，计划保持评论顺序，
+       单条生成出错只标记该条失败）；batch_size > 1 时每批 batch_size 条合成一次调用，
+       批量结果缺失/无效的条目再逐条生成。
+       生成前先查回复缓存（reply_cache），未命中的近似重复评论（cluster）每组只生成一次，
+       组内其余评论和缓存命中的评论用本地变体回复，避免一模一样；变体用完的评论重新生成
     4. 预览模式：输出回复计划（JSON）
     5. 确认模式：逐条执行回复（带随机间隔防风控）
     """
@@ -603,255 +1084,599 @@ async def cmd_auto_reply(note_id: str, confirm: bool, persona_path: str,
     else:
         persona_text = "你是一个友善活泼的小红书博主，回复风格简短口语化。"
 
-    pw, browser = await connect_browser()
-    try:
-        page = await get_page(browser)
-        await inject_stealth(page)
-
-        url = f"https://www.xiaohongshu.com/explore/{note_id}"
-        await page.goto(url, wait_until="domcontentloaded", timeout=15000)
-        await page.wait_for_timeout(3000)
-
-        # 滚动加载更多评论
-        for _ in range(3):
-            await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            await page.wait_for_timeout(1500)
-
-        # 获取自己的昵称
-        my_nickname = await page.evaluate(EXTRACT_MY_NICKNAME_JS)
-        # Fallback: 从笔记作者获取
-        if not my_nickname:
-            note_info = await page.evaluate(EXTRACT_NOTE_INFO_JS)
-            my_nickname = note_info.get("author", "")
-        else:
-            note_info = await page.evaluate(EXTRACT_NOTE_INFO_JS)
-
-        if not my_nickname:
-            print(json.dumps({
-                "ok": False,
-                "error": "Cannot determine your nickname. Please ensure you're logged in.",
-                "hint": "Try: bash scripts/xhs_run.sh xhs_comment list --note-id " + note_id
-            }))
-            sys.exit(3)
-
-        # 提取评论
-        comments = await page.evaluate(EXTRACT_COMMENTS_JS, {
-            "myNickname": my_nickname, "limit": 50
-        })
-
-        if not comments or (len(comments) == 1 and comments[0].get("type") == "error"):
-            print(json.dumps({
-                "ok": True,
-                "note_id": note_id,
-                "my_nickname": my_nickname,
-                "message": "No comments found on this note.",
-                "unreplied_count": 0,
-                "plan": []
-            }, ensure_ascii=False, indent=2))
-            return
-
-        # 筛选未回复的评论（排除自己发的评论，排除已回复的）
-        unreplied = []
-        for c in comments:
-            if c.get("type") != "structured":
-                continue
-            if c.get("is_my_comment"):
-                continue
-            if c.get("has_my_reply"):
-                continue
-            unreplied.append(c)
-
-        if not unreplied:
-            print(json.dumps({
-                "ok": True,
-                "note_id": note_id,
-                "my_nickname": my_nickname,
-                "message": "All comments have been replied to!",
-                "total_comments": len(comments),
-                "unreplied_count": 0,
-                "plan": []
-            }, ensure_ascii=False, indent=2))
-            return
+    url = f"https://www.xiaohongshu.com/explore/{note_id}"
+    await page.goto(url, wait_until="domcontentloaded", timeout=15000)
+    await page.wait_for_timeout(3000)
 
-        # 限制回复数量
-        to_reply = unreplied[:max_replies]
-
-        # 为每条生成 AI 回复
-        plan = []
-        log_info = lambda msg: print(json.dumps({"log": msg}), file=sys.stderr, flush=True)
-
-        for idx, c in enumerate(to_reply):
-            log_info(f"Generating reply {idx+1}/{len(to_reply)} for: {c['user']}")
-            ai_reply = generate_reply_with_ai(
-                comment_user=c["user"],
-                comment_content=c["content"],
-                note_title=note_info.get("title", ""),
-                note_desc=note_info.get("desc", ""),
-                persona_text=persona_text
-            )
-            plan.append({
-                "index": idx + 1,
-                "comment_user": c["user"],
-                "comment_content": c["content"][:100],
-                "generated_reply": ai_reply,
-                "status": "pending"
-            })
-
-        if not confirm:
-            # 预览模式：输出计划
-            result = {
-                "ok": True,
-                "status": "preview",
-                "note_id": note_id,
-                "note_title": note_info.get("title", ""),
-                "my_nickname": my_nickname,
-                "total_comments": len(comments),
-                "unreplied_count": len(unreplied),
-                "plan_count": len(plan),
-                "plan": plan,
-                "message": "Pass --confirm to execute all replies."
-            }
-            print(json.dumps(result, ensure_ascii=False, indent=2))
-            return
-
-        # 确认模式：逐条执行回复
-        log_info(f"Starting auto-reply: {len(plan)} replies to send")
-        results = []
+    # 滚动加载更多评论
+    for _ in range(3):
+        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        await page.wait_for_timeout(1500)
 
-        for item in plan:
-            comment_text = item["comment_content"]
-            reply_body = item["generated_reply"]
+    # 获取自己的昵称
+    my_nickname = await page.evaluate(EXTRACT_MY_NICKNAME_JS)
+    # Fallback: 从笔记作者获取
+    if not my_nickname:
+        note_info = await page.evaluate(EXTRACT_NOTE_INFO_JS)
+        my_nickname = note_info.get("author", "")
+    else:
+        note_info = await page.evaluate(EXTRACT_NOTE_INFO_JS)
 
-            log_info(f"Replying to {item['comment_user']}: {reply_body[:30]}...")
+    if not my_nickname:
+        raise CommandError({
+            "ok": False,
+            "error": "Cannot determine your nickname. Please ensure you're logged in.",
+            "hint": "Try: bash scripts/xhs_run.sh xhs_comment list --note-id " + note_id
+        })
 
-            reply_result = await _do_reply_on_page(page, comment_text, reply_body)
+    # 提取评论
+    comments = await page.evaluate(EXTRACT_COMMENTS_JS, {
+        "myNickname": my_nickname, "limit": 50
+    })
 
-            item["status"] = "sent" if reply_result.get("ok") else "failed"
-            item["error"] = reply_result.get("error")
-            results.append(item)
+    if not comments or (len(comments) == 1 and comments[0].get("type") == "error"):
+        return {
+            "ok": True,
+            "note_id": note_id,
+            "my_nickname": my_nickname,
+            "message": "No comments found on this note.",
+            "unreplied_count": 0,
+            "plan": []
+        }
 
-            if reply_result.get("ok"):
-                # 随机延迟防风控
-                actual_delay = delay_seconds + random.uniform(0, delay_seconds * 0.5)
-                log_info(f"Success. Waiting {actual_delay:.1f}s before next...")
-                await page.wait_for_timeout(int(actual_delay * 1000))
-            else:
-                log_info(f"Failed: {reply_result.get('error')}. Continuing...")
-                # 失败后也等一下
-                await page.wait_for_timeout(3000)
-
-        # 保存回复日志
-        REPLY_LOG_DIR.mkdir(parents=True, exist_ok=True)
-        log_file = REPLY_LOG_DIR / f"{note_id}_{int(time.time())}.json"
-        log_data = {
+    # 筛选未回复的评论（排除自己发的评论，排除已回复的）
+    unreplied = []
+    for c in comments:
+        if c.get("type") != "structured":
+            continue
+        if c.get("is_my_comment"):
+            continue
+        if c.get("has_my_reply"):
+            continue
+        unreplied.append(c)
+
+    if not unreplied:
+        return {
+            "ok": True,
             "note_id": note_id,
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
             "my_nickname": my_nickname,
-            "replies": results
+            "message": "All comments have been replied to!",
+            "total_comments": len(comments),
+            "unreplied_count": 0,
+            "plan": []
         }
-        log_file.write_text(json.dumps(log_data, ensure_ascii=False, indent=2))
 
-        sent_count = sum(1 for r in results if r["status"] == "sent")
-        failed_count = sum(1 for r in results if r["status"] == "failed")
+    # 限制回复数量
+    to_reply = unreplied[:max_replies]
+    log_info = log_event
+
+    # 先查缓存，未命中的按近似重复分组，每组只让组长调用模型
+    cache = get_reply_cache() if reply_cache else None
+    persona_digest = persona_hash(persona_text)
+    normalized = [normalize_comment(c["content"]) for c in to_reply]
+    keys = [ReplyCache.key(note_id, persona_digest, text) if text else None for text in normalized]
+    cached = [cache.get(key) if cache and key else None for key in keys]
+    misses = [idx for idx, entry in enumerate(cached) if entry is None]
+    if cluster:
+        grouping = cluster_comments([normalized[idx] for idx in misses])
+        leader_of = {idx: misses[leader] for idx, leader in zip(misses, grouping)}
+    else:
+        leader_of = {idx: idx for idx in misses}
+    to_generate = [to_reply[idx] for idx in misses if leader_of[idx] == idx]
+    log_info(f"{len(to_reply) - len(misses)} cache hits, {len(misses) - len(to_generate)} near-duplicates, "
+             f"{len(to_generate)} replies to generate")
+
+    # 为每组生成 AI 回复
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def generate(idx: int, c: dict, total: int):
+        async with semaphore:
+            log_info(f"Generating reply {idx+1}/{total} for: {c['user']}")
+            try:
+                return [(await generate_reply_with_ai(
+                    comment_user=c["user"],
+                    comment_content=c["content"],
+                    note_title=note_info.get("title", ""),
+                    note_desc=note_info.get("desc", ""),
+                    persona_text=persona_text,
+                    tag=f"[{idx+1}/{total}] ",
+                    hedge_ms=hedge_ms
+                ), "single")]
+            except Exception as e:
+                log_info(f"[{idx+1}/{total}] Reply generation failed: {e}")
+                return [(e, "single")]
+
+    async def generate_batch(start: int, batch: list):
+        async with semaphore:
+            tag = f"[{start+1}-{start+len(batch)}/{len(to_generate)}] "
+            log_info(f"{tag}Generating {len(batch)} replies in one call")
+            try:
+                return await generate_replies_batched(
+                    batch, note_info.get("title", ""), note_info.get("desc", ""), persona_text, tag, hedge_ms
+                )
+            except Exception as e:
+                log_info(f"{tag}Batch generation failed: {e}")
+                return [(e, "batch")] * len(batch)
+
+    if batch_size > 1:
+        batches = [(start, to_generate[start:start + batch_size])
+                   for start in range(0, len(to_generate), batch_size)]
+        grouped = await asyncio.gather(*(generate_batch(start, batch) for start, batch in batches))
+    else:
+        grouped = await asyncio.gather(*(generate(idx, c, len(to_generate)) for idx, c in enumerate(to_generate)))
+    generated = dict(zip((idx for idx in misses if leader_of[idx] == idx),
+                         (reply for group in grouped for reply in group)))
+
+    # 组装计划：缓存命中和组员复用同一条回复时依次取变体，保证本次发出的回复互不相同
+    plan = []
+    sent_texts = set()
+    cluster_sizes = {}
+    for leader in leader_of.values():
+        cluster_sizes[leader] = cluster_sizes.get(leader, 0) + 1
+    exhausted = []  # 变体已用完、需要重新生成的评论下标
+    cache_uses = {}  # 下标 → (缓存键, 回复原文, 变体序号)；确认模式下发送成功才记入缓存的 uses
+    variant_limit = len(VARIANT_PREFIXES) * len(VARIANT_SUFFIXES)
+
+    def pick_variant(reply: str, start: int) -> Optional[int]:
+        """从第 start 个变体起取本次还没用过的一个；所有变体都用过时返回 None"""
+        for n in range(start, start + variant_limit + 1):
+            text = vary_reply(reply, n)
+            if text not in sent_texts:
+                sent_texts.add(text)
+                return n
+        return None
+
+    def assign(idx: int, item: dict, reply: str, start: int, generation: str) -> bool:
+        n = pick_variant(reply, start)
+        if n is None:
+            return False
+        item.update(generated_reply=vary_reply(reply, n), generation=generation)
+        # 模板兜底的回复不入缓存
+        if cache and keys[idx] and reply not in FALLBACK_REPLIES:
+            if generation != "cache":
+                cache.put(keys[idx], reply)
+            cache_uses[idx] = (keys[idx], reply, n)
+        return True
+
+    for idx, c in enumerate(to_reply):
+        item = {
+            "index": idx + 1,
+            "comment_user": c["user"],
+            "comment_content": c["content"][:100],
+            "status": "pending"
+        }
+        plan.append(item)
+        if cached[idx] is not None:
+            entry = cached[idx]
+            if not assign(idx, item, entry["reply"], entry["uses"], "cache"):
+                exhausted.append(idx)
+            continue
+        leader = leader_of[idx]
+        ai_reply, generation = generated[leader]
+        if leader != idx:
+            generation = "cluster"
+        if cluster_sizes[leader] > 1:
+            item["cluster"] = leader + 1
+        if isinstance(ai_reply, Exception):
+            item.update(generated_reply=None, generation=generation, status="failed",
+                        error=f"Reply generation failed: {ai_reply}")
+        elif not assign(idx, item, ai_reply, 0, generation):
+            exhausted.append(idx)
+
+    if exhausted:
+        log_info(f"{len(exhausted)} replies ran out of variants, generating fresh ones")
+        fresh = await asyncio.gather(*(generate(i, to_reply[idx], len(exhausted))
+                                       for i, idx in enumerate(exhausted)))
+        for idx, [(ai_reply, generation)] in zip(exhausted, fresh):
+            item = plan[idx]
+            if isinstance(ai_reply, Exception):
+                item.update(generated_reply=None, generation=generation, status="failed",
+                            error=f"Reply generation failed: {ai_reply}")
+            elif not assign(idx, item, ai_reply, 0, generation):
+                item.update(generated_reply=None, generation=generation, status="failed",
+                            error="No distinct reply left for this comment")
+    if cache:
+        cache.save()
+
+    dedupe = {
+        "cache_hits": len(to_reply) - len(misses),
+        "cluster_hits": len(misses) - len(to_generate),
+        "clusters": sum(1 for size in cluster_sizes.values() if size > 1),
+        "generated": len(to_generate),
+    }
 
-        final_result = {
+    if not confirm:
+        # 预览模式：输出计划
+        return {
             "ok": True,
-            "status": "completed",
+            "status": "preview",
             "note_id": note_id,
+            "note_title": note_info.get("title", ""),
+            "my_nickname": my_nickname,
             "total_comments": len(comments),
-            "unreplied_before": len(unreplied),
-            "attempted": len(results),
-            "sent": sent_count,
-            "failed": failed_count,
-            "log_file": str(log_file),
-            "results": results
+            "unreplied_count": len(unreplied),
+            "plan_count": len(plan),
+            **dedupe,
+            "plan": plan,
+            "message": "Pass --confirm to execute all replies."
         }
-        print(json.dumps(final_result, ensure_ascii=False, indent=2))
 
-    except Exception as e:
-        print(json.dumps({"ok": False, "error": str(e)}))
-        sys.exit(3)
-    finally:
-        await pw.stop()
+    # 确认模式：逐条执行回复
+    log_info(f"Starting auto-reply: {len(plan)} replies to send")
+    results = []
+
+    for item in plan:
+        if item["status"] == "failed":
+            results.append(item)
+            continue
+
+        comment_text = item["comment_content"]
+        reply_body = item["generated_reply"]
+
+        log_info(f"Replying to {item['comment_user']}: {reply_body[:30]}...")
+
+        reply_result = await _do_reply_on_page(page, comment_text, reply_body)
+
+        item["status"] = "sent" if reply_result.get("ok") else "failed"
+        item["error"] = reply_result.get("error")
+        results.append(item)
+
+        if reply_result.get("ok"):
+            if item["index"] - 1 in cache_uses:
+                # 发出去才算用掉这个变体，下次从下一个变体开始
+                key, reply, n = cache_uses[item["index"] - 1]
+                cache.put(key, reply, n + 1)
+                cache.save()
+            # 随机延迟防风控
+            actual_delay = delay_seconds + random.uniform(0, delay_seconds * 0.5)
+            log_info(f"Success. Waiting {actual_delay:.1f}s before next...")
+            await page.wait_for_timeout(int(actual_delay * 1000))
+        else:
+            log_info(f"Failed: {reply_result.get('error')}. Continuing...")
+            # 失败后也等一下
+            await page.wait_for_timeout(3000)
+
+    # 保存回复日志
+    REPLY_LOG_DIR.mkdir(parents=True, exist_ok=True)
+    log_file = REPLY_LOG_DIR / f"{note_id}_{int(time.time())}.json"
+    log_data = {
+        "note_id": note_id,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "my_nickname": my_nickname,
+        "replies": results
+    }
+    log_file.write_text(json.dumps(log_data, ensure_ascii=False, indent=2))
+
+    sent_count = sum(1 for r in results if r["status"] == "sent")
+    failed_count = sum(1 for r in results if r["status"] == "failed")
+
+    return {
+        "ok": True,
+        "status": "completed",
+        "note_id": note_id,
+        "total_comments": len(comments),
+        "unreplied_before": len(unreplied),
+        "attempted": len(results),
+        "sent": sent_count,
+        "failed": failed_count,
+        **dedupe,
+        "log_file": str(log_file),
+        "results": results
+    }
 
 
 # ─── Post new top-level comment (verified 2026-02-25) ───
 
-async def cmd_post_comment(note_id: str, body: str, confirm: bool):
-    """在指定笔记下发表新评论（非回复）。"""
+async def cmd_post_comment(page, note_id: str, body: str, confirm: bool) -> dict:
+    """在指定笔记下发表新评论（非回复）。预览时不使用 page（可为 None）。"""
 
     if not confirm:
-        print(json.dumps({
+        return {
             "ok": True,
             "status": "preview",
             "note_id": note_id,
             "comment": body,
             "message": "Pass --confirm to actually post."
-        }, ensure_ascii=False, indent=2))
-        return
+        }
+
+    url = f"https://www.xiaohongshu.com/explore/{note_id}"
+    await page.goto(url, wait_until="domcontentloaded", timeout=15000)
+    await page.wait_for_timeout(3000)
+
+    # 输入评论 — 使用验证过的 #content-textarea + execCommand
+    typed = await page.evaluate("""(text) => {
+        const el = document.querySelector('#content-textarea');
+        if (!el) return {ok: false, error: "content-textarea not found"};
+        el.focus();
+        el.textContent = '';
+        document.execCommand('insertText', false, text);
+        const success = el.textContent.includes(text.slice(0, 10));
+        return {ok: success, text: el.textContent.slice(0, 50)};
+    }""", body)
+
+    if not typed.get("ok"):
+        raise CommandError({"ok": False, "error": "Failed to type comment", "detail": typed})
+
+    await page.wait_for_timeout(800)
 
-    pw, browser = await connect_browser()
+    # 点击发送按钮
+    sent = await page.evaluate("""() => {
+        const btns = [...document.querySelectorAll('button')];
+        const btn = btns.find(b => b.textContent.trim() === '发送' && !b.disabled);
+        if (btn) { btn.click(); return {sent: true}; }
+        return {sent: false, disabled_found: btns.some(b => b.textContent.trim() === '发送')};
+    }""")
+
+    await page.wait_for_timeout(3000)
+
+    if not sent.get("sent"):
+        raise CommandError({
+            "ok": False,
+            "error": "Send button not found or disabled",
+            "detail": sent
+        })
+    return {
+        "ok": True,
+        "status": "posted",
+        "note_id": note_id,
+        "comment": body
+    }
+
+
+# ─── Command dispatch ───
+
+COMMANDS = {
+    "list": cmd_list_comments,
+    "notifications": cmd_notifications,
+    "reply": cmd_reply_single,
+    "comment": cmd_post_comment,
+    "auto-reply": cmd_auto_reply,
+}
+
+
+# 成功结果中单行输出的命令（其余缩进两格）；出错（退出码非零）一律单行
+COMPACT_OUTPUT_COMMANDS = {"reply"}
+
+
+def format_output(command: str, result: dict, exit_code: int) -> str:
+    """按各命令原有的格式序列化输出，调用方（脚本/管道）看到的与直接执行时一致"""
+    if exit_code:
+        return json.dumps(result)
+    if command in COMPACT_OUTPUT_COMMANDS:
+        return json.dumps(result, ensure_ascii=False)
+    return json.dumps(result, ensure_ascii=False, indent=2)
+
+
+def needs_browser(command: str, params: dict) -> bool:
+    """comment 预览不需要浏览器"""
+    return not (command == "comment" and not params.get("confirm"))
+
+
+async def execute(command: str, params: dict, page) -> Tuple[dict, int]:
+    """执行命令，返回 (输出的 JSON, 退出码)"""
     try:
-        page = await get_page(browser)
-        await inject_stealth(page)
-
-        url = f"https://www.xiaohongshu.com/explore/{note_id}"
-        await page.goto(url, wait_until="domcontentloaded", timeout=15000)
-        await page.wait_for_timeout(3000)
-
-        # 输入评论 — 使用验证过的 #content-textarea + execCommand
-        typed = await page.evaluate("""(text) => {
-            const el = document.querySelector('#content-textarea');
-            if (!el) return {ok: false, error: "content-textarea not found"};
-            el.focus();
-            el.textContent = '';
-            document.execCommand('insertText', false, text);
-            const success = el.textContent.includes(text.slice(0, 10));
-            return {ok: success, text: el.textContent.slice(0, 50)};
-        }""", body)
-
-        if not typed.get("ok"):
-            print(json.dumps({"ok": False, "error": "Failed to type comment", "detail": typed}))
-            sys.exit(3)
-
-        await page.wait_for_timeout(800)
-
-        # 点击发送按钮
-        sent = await page.evaluate("""() => {
-            const btns = [...document.querySelectorAll('button')];
-            const btn = btns.find(b => b.textContent.trim() === '发送' && !b.disabled);
-            if (btn) { btn.click(); return {sent: true}; }
-            return {sent: false, disabled_found: btns.some(b => b.textContent.trim() === '发送')};
-        }""")
-
-        await page.wait_for_timeout(3000)
-
-        if sent.get("sent"):
-            print(json.dumps({
-                "ok": True,
-                "status": "posted",
-                "note_id": note_id,
-                "comment": body
-            }, ensure_ascii=False, indent=2))
-        else:
-            print(json.dumps({
-                "ok": False,
-                "error": "Send button not found or disabled",
-                "detail": sent
-            }))
-            sys.exit(3)
+        return await COMMANDS[command](page, **params), 0
+    except CommandError as e:
+        return e.result, e.exit_code
+    except Exception as e:
+        return {"ok": False, "error": str(e)}, 3
+
 
+async def run_direct(command: str, params: dict) -> Tuple[dict, int]:
+    """直连模式：本次命令单独连接浏览器，用完断开"""
+    if not needs_browser(command, params):
+        return await execute(command, params, None)
+    try:
+        pw, browser = await connect_browser()
     except Exception as e:
-        print(json.dumps({"ok": False, "error": str(e)}))
-        sys.exit(3)
+        return {"ok": False, "error": f"CDP connect failed: {e}"}, 2
+    try:
+        try:
+            page = await get_page(browser)
+            await inject_stealth(page)
+        except Exception as e:
+            return {"ok": False, "error": str(e)}, 3
+        return await execute(command, params, page)
     finally:
         await pw.stop()
 
 
+# ─── Session daemon ───
+# 常驻进程保持一条 CDP 连接和一组自己打开的标签页（stealth 以 init script 注入，每次导航自动生效），
+# 在 Unix socket 上按行收发 JSON-RPC 2.0：
+#   → {"jsonrpc": "2.0", "id": 1, "method": "list", "params": {"note_id": "..."}}
+#   ← {"jsonrpc": "2.0", "method": "log", "params": {"msg": "..."}}        （进度日志，可有多条）
+#   ← {"jsonrpc": "2.0", "id": 1, "result": {"output": {...}, "exit_code": 0}}
+# 另有 ping（状态）与 shutdown（退出）两个方法
+
+def rpc_message(message: dict) -> bytes:
+    return (json.dumps({"jsonrpc": "2.0", **message}, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def open_managed_tab(browser):
+    """
+    在浏览器的默认上下文中新开一个守护进程专用的标签页
+    有意不用独立上下文：新上下文没有小红书登录态，必须与用户手动浏览共用 cookie 和会话；
+    守护进程只操作自己开的标签页，不碰用户已打开的页面，退出时关闭
+    """
+    context = browser.contexts[0]
+    page = await context.new_page()
+    page.on("dialog", lambda d: asyncio.ensure_future(d.accept()))
+    if STEALTH_JS.exists():
+        await page.add_init_script(STEALTH_JS.read_text())
+    return page
+
+
+async def serve_daemon(socket_path: Path = DAEMON_SOCKET, tab_count: int = DEFAULT_DAEMON_TABS):
+    """
+    运行守护进程直到收到 shutdown / SIGTERM / Ctrl+C
+    浏览器断开后下一条命令自动重连并重建标签页；标签页被手动关掉时补开一个
+    """
+    if await call_daemon("ping", {}, socket_path) is not None:
+        print(json.dumps({"ok": False, "error": f"Daemon already running on {socket_path}"}))
+        sys.exit(1)
+
+    loop = asyncio.get_running_loop()
+    session = {"pw": None, "browser": None, "generation": 0}
+    tabs: asyncio.Queue = asyncio.Queue()
+    connect_lock = asyncio.Lock()
+    stopped = asyncio.Event()
+    started = time.time()
+    served = {"commands": 0}
+
+    async def ensure_session():
+        async with connect_lock:
+            if session["browser"] is not None and session["browser"].is_connected():
+                return
+            if session["pw"] is not None:
+                await session["pw"].stop()
+                session["pw"] = session["browser"] = None
+            session["pw"], session["browser"] = await connect_browser()
+            session["generation"] += 1
+            while not tabs.empty():
+                tabs.get_nowait()
+            for _ in range(tab_count):
+                tabs.put_nowait((session["generation"], await open_managed_tab(session["browser"])))
+            log_event(f"Connected to {CDP_ENDPOINT} with {tab_count} tabs")
+
+    async def acquire_tab():
+        while True:
+            await ensure_session()
+            generation, page = await tabs.get()
+            if generation != session["generation"]:
+                continue
+            if page.is_closed():
+                page = await open_managed_tab(session["browser"])
+            return generation, page
+
+    def release_tab(generation: int, page):
+        # 重连前打开的标签页不再放回（重连时已补足）
+        if generation == session["generation"]:
+            tabs.put_nowait((generation, page))
+
+    async def run_command(command: str, params: dict) -> Tuple[dict, int]:
+        if not needs_browser(command, params):
+            return await execute(command, params, None)
+        try:
+            generation, page = await acquire_tab()
+        except Exception as e:
+            return {"ok": False, "error": f"CDP connect failed: {e}"}, 2
+        try:
+            return await execute(command, params, page)
+        finally:
+            release_tab(generation, page)
+
+    async def handle(reader, writer):
+        def send(message: dict):
+            if not writer.is_closing():
+                writer.write(rpc_message(message))
+
+        # 日志可能来自生成回复的线程，统一切回事件循环再写
+        _log_sink.set(lambda msg: loop.call_soon_threadsafe(send, {"method": "log", "params": {"msg": msg}}))
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    method = request["method"]
+                    params = request.get("params") or {}
+                except (ValueError, KeyError, TypeError):
+                    send({"id": None, "error": {"code": -32700, "message": "Parse error"}})
+                    await writer.drain()
+                    continue
+                request_id = request.get("id")
+
+                if method == "ping":
+                    send({"id": request_id, "result": {
+                        "ok": True, "pid": os.getpid(), "socket": str(socket_path),
+                        "connected": bool(session["browser"] and session["browser"].is_connected()),
+                        "tabs": tab_count, "commands_served": served["commands"],
+                        "uptime_seconds": round(time.time() - started),
+                    }})
+                elif method == "shutdown":
+                    send({"id": request_id, "result": {"ok": True, "status": "stopping"}})
+                    stopped.set()
+                elif method not in COMMANDS:
+                    send({"id": request_id, "error": {"code": -32601, "message": f"Unknown method: {method}"}})
+                else:
+                    output, exit_code = await run_command(method, params)
+                    served["commands"] += 1
+                    send({"id": request_id, "result": {"output": output, "exit_code": exit_code}})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    if socket_path.exists():
+        socket_path.unlink()
+    server = await asyncio.start_unix_server(handle, path=str(socket_path), limit=RPC_LINE_LIMIT)
+    os.chmod(socket_path, 0o600)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+
+    try:
+        await ensure_session()
+    except Exception as e:
+        # 浏览器暂时没起来也先监听，收到命令时再连
+        log_event(f"CDP connect failed: {e}. Will retry on first command")
+    print(json.dumps({"ok": True, "status": "listening", "socket": str(socket_path), "pid": os.getpid()}),
+          flush=True)
+
+    try:
+        await stopped.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        while not tabs.empty():
+            _, page = tabs.get_nowait()
+            if not page.is_closed():
+                await page.close()
+        if session["pw"] is not None:
+            await session["pw"].stop()
+        if socket_path.exists():
+            socket_path.unlink()
+
+
+async def call_daemon(method: str, params: dict, socket_path: Path = DAEMON_SOCKET) -> Optional[Tuple[dict, int]]:
+    """
+    把命令交给守护进程，返回 (输出的 JSON, 退出码)；ping/shutdown 返回 (结果, 0)
+    连不上守护进程时返回 None，由调用方改走直连（已连上后中途断开则报错，不会重复执行）
+    """
+    try:
+        reader, writer = await asyncio.open_unix_connection(str(socket_path), limit=RPC_LINE_LIMIT)
+    except (OSError, AttributeError, NotImplementedError):
+        return None
+
+    try:
+        writer.write(rpc_message({"id": 1, "method": method, "params": params}))
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                return {"ok": False, "error": "Daemon closed the connection"}, 2
+            message = json.loads(line)
+            if message.get("method") == "log":
+                log_event(message["params"]["msg"])
+                continue
+            if "error" in message:
+                return {"ok": False, "error": message["error"]["message"]}, 1
+            result = message["result"]
+            if method in COMMANDS:
+                return result["output"], result["exit_code"]
+            return result, 0
+    finally:
+        writer.close()
+
+
 # ─── Main ───
 
 def main():
     parser = argparse.ArgumentParser(description="小红书评论管理")
+    parser.add_argument("--direct", action="store_true",
+                        help="不经守护进程，直接连接浏览器执行")
+    parser.add_argument("--socket", default=str(DAEMON_SOCKET),
+                        help=f"守护进程 socket 路径（默认 {DAEMON_SOCKET}，可用 XHS_COMMENT_SOCKET 覆盖）")
     subparsers = parser.add_subparsers(dest="command")
 
     # list
@@ -882,28 +1707,90 @@ def main():
     p.add_argument("--persona", default="", help="人设文件路径（默认用 persona.md）")
     p.add_argument("--max-replies", type=int, default=20, help="最多回复条数（默认20）")
     p.add_argument("--delay", type=float, default=10, help="每条回复间隔秒数（默认10）")
+    p.add_argument("--concurrency", type=int, default=DEFAULT_GENERATE_CONCURRENCY,
+                   help=f"同时进行的生成调用数（默认{DEFAULT_GENERATE_CONCURRENCY}）")
+    p.add_argument("--batch-size", type=int, default=1,
+                   help="每次调用合并生成的评论数，人设只发送一次（默认1，即逐条生成）")
+    p.add_argument("--hedge-ms", type=float, default=None,
+                   help="对冲：模型调用超过该毫秒数未返回时同时调用下一个模型（默认不对冲）")
+    p.add_argument("--no-reply-cache", action="store_true",
+                   help=f"不读写回复缓存（{REPLY_CACHE_FILE.name}）")
+    p.add_argument("--no-cluster", action="store_true",
+                   help="不合并近似重复评论，每条单独生成")
+
+    # providers (模型路由健康状态)
+    p = subparsers.add_parser("providers", help="查看模型调用路径的健康状态")
+    p.add_argument("--reset", action="store_true", help="清空统计并关闭所有熔断")
+
+    # daemon (常驻会话)
+    p = subparsers.add_parser("daemon", help="启动常驻会话守护进程（前台运行）")
+    p.add_argument("--tabs", type=int, default=DEFAULT_DAEMON_TABS,
+                   help=f"守护进程管理的标签页数，即可同时执行的命令数（默认{DEFAULT_DAEMON_TABS}）")
+    p.add_argument("--status", action="store_true", help="查看守护进程状态")
+    p.add_argument("--stop", action="store_true", help="停止守护进程")
 
     args = parser.parse_args()
     if not args.command:
         parser.print_help()
         sys.exit(1)
 
+    socket_path = Path(args.socket)
+    if args.command == "providers":
+        router = get_router()
+        if args.reset:
+            router.state = {}
+            router.save()
+        ranked = router.ranked()
+        print(json.dumps({
+            "ok": True,
+            "state_file": str(router.state_file),
+            "route": ranked,
+            "providers": {name: {"available": PROVIDERS[name][2](), **router.stats(name)} for name in PROVIDERS},
+        }, ensure_ascii=False, indent=2))
+        return
+
+    if args.command == "daemon":
+        if args.status or args.stop:
+            outcome = asyncio.run(call_daemon("shutdown" if args.stop else "ping", {}, socket_path))
+            if outcome is None:
+                print(json.dumps({"ok": False, "error": f"Daemon not running on {socket_path}"}))
+                sys.exit(2)
+            print(json.dumps(outcome[0], ensure_ascii=False, indent=2))
+            return
+        asyncio.run(serve_daemon(socket_path, max(1, args.tabs)))
+        return
+
     if args.command == "list":
-        asyncio.run(cmd_list_comments(args.note_id, args.limit))
+        params = {"note_id": args.note_id, "limit": args.limit}
     elif args.command == "notifications":
-        asyncio.run(cmd_notifications())
+        params = {}
     elif args.command == "reply":
-        asyncio.run(cmd_reply_single(args.note_id, args.comment_text, args.body, args.confirm))
+        params = {"note_id": args.note_id, "comment_text": args.comment_text,
+                  "body": args.body, "confirm": args.confirm}
     elif args.command == "comment":
-        asyncio.run(cmd_post_comment(args.note_id, args.body, args.confirm))
-    elif args.command == "auto-reply":
-        asyncio.run(cmd_auto_reply(
-            note_id=args.note_id,
-            confirm=args.confirm,
-            persona_path=args.persona,
-            max_replies=args.max_replies,
-            delay_seconds=args.delay
-        ))
+        params = {"note_id": args.note_id, "body": args.body, "confirm": args.confirm}
+    else:
+        params = {
+            "note_id": args.note_id,
+            "confirm": args.confirm,
+            # 守护进程的工作目录与调用方不同，传绝对路径
+            "persona_path": str(Path(args.persona).resolve()) if args.persona else "",
+            "max_replies": args.max_replies,
+            "delay_seconds": args.delay,
+            "concurrency": args.concurrency,
+            "batch_size": args.batch_size,
+            "hedge_ms": args.hedge_ms,
+            "reply_cache": not args.no_reply_cache,
+            "cluster": not args.no_cluster,
+        }
+
+    outcome = None if args.direct else asyncio.run(call_daemon(args.command, params, socket_path))
+    if outcome is None:
+        outcome = asyncio.run(run_direct(args.command, params))
+    result, exit_code = outcome
+    print(format_output(args.command, result, exit_code))
+    if exit_code:
+        sys.exit(exit_code)
 
 
 if __name__ == "__main__":
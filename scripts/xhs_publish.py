@@ -12,9 +12,16 @@
   # 从 JSON 文件读取内容
   python3 xhs_publish.py --from-json content.json --confirm
 
+  # 从 Markdown 笔记渲染并发布（边渲染边上传，标题/正文/标签默认取自笔记）
+  python3 xhs_publish.py --from-md note.md --style xiaohongshu --confirm
+
 JSON 格式:
   {"title": "标题", "body": "正文...", "images": ["path1.png"], "tags": ["tag1", "tag2"]}
 
+Markdown 笔记（--from-md）:
+  front matter 的 title 作标题，desc（没有则 subtitle）作正文，tags 或正文末尾的 #标签 作话题；
+  命令行传入的 --title/--body/--tags 优先
+
 退出码:
   0 = 成功发布 / 预览就绪
   1 = 参数错误
@@ -27,6 +34,9 @@ import asyncio
 import json
 import sys
 import os
+import re
+import shutil
+import tempfile
 from pathlib import Path
 
 # CDP endpoint of OpenClaw's browser
@@ -45,7 +55,61 @@ async def connect_browser():
         sys.exit(2)
 
 
-async def publish(title: str, body: str, images: list[str], confirm: bool = False, dry_run: bool = False):
+def start_render_stream(md_file: str, output_dir: str, style: str) -> tuple[asyncio.Queue, asyncio.Task]:
+    """Render the note in the background; image paths are queued in order (cover first), then None.
+    A render error is queued as the exception instead of None."""
+    import render_xhs_v2 as renderer
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        # Renderer progress goes to stderr (this task only); stdout stays a single JSON result
+        with renderer.progress_output(sys.stderr):
+            try:
+                async for path in renderer.iter_card_images(md_file, output_dir, style):
+                    queue.put_nowait(path)
+                queue.put_nowait(None)
+            except Exception as e:
+                queue.put_nowait(e)
+
+    return queue, asyncio.create_task(pump())
+
+
+async def upload_images(page, images) -> int:
+    """Upload images and return how many were uploaded.
+    images is a list of paths, or a queue from start_render_stream: then each upload sends
+    every image rendered so far, so uploading overlaps with rendering the remaining cards."""
+    if not isinstance(images, asyncio.Queue):
+        file_input = page.locator('input[type="file"]').first
+        await file_input.set_input_files([str(Path(p).resolve()) for p in images])
+        return len(images)
+
+    uploaded = 0
+    finished = False
+    while not finished:
+        batch = [await images.get()]
+        while not images.empty():
+            batch.append(images.get_nowait())
+        paths = []
+        for item in batch:
+            if isinstance(item, Exception):
+                raise RuntimeError(f"render failed: {item}")
+            if item is None:
+                finished = True
+                break
+            paths.append(str(Path(item).resolve()))
+        if paths:
+            # Re-query each time: after the first upload the editor swaps in its own "add image" input
+            file_input = page.locator('input[type="file"]').first
+            await file_input.set_input_files(paths)
+            uploaded += len(paths)
+            print(json.dumps({"step": "uploaded", "images": uploaded}), file=sys.stderr, flush=True)
+    if not uploaded:
+        raise RuntimeError("render produced no images")
+    return uploaded
+
+
+async def publish(title: str, body: str, images, confirm: bool = False, dry_run: bool = False):
     pw, browser = await connect_browser()
 
     try:
@@ -86,9 +150,7 @@ async def publish(title: str, body: str, images: list[str], confirm: bool = Fals
         await page.wait_for_timeout(1500)
 
         # 3. Upload images
-        file_input = page.locator('input[type="file"]').first
-        abs_images = [str(Path(p).resolve()) for p in images]
-        await file_input.set_input_files(abs_images)
+        images_count = await upload_images(page, images)
         # Wait for upload processing
         await page.wait_for_timeout(3000)
 
@@ -153,7 +215,7 @@ async def publish(title: str, body: str, images: list[str], confirm: bool = Fals
                 "status": "preview_ready",
                 "title": actual_title.strip(),
                 "body_length": actual_body_len,
-                "images_count": len(images),
+                "images_count": images_count,
                 "message": "Content filled. Pass --confirm to publish.",
             }
             print(json.dumps(result, ensure_ascii=False))
@@ -177,7 +239,7 @@ async def publish(title: str, body: str, images: list[str], confirm: bool = Fals
                 "status": "published",
                 "title": actual_title.strip(),
                 "body_length": actual_body_len,
-                "images_count": len(images),
+                "images_count": images_count,
             }
         except Exception:
             # Check for error messages
@@ -196,6 +258,44 @@ async def publish(title: str, body: str, images: list[str], confirm: bool = Fals
         await pw.stop()
 
 
+async def publish_markdown(md_file: str, output_dir: str, style: str, title: str, body: str,
+                           confirm: bool = False, dry_run: bool = False):
+    """md → publish: start rendering first, then open the publish page while cards render."""
+    images, render_task = start_render_stream(md_file, output_dir, style)
+    try:
+        await publish(title, body, images, confirm=confirm, dry_run=dry_run)
+    finally:
+        if not render_task.done():
+            render_task.cancel()
+
+
+def normalize_tags(value) -> list[str]:
+    """front matter 的 tags：字符串按逗号/顿号/空白拆分，列表只取其中的字符串项；去掉开头的 #"""
+    if isinstance(value, str):
+        items = re.split(r"[,，、\s]+", value)
+    elif isinstance(value, list):
+        items = [item for item in value if isinstance(item, str)]
+    else:
+        return []
+    tags = [item.strip().lstrip("#").strip() for item in items]
+    return [tag for tag in tags if tag]
+
+
+def markdown_post_fields(md_file: str, title: str = None, body: str = None,
+                         tags: list[str] = None) -> tuple[str | None, str | None, list[str]]:
+    """
+    --from-md 的标题/正文/话题：命令行传入的优先，其次 front matter
+    （正文取 desc，没有则 subtitle），话题最后取正文末尾的 #标签
+    """
+    import render_xhs_v2 as renderer
+    note = renderer.parse_markdown_file(md_file)
+    meta = note["metadata"]
+    title = title or meta.get("title")
+    body = body or meta.get("desc") or meta.get("subtitle")
+    tags = tags or normalize_tags(meta.get("tags")) or renderer.extract_trailing_tags(note["body"])[1]
+    return title, body, tags
+
+
 def main():
     parser = argparse.ArgumentParser(description="小红书图文发布")
     parser.add_argument("--title", type=str, help="笔记标题 (≤20字)")
@@ -203,6 +303,9 @@ def main():
     parser.add_argument("--images", nargs="+", help="图片路径列表")
     parser.add_argument("--tags", nargs="*", default=[], help="话题标签（自动追加到正文末尾）")
     parser.add_argument("--from-json", type=str, help="从 JSON 文件读取 title/body/images/tags")
+    parser.add_argument("--from-md", type=str, help="从 Markdown 笔记渲染卡片并发布（边渲染边上传）")
+    parser.add_argument("--style", type=str, default="purple", help="--from-md 的卡片样式（默认: purple）")
+    parser.add_argument("--output-dir", type=str, help="--from-md 的卡片输出目录（默认: 临时目录，发布后删除）")
     parser.add_argument("--confirm", action="store_true", help="确认发布（不传则只填写不发布）")
     parser.add_argument("--dry-run", action="store_true", help="填写内容后等待 10 秒供截图验证，然后退出")
     args = parser.parse_args()
@@ -215,13 +318,23 @@ def main():
         body = data.get("body", args.body)
         images = data.get("images", args.images or [])
         tags = data.get("tags", args.tags or [])
+    elif args.from_md:
+        import render_xhs_v2 as renderer
+        if not os.path.exists(args.from_md):
+            print(json.dumps({"ok": False, "error": f"File not found: {args.from_md}"}))
+            sys.exit(1)
+        if args.style not in renderer.STYLES:
+            print(json.dumps({"ok": False, "error": f"Unknown style: {args.style}"}))
+            sys.exit(1)
+        title, body, tags = markdown_post_fields(args.from_md, args.title, args.body, args.tags)
+        images = None
     else:
         title = args.title
         body = args.body
         images = args.images or []
         tags = args.tags or []
 
-    if not title or not body or not images:
+    if not title or not body or (images is not None and not images):
         print(json.dumps({"ok": False, "error": "Missing required: --title, --body, --images"}))
         sys.exit(1)
 
@@ -230,7 +343,17 @@ def main():
         tag_line = " ".join(f"#{t}" for t in tags)
         body = body.rstrip() + "\n\n" + tag_line
 
-    asyncio.run(publish(title, body, images, confirm=args.confirm, dry_run=args.dry_run))
+    if images is None:
+        output_dir = args.output_dir or tempfile.mkdtemp(prefix="xhs_publish_")
+        try:
+            asyncio.run(publish_markdown(args.from_md, output_dir, args.style, title, body,
+                                         confirm=args.confirm, dry_run=args.dry_run))
+        finally:
+            # Rendered cards only live in our temp dir; a given --output-dir is kept
+            if not args.output_dir:
+                shutil.rmtree(output_dir, ignore_errors=True)
+    else:
+        asyncio.run(publish(title, body, images, confirm=args.confirm, dry_run=args.dry_run))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 脚本不是包，测试直接从 scripts/ 导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
@@ -0,0 +1,126 @@
+"""cmd_auto_reply 的并发生成与失败标记（假页面 + 假模型，不连浏览器）"""
+
+import asyncio
+
+import pytest
+
+import xhs_comment
+
+
+class FakePage:
+    """只实现 cmd_auto_reply 用到的方法；评论列表由测试给出"""
+
+    def __init__(self, comments):
+        self.comments = comments
+
+    async def goto(self, *args, **kwargs):
+        pass
+
+    async def wait_for_timeout(self, ms):
+        pass
+
+    async def evaluate(self, js, arg=None):
+        if js is xhs_comment.EXTRACT_MY_NICKNAME_JS:
+            return "me"
+        if js is xhs_comment.EXTRACT_NOTE_INFO_JS:
+            return {"title": "标题", "desc": "正文", "author": "me"}
+        if js is xhs_comment.EXTRACT_COMMENTS_JS:
+            return self.comments
+        return None
+
+
+def make_comments(*contents):
+    return [{"type": "structured", "user": f"user{i}", "content": content,
+             "is_my_comment": False, "has_my_reply": False}
+            for i, content in enumerate(contents, 1)]
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    """假的 generate_reply_with_ai：记录同时进行的调用数；内容以 "boom" 开头的评论抛错"""
+    state = {"active": 0, "peak": 0, "calls": []}
+
+    async def fake_generate(comment_user, comment_content, **kwargs):
+        state["calls"].append(comment_content)
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        try:
+            await asyncio.sleep(0.01)
+            if comment_content.startswith("boom"):
+                raise RuntimeError("model down")
+            return f"回复{comment_content}"
+        finally:
+            state["active"] -= 1
+
+    monkeypatch.setattr(xhs_comment, "generate_reply_with_ai", fake_generate)
+    monkeypatch.setattr(xhs_comment, "log_event", lambda msg: None)
+    return state
+
+
+def preview(comments, **options):
+    options = {"reply_cache": False, "cluster": False, **options}
+    return asyncio.run(xhs_comment.cmd_auto_reply(
+        FakePage(comments), "note", confirm=False, persona_path="", max_replies=20, delay_seconds=0, **options))
+
+
+def test_generation_is_bounded_by_concurrency(generator):
+    result = preview(make_comments(*(f"第{i}条评论内容" for i in range(6))), concurrency=2)
+
+    assert generator["peak"] == 2
+    assert len(generator["calls"]) == 6
+    # 计划保持评论顺序
+    assert [item["generated_reply"] for item in result["plan"]] == [f"回复第{i}条评论内容" for i in range(6)]
+
+
+def test_failed_generation_marks_only_that_comment(generator):
+    result = preview(make_comments("第一条评论", "boom 第二条", "第三条评论"), concurrency=3)
+
+    statuses = [item["status"] for item in result["plan"]]
+    assert statuses == ["pending", "failed", "pending"]
+    failed = result["plan"][1]
+    assert failed["generated_reply"] is None
+    assert "model down" in failed["error"]
+    assert result["plan"][2]["generated_reply"] == "回复第三条评论"
+
+
+def test_variant_exhaustion_falls_back_to_fresh_generation(generator):
+    # 全部归一化成 "哈"，同一组；组长的回复（原文 + 变体）不够分
+    limit = len(xhs_comment.VARIANT_PREFIXES) * len(xhs_comment.VARIANT_SUFFIXES)
+    distinct = len({xhs_comment.vary_reply("回复哈哈", n) for n in range(limit + 1)})
+    contents = ["哈" * (i + 2) for i in range(distinct + 2)]
+    result = preview(make_comments(*contents), cluster=True)
+
+    replies = [item["generated_reply"] for item in result["plan"]]
+    assert all(item["status"] == "pending" for item in result["plan"])
+    assert len(set(replies)) == len(replies)
+    # 组长一次 + 变体用完的两条各重新生成一次
+    assert generator["calls"] == ["哈哈", *contents[distinct:]]
+    assert [item["generation"] for item in result["plan"][distinct:]] == ["single", "single"]
+
+
+def test_cache_uses_recorded_only_after_successful_post(generator, monkeypatch, tmp_path):
+    class TmpReplyCache(xhs_comment.ReplyCache):
+        def __init__(self):
+            super().__init__(tmp_path / "reply_cache.json")
+
+    async def fake_reply(page, comment_text, body):
+        return {"ok": False, "error": "blocked"} if comment_text.endswith("！") else {"ok": True}
+
+    monkeypatch.setattr(xhs_comment, "ReplyCache", TmpReplyCache)
+    monkeypatch.setattr(xhs_comment, "_reply_cache", None)
+    monkeypatch.setattr(xhs_comment, "REPLY_LOG_DIR", tmp_path / "logs")
+    monkeypatch.setattr(xhs_comment, "_do_reply_on_page", fake_reply)
+    comments = make_comments("谢谢分享", "谢谢分享！")  # 同一个缓存键
+
+    preview(comments, reply_cache=True, cluster=True)
+    [entry] = TmpReplyCache().entries.values()
+    assert entry["uses"] == 0
+
+    result = asyncio.run(xhs_comment.cmd_auto_reply(
+        FakePage(comments), "note", confirm=True, persona_path="", max_replies=20, delay_seconds=0))
+
+    assert [item["status"] for item in result["results"]] == ["sent", "failed"]
+    # 只有发出去的第一条（原文）算用掉；发送失败的变体不计
+    [entry] = TmpReplyCache().entries.values()
+    assert entry["uses"] == 1
+    assert len(generator["calls"]) == 1
@@ -0,0 +1,26 @@
+"""批量渲染：worker 初始化失败（如浏览器启动不了）时仍写出汇总并把笔记记为失败"""
+
+import json
+
+import render_xhs_v2 as renderer
+
+
+def failing_worker_init(font_mode):
+    raise RuntimeError("Executable doesn't exist at /ms-playwright/chromium")
+
+
+def test_broken_pool_still_writes_summary(tmp_path, monkeypatch):
+    notes_dir = tmp_path / "notes"
+    notes_dir.mkdir()
+    for name in ("a", "b", "c"):
+        (notes_dir / f"{name}.md").write_text(f"# {name}\n\n正文", encoding="utf-8")
+    monkeypatch.setattr(renderer, "_batch_worker_init", failing_worker_init)
+
+    summary = renderer.render_batch(str(notes_dir), str(tmp_path / "out"), workers=2)
+
+    assert summary["ok"] is False
+    assert summary["failed"] == summary["total_notes"] == 3
+    assert [note["file"] for note in summary["notes"]] == [str(notes_dir / f"{n}.md") for n in "abc"]
+    assert all("BrokenProcessPool" in note["error"] for note in summary["notes"])
+    written = json.loads((tmp_path / "out" / "batch_summary.json").read_text(encoding="utf-8"))
+    assert written["failed"] == 3
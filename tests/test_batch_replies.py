@@ -0,0 +1,102 @@
+"""批量生成：_parse_batch_replies 的解析与容错，调用超时随批量大小放宽"""
+
+import asyncio
+
+import pytest
+
+import xhs_comment
+from xhs_comment import REPLY_MAX_CHARS, _parse_batch_replies
+
+
+def test_well_formed_array():
+    text = '[{"index": 1, "reply": "谢谢～"}, {"index": 2, "reply": "收到！"}]'
+
+    assert _parse_batch_replies(text, 2) == {1: "谢谢～", 2: "收到！"}
+
+
+def test_surrounding_text_and_code_fence():
+    text = '好的，回复如下：\n```json\n[{"index": 2, "reply": "b"}, {"index": 1, "reply": "a"}]\n```\n以上'
+
+    assert _parse_batch_replies(text, 2) == {1: "a", 2: "b"}
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "模型拒绝回答",
+    "[{\"index\": 1, \"reply\": \"没写完",
+    "] 反了 [",
+    '{"index": 1, "reply": "不是数组"}',
+    '[{"index": 1 "reply": "缺逗号"}]',
+])
+def test_malformed_output_yields_nothing(text):
+    assert _parse_batch_replies(text, 2) == {}
+
+
+def test_invalid_items_are_dropped():
+    text = ('[{"index": 0, "reply": "越界"}, {"index": 4, "reply": "越界"}, {"index": true, "reply": "布尔"},'
+            ' {"index": "2", "reply": " \\"带引号\\" "}, {"index": 3, "reply": ""},'
+            ' {"index": 1, "reply": 123}, {"reply": "没有编号"}, "多余的字符串"]')
+
+    assert _parse_batch_replies(text, 3) == {2: "带引号"}
+
+
+def test_first_valid_reply_wins_for_duplicate_index():
+    text = '[{"index": 1, "reply": "第一"}, {"index": 1, "reply": "第二"}]'
+
+    assert _parse_batch_replies(text, 1) == {1: "第一"}
+
+
+def test_overlong_reply_is_dropped():
+    text = f'[{{"index": 1, "reply": "{"长" * (REPLY_MAX_CHARS + 1)}"}}, {{"index": 2, "reply": "短"}}]'
+
+    assert _parse_batch_replies(text, 2) == {2: "短"}
+
+
+def test_plain_strings_map_by_position_only_when_count_matches():
+    assert _parse_batch_replies('["a", "b"]', 2) == {1: "a", 2: "b"}
+    assert _parse_batch_replies('["a"]', 2) == {}
+
+
+def test_call_timeout_scales_with_batch_output():
+    single = xhs_comment.call_timeout(30, 200)
+    batch = xhs_comment.call_timeout(30, 200 * 10 + 100)
+
+    assert single == 30
+    assert batch == pytest.approx(30 + 1900 * xhs_comment.CALL_SECONDS_PER_TOKEN)
+
+
+def test_claude_cli_provider_receives_max_tokens(monkeypatch):
+    seen = []
+
+    async def fake_cli(prompt, max_tokens=200):
+        seen.append(max_tokens)
+        return "ok"
+
+    monkeypatch.setattr(xhs_comment, "_try_claude_sonnet", fake_cli)
+    call, is_async, _ = xhs_comment.PROVIDERS["claude-cli"]
+
+    assert asyncio.run(call("prompt", 2100)) == "ok"
+    assert seen == [2100]
+
+
+def test_claude_cli_timeout_uses_max_tokens(monkeypatch):
+    timeouts = []
+
+    class FakeProc:
+        returncode = 0
+
+        async def communicate(self):
+            return "回复".encode("utf-8"), b""
+
+    async def fake_exec(*args, **kwargs):
+        return FakeProc()
+
+    async def fake_wait_for(awaitable, timeout):
+        timeouts.append(timeout)
+        return await awaitable
+
+    monkeypatch.setattr(xhs_comment.asyncio, "create_subprocess_exec", fake_exec)
+    monkeypatch.setattr(xhs_comment.asyncio, "wait_for", fake_wait_for)
+
+    assert asyncio.run(xhs_comment._try_claude_sonnet("prompt", 2100)) == "回复"
+    assert timeouts == [xhs_comment.call_timeout(30, 2100)]
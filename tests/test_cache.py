@@ -0,0 +1,42 @@
+"""缓存目录的 LRU 淘汰（渲染缓存与图片缓存共用 prune_cache_dir）"""
+
+import os
+
+import render_xhs_v2 as renderer
+
+
+def write_entry(cache_dir, name, size, mtime):
+    path = cache_dir / name[:2] / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_oldest_entries_are_removed_first(tmp_path):
+    old = write_entry(tmp_path, "aa_old.png", 100, 1_000)
+    middle = write_entry(tmp_path, "bb_middle.jpg", 100, 2_000)
+    new = write_entry(tmp_path, "cc_new.png", 100, 3_000)
+    other = write_entry(tmp_path, "dd_note.txt", 1_000, 0)
+
+    renderer.prune_cache_dir(tmp_path, 250, renderer.IMAGE_MIME_TYPES)
+
+    assert not old.exists()
+    assert middle.exists() and new.exists()
+    assert other.exists()  # 不属于缓存的文件不计入、不删除
+    assert not renderer.prune_due(tmp_path)
+
+
+def test_kept_entries_survive(tmp_path):
+    old = write_entry(tmp_path, "aa_old.png", 100, 1_000)
+    new = write_entry(tmp_path, "bb_new.png", 100, 2_000)
+
+    renderer.prune_cache_dir(tmp_path, 0, renderer.IMAGE_MIME_TYPES, keep=[old])
+
+    assert old.exists()
+    assert not new.exists()
+
+
+def test_prune_due_without_marker(tmp_path):
+    assert renderer.prune_due(tmp_path)
+    assert not renderer.prune_due(tmp_path / "missing")
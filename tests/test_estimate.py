@@ -0,0 +1,90 @@
+"""离线高度预估：折行（CJK / ASCII / emoji / 代码）、外边距折叠与校准数据叠加"""
+
+import json
+
+import pytest
+
+import render_xhs_v2 as renderer
+
+# 便于手算的字宽表：ASCII 0.5em、CJK 1em、emoji 2em；字号 10px、宽 100px → 每行 20 个 ASCII 或 10 个汉字
+GLYPHS = {"ascii": {ch: 0.5 for ch in "abcdefghijklmnopqrstuvwxyz "}, "cjk": 1.0, "emoji": 2.0,
+          "other": 0.5, "mono": 0.5}
+
+
+def lines(text, monospace=False):
+    return renderer.count_wrapped_lines(text, 10, 100, GLYPHS, monospace)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("中" * 10, 1),
+    ("中" * 11, 2),
+    ("a" * 20, 1),
+    ("😀" * 5, 1),
+    ("😀" * 6, 2),
+    ("❤️" * 5, 1),  # U+FE0F 变体选择符不占宽
+    ("中文mixed中文", 1),
+])
+def test_wrap_counts(text, expected):
+    assert lines(text) == expected
+
+
+def test_cjk_breaks_anywhere_but_latin_words_move_whole():
+    # 15 个 a + 空格 = 80px，第一行剩 20px；随后都是 30px + 8 个汉字（80px）
+    # 汉字逐字断开：第一行再放 2 个，第二行 1 + 8 = 90px
+    assert lines("a" * 15 + " " + "中" * 3 + "中" * 8) == 2
+    # 6 个字母的单词整体换行：第二行 30 + 80 = 110px，还要第三行
+    assert lines("a" * 15 + " " + "b" * 6 + "中" * 8) == 3
+
+
+def test_overlong_word_is_force_broken():
+    assert lines("a" * 50) == 3
+
+
+def test_monospace_breaks_every_character():
+    assert lines("x" * 45, monospace=True) == 3
+    assert lines("", monospace=True) == 1
+
+
+@pytest.fixture
+def default_metrics(tmp_path, monkeypatch):
+    """不读仓库里的校准文件，使用内置默认值"""
+    monkeypatch.setattr(renderer, "TEXT_METRICS_FILE", tmp_path / "text_metrics.json")
+    renderer.load_text_metrics.cache_clear()
+    yield tmp_path / "text_metrics.json"
+    renderer.load_text_metrics.cache_clear()
+
+
+def test_adjacent_margins_collapse(monkeypatch):
+    monkeypatch.setattr(renderer, "layout_blocks", lambda content, style_key="purple": [
+        (10, 100, 30), (20, 50, 5), (40, 10, 0),
+    ])
+
+    # 10 + 100 + max(30, 20) + 50 + max(5, 40) + 10 + 0
+    assert renderer.estimate_content_height("") == 240
+
+
+def test_paragraph_then_heading_uses_template_margins(default_metrics):
+    p, h2 = (renderer.DEFAULT_TEXT_METRICS["blocks"][name] for name in ("p", "h2"))
+    expected = p["line_height"] + max(p["margin_bottom"], h2["margin_top"]) + h2["line_height"] + h2["margin_bottom"]
+
+    assert renderer.estimate_content_height("一段话\n\n## 小标题") == round(expected)
+
+
+def test_list_items_collapse_with_list_margin(default_metrics):
+    li, lst = (renderer.DEFAULT_TEXT_METRICS["blocks"][name] for name in ("li", "list"))
+
+    [(top, height, bottom)] = renderer.layout_blocks("- 一\n- 二\n- 三")
+
+    assert top == lst["margin_top"]
+    assert height == pytest.approx(3 * li["line_height"] + 2 * li["margin_bottom"])
+    assert bottom == max(lst["margin_bottom"], li["margin_bottom"])
+
+
+def test_calibrated_values_override_defaults(default_metrics):
+    default = renderer.estimate_content_height("中" * 30)
+    default_metrics.write_text(json.dumps({"purple": {"glyphs": {"cjk": 0.5}}}), encoding="utf-8")
+    renderer.load_text_metrics.cache_clear()
+
+    # 30 个汉字：默认 42px 宽两行，校准为半宽后一行
+    assert renderer.estimate_content_height("中" * 30) < default
+    assert renderer.load_text_metrics("other")["glyphs"]["cjk"] == 1.0
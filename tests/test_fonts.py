@@ -0,0 +1,112 @@
+"""本地字体：页面载入等待 document.fonts.ready，字体路由只返回 assets/fonts 下的字体文件"""
+
+import asyncio
+import io
+
+import pytest
+
+import render_xhs_v2 as renderer
+
+
+class FakePage:
+    """记录 set_content / evaluate 的调用顺序"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def set_content(self, html, wait_until=None):
+        self.calls.append(("set_content", wait_until))
+
+    async def evaluate(self, script, arg=None):
+        self.calls.append(("evaluate", script))
+        return 100
+
+
+class FakeRoute:
+    def __init__(self, url):
+        self.request = type("Request", (), {"url": url})()
+        self.result = None
+
+    async def abort(self):
+        self.result = "abort"
+
+    async def fulfill(self, body, content_type, headers):
+        self.result = (body, content_type)
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    with renderer.progress_output(io.StringIO()):
+        yield
+
+
+def test_full_load_waits_for_fonts_ready():
+    page = FakePage()
+
+    assert asyncio.run(renderer.set_page_content(page, "<html><body>封面</body></html>")) is None
+    assert [name for name, _ in page.calls] == ["set_content", "evaluate"]
+    assert page.calls[0][1] == "load"
+    assert "document.fonts.ready" in page.calls[1][1]
+
+
+def test_shell_swap_waits_for_fonts_ready(monkeypatch):
+    monkeypatch.setattr(renderer, "REUSE_CARD_SHELL", True)
+    page = FakePage()
+
+    asyncio.run(renderer.set_page_content(page, renderer.generate_card_html("<p>一</p>", 1, 2)))
+    height = asyncio.run(renderer.set_page_content(page, renderer.generate_card_html("<p>二</p>", 2, 2)))
+
+    assert height == 100
+    name, script = page.calls[-1]
+    assert name == "evaluate" and script is renderer.SWAP_CARD_JS
+    assert "await document.fonts.ready" in script
+
+
+@pytest.fixture
+def fonts_dir(tmp_path, monkeypatch):
+    fonts = tmp_path / "fonts"
+    fonts.mkdir()
+    (fonts / "NotoSansSC-Regular.woff2").write_bytes(b"wOF2")
+    (fonts / "notes.txt").write_text("不是字体")
+    (tmp_path / "secret.ttf").write_bytes(b"secret")
+    monkeypatch.setattr(renderer, "FONTS_DIR", fonts)
+    monkeypatch.setattr(renderer, "_font_bytes", {})
+    return fonts
+
+
+def serve(name):
+    route = FakeRoute(renderer.LOCAL_FONT_URL + name)
+    asyncio.run(renderer._serve_local_font(route))
+    return route.result
+
+
+def test_serves_font_files(fonts_dir):
+    assert serve("NotoSansSC-Regular.woff2?v=1") == (b"wOF2", "font/woff2")
+
+
+@pytest.mark.parametrize("name", [
+    "../secret.ttf",
+    "..%2Fsecret.ttf",
+    "sub/../../secret.ttf",
+    "..",
+    "notes.txt",
+    "missing.woff2",
+    "",
+])
+def test_rejects_traversal_and_unknown_names(fonts_dir, name):
+    assert serve(name) == "abort"
+
+
+def test_auto_mode_warns_when_falling_back_to_google_fonts(tmp_path, monkeypatch):
+    monkeypatch.setattr(renderer, "FONTS_DIR", tmp_path / "missing")
+    monkeypatch.setattr(renderer, "FONT_MODE", "auto")
+    renderer.reload_assets()
+    output = io.StringIO()
+    try:
+        with renderer.progress_output(output):
+            assert renderer.font_face_css() == renderer.GOOGLE_FONTS_IMPORT
+            renderer.font_face_css()
+    finally:
+        renderer.reload_assets()
+
+    assert output.getvalue().count("fonts.googleapis.com") == 1
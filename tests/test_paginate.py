@@ -0,0 +1,35 @@
+"""paginate_optimal 的优化目标顺序：卡片数 → keep_with_next → 填充均匀"""
+
+import render_xhs_v2 as renderer
+
+
+def spans(heights):
+    """块高度直接相加（不考虑外边距）的 span 函数"""
+    return lambda i, j: sum(heights[i:j + 1])
+
+
+def test_fewest_cards_even_if_a_heading_is_split():
+    # 只有在标题处断开才能放进两张卡片；为了不拆标题就要多用一张
+    heights = [60, 40, 10, 90]
+    keep = [False, True, False, False]
+
+    assert renderer.paginate_optimal(len(heights), spans(heights), 100, keep) == [(0, 2), (2, 4)]
+
+
+def test_heading_kept_with_next_when_card_count_is_equal():
+    # 两种两张卡片的分法都可行，选不拆开标题的那种（即使填充不如另一种均匀）
+    heights = [50, 20, 30, 40]
+    keep = [False, True, False, False]
+
+    assert renderer.paginate_optimal(len(heights), spans(heights), 100, keep) == [(0, 1), (1, 4)]
+    assert renderer.paginate_optimal(len(heights), spans(heights), 100) == [(0, 2), (2, 4)]
+
+
+def test_oversized_block_gets_its_own_card():
+    heights = [30, 150, 30]
+
+    assert renderer.paginate_optimal(len(heights), spans(heights), 100) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_empty_input():
+    assert renderer.paginate_optimal(0, spans([]), 100) == []
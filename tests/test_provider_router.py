@@ -0,0 +1,105 @@
+"""ProviderRouter：路由排序、熔断试探名额与状态写盘节流（假的调用路径，不发请求）"""
+
+import asyncio
+import time
+
+import pytest
+
+import xhs_comment
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    """四条假路径 a/b/c/d（d 不可用）；replies[name] 为返回文本，None 表示失败"""
+    replies = {"a": "A", "b": "B", "c": "C", "d": "D"}
+
+    def provider(name):
+        async def call(prompt, max_tokens):
+            await asyncio.sleep(0)
+            return replies[name]
+        return call, True, lambda: name != "d"
+
+    monkeypatch.setattr(xhs_comment, "PROVIDERS", {name: provider(name) for name in replies})
+    monkeypatch.setattr(xhs_comment, "log_event", lambda msg: None)
+    return replies
+
+
+@pytest.fixture
+def router(tmp_path, providers):
+    return xhs_comment.ProviderRouter(tmp_path / "provider_state.json")
+
+
+def set_stats(router, name, **values):
+    router.stats(name).update(values)
+
+
+def test_untried_first_then_by_weighted_latency(router):
+    set_stats(router, "a", latency_ms=300.0, error_rate=0.0)
+    set_stats(router, "b", latency_ms=200.0, error_rate=1.0)  # 200 × 2 = 400，排在 a 后面
+
+    assert router.ranked() == ["c", "a", "b"]
+
+
+def test_open_circuit_skipped_until_cooldown(router):
+    set_stats(router, "a", opened_at=time.time())
+    assert router.ranked() == ["b", "c"]
+
+    set_stats(router, "a", opened_at=time.time() - xhs_comment.CIRCUIT_COOLDOWN)
+    assert router.ranked() == ["a", "b", "c"]
+
+
+def test_all_open_probes_only_the_earliest(router):
+    now = time.time()
+    for offset, name in enumerate("abc"):
+        set_stats(router, name, opened_at=now - offset)
+
+    assert router.ranked() == ["c"]
+
+
+def test_probe_slot_is_claimed_synchronously(router):
+    set_stats(router, "a", opened_at=time.time() - xhs_comment.CIRCUIT_COOLDOWN)
+
+    assert router.ranked(claim=True) == ["a", "b", "c"]
+    # 试探还没开始，第二个并发调用已经看不到 a
+    assert router.ranked(claim=True) == ["b", "c"]
+    # 不占用名额的查看（providers 命令）不受影响
+    assert router.ranked() == ["b", "c"]
+
+
+def test_complete_releases_unused_probe_slot(router, providers):
+    cooled = time.time() - xhs_comment.CIRCUIT_COOLDOWN
+    set_stats(router, "b", latency_ms=10.0)
+    set_stats(router, "c", opened_at=cooled, latency_ms=20.0)
+
+    assert asyncio.run(router.complete("prompt")) == "A"  # a 没有数据先试，c 没轮到
+    assert router.probing == set()
+    assert router.stats("c")["opened_at"] == cooled
+
+
+def test_successful_probe_closes_circuit(router):
+    set_stats(router, "a", opened_at=time.time() - xhs_comment.CIRCUIT_COOLDOWN, consecutive_failures=3)
+
+    assert asyncio.run(router.complete("prompt")) == "A"
+    assert router.stats("a")["opened_at"] is None
+    assert router.probing == set()
+
+
+def test_state_writes_are_debounced(router, monkeypatch):
+    saves = []
+    save = router.save
+    monkeypatch.setattr(router, "save", lambda: (saves.append(1), save()))
+
+    for _ in range(5):
+        router.record("a", True, 100.0)
+    assert len(saves) == 1 and router.dirty
+
+    # 熔断打开立即写盘
+    for _ in range(xhs_comment.CIRCUIT_FAILURES):
+        router.record("b", False, 100.0)
+    assert len(saves) == 2 and not router.dirty
+    assert router.state_file.exists()
+
+    router.record("c", True, 100.0)
+    router.flush()
+    router.flush()
+    assert len(saves) == 3
@@ -0,0 +1,54 @@
+"""xhs_publish --from-md：从笔记取标题/正文/话题（不连浏览器）"""
+
+import pytest
+
+from xhs_publish import markdown_post_fields, normalize_tags
+
+
+def write_note(tmp_path, front_matter: str, body: str = "正文第一段"):
+    path = tmp_path / "note.md"
+    path.write_text(f"---\n{front_matter}\n---\n{body}\n", encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("效率, 工具", ["效率", "工具"]),
+    ("效率，工具、 AI", ["效率", "工具", "AI"]),
+    ("#效率 #工具", ["效率", "工具"]),
+    (["效率", " #工具 ", 2024, None, ""], ["效率", "工具"]),
+    ({"a": 1}, []),
+    (None, []),
+    ("", []),
+])
+def test_normalize_tags(value, expected):
+    assert normalize_tags(value) == expected
+
+
+def test_front_matter_fields(tmp_path):
+    md_file = write_note(tmp_path, "title: 标题\ndesc: 描述\nsubtitle: 副标题\ntags: 效率, 工具")
+
+    assert markdown_post_fields(md_file) == ("标题", "描述", ["效率", "工具"])
+
+
+def test_subtitle_used_when_desc_missing(tmp_path):
+    md_file = write_note(tmp_path, "title: 标题\nsubtitle: 副标题")
+
+    assert markdown_post_fields(md_file)[1] == "副标题"
+
+
+def test_command_line_overrides_front_matter(tmp_path):
+    md_file = write_note(tmp_path, "title: 标题\ndesc: 描述\ntags: [效率]")
+
+    assert markdown_post_fields(md_file, "新标题", "新正文", ["命令行"]) == ("新标题", "新正文", ["命令行"])
+
+
+def test_trailing_hashtags_when_front_matter_has_none(tmp_path):
+    md_file = write_note(tmp_path, "title: 标题", body="正文第一段\n\n#效率 #工具")
+
+    assert markdown_post_fields(md_file) == ("标题", None, ["效率", "工具"])
+
+
+def test_front_matter_tags_win_over_trailing_hashtags(tmp_path):
+    md_file = write_note(tmp_path, "title: 标题\ntags:\n  - 清单", body="正文\n\n#效率")
+
+    assert markdown_post_fields(md_file)[2] == ["清单"]
@@ -0,0 +1,62 @@
+"""叠排（stacked）与逐张（pages）截图的输出逐像素一致（需要 Playwright 的 Chromium 与 Pillow）"""
+
+import asyncio
+import io
+from pathlib import Path
+
+import pytest
+
+import bench_render
+import render_xhs_v2 as renderer
+
+Image = pytest.importorskip("PIL.Image")
+ImageChops = pytest.importorskip("PIL.ImageChops")
+
+# 两种模式都必须走浏览器：auto 后端会把纯文字卡片交给 Pillow，比对就失去意义
+OPTIONS = {"paginate_mode": "dom", "backend": "playwright"}
+
+
+async def render_corpus(corpus: dict, output_root: Path):
+    """每篇笔记分别用两种模式渲染到 output_root/<模式>/<笔记>/；Chromium 启动失败时返回错误信息"""
+    async with renderer.async_playwright() as p:
+        try:
+            browser = await p.chromium.launch()
+        except Exception as e:
+            return str(e)
+        try:
+            for name, md_file in corpus.items():
+                for mode in renderer.RENDER_MODES:
+                    with renderer.progress_output(io.StringIO()):
+                        await renderer.render_markdown_to_cards(md_file, str(output_root / mode / name),
+                                                                "purple", browser, render_mode=mode, **OPTIONS)
+        finally:
+            await browser.close()
+    return None
+
+
+@pytest.fixture(scope="module")
+def rendered(tmp_path_factory):
+    root = tmp_path_factory.mktemp("render_modes")
+    corpus = bench_render.write_corpus(root)
+    error = asyncio.run(render_corpus(corpus, root / "output"))
+    if error is not None:
+        pytest.skip(f"Chromium 不可用: {error.splitlines()[0]}")
+    return root / "output"
+
+
+def images_identical(path_a: Path, path_b: Path) -> bool:
+    with Image.open(path_a) as a, Image.open(path_b) as b:
+        if a.size != b.size:
+            return False
+        return ImageChops.difference(a.convert('RGBA'), b.convert('RGBA')).getbbox() is None
+
+
+@pytest.mark.parametrize("note", ["example", *bench_render.FIXTURES])
+def test_stacked_matches_pages(rendered, note):
+    pages = sorted(path.name for path in (rendered / "pages" / note).glob('*.png'))
+    stacked = sorted(path.name for path in (rendered / "stacked" / note).glob('*.png'))
+
+    assert pages and stacked == pages
+    mismatched = [name for name in pages
+                  if not images_identical(rendered / "pages" / note / name, rendered / "stacked" / note / name)]
+    assert mismatched == []
@@ -0,0 +1,114 @@
+"""近似重复评论的归一化、MinHash 分组、本地变体回复与回复缓存的并发写盘"""
+
+import pytest
+
+import xhs_comment
+from xhs_comment import (
+    MINHASH_PERMUTATIONS, VARIANT_PREFIXES, VARIANT_SUFFIXES, ReplyCache,
+    cluster_comments, minhash_signature, normalize_comment, vary_reply,
+)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("哈哈哈哈哈", "哈哈"),
+    ("求链接！！", "求 链接～"),
+    ("ＯＫ", "ok"),
+    ("😂😂👍", "👍😂"),
+])
+def test_normalize_treats_variants_as_equal(a, b):
+    assert normalize_comment(a) == normalize_comment(b)
+
+
+def test_normalize_results():
+    assert normalize_comment("哈哈哈哈！") == "哈"
+    assert normalize_comment("  ") == ""
+    assert normalize_comment(None) == ""
+    assert normalize_comment("好看好看") == "好看好看"  # 只合并相邻的重复字
+
+
+def test_minhash_signature_is_deterministic():
+    signature = minhash_signature("求链接")
+
+    assert len(signature) == MINHASH_PERMUTATIONS
+    assert signature == minhash_signature("求链接")
+    assert signature != minhash_signature("多少钱")
+    assert len(minhash_signature("哈")) == MINHASH_PERMUTATIONS
+
+
+def test_cluster_groups_duplicates_under_first_occurrence():
+    long_text = "这个教程第三步我一直报错怎么办"
+    normalized = ["求链接", "多少钱", "求链接", "", "", long_text, long_text]
+
+    assert cluster_comments(normalized) == [0, 1, 0, 3, 4, 5, 6]
+
+
+def test_cluster_merges_near_duplicates():
+    # 2-gram 完全相同、只是顺序不同 → MinHash 签名相同
+    assert cluster_comments(["好看好看", "看好看好看"]) == [0, 0]
+
+
+def test_vary_reply_first_variant_is_original():
+    assert vary_reply("谢谢～", 0) == "谢谢～"
+
+
+def test_vary_reply_variants_are_distinct_then_cycle():
+    reply = "谢谢支持～"
+    limit = len(VARIANT_PREFIXES) * len(VARIANT_SUFFIXES)
+    variants = [vary_reply(reply, n) for n in range(1, limit)]
+
+    # 与原文相同的变体被去掉，其余各不相同
+    assert len(set(variants)) == len(variants) == limit - 1
+    assert reply not in variants
+    assert vary_reply(reply, limit) == variants[0]
+
+
+def test_vary_reply_does_not_repeat_prefix():
+    assert not any(vary_reply("哈哈 好的", n).startswith("哈哈 哈哈") for n in range(1, 20))
+
+
+def make_cache(tmp_path):
+    return ReplyCache(tmp_path / "reply_cache.json")
+
+
+def test_concurrent_caches_keep_each_others_entries(tmp_path):
+    first, second = make_cache(tmp_path), make_cache(tmp_path)
+    first.put("a", "回复甲")
+    second.put("b", "回复乙")
+
+    first.save()
+    second.save()
+
+    assert set(make_cache(tmp_path).entries) == {"a", "b"}
+    assert set(second.entries) == {"a", "b"}
+
+
+def test_merge_keeps_highest_uses(tmp_path):
+    seed = make_cache(tmp_path)
+    seed.put("a", "回复")
+    seed.save()
+    first, second = make_cache(tmp_path), make_cache(tmp_path)
+    first.put("a", "回复", 3)
+    second.put("a", "回复", 1)
+
+    first.save()
+    second.save()
+
+    assert make_cache(tmp_path).entries["a"]["uses"] == 3
+
+
+def test_merge_prefers_newer_reply(tmp_path):
+    first, second = make_cache(tmp_path), make_cache(tmp_path)
+    first.put("a", "旧回复")
+    second.put("a", "新回复")
+    second.entries["a"]["created_at"] += 1
+
+    second.save()
+    first.save()
+
+    assert make_cache(tmp_path).entries["a"]["reply"] == "新回复"
+
+
+def test_reply_cache_is_shared_in_process(monkeypatch):
+    monkeypatch.setattr(xhs_comment, "_reply_cache", None)
+
+    assert xhs_comment.get_reply_cache() is xhs_comment.get_reply_cache()
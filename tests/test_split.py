@@ -0,0 +1,73 @@
+"""split_overflow_bisect 与 split_overflow_linear 的卡片边界对比（用假的测量函数，不启动浏览器）"""
+
+import asyncio
+import random
+
+import pytest
+
+import render_xhs_v2 as renderer
+
+UNIT = renderer.MAX_INNER_HEIGHT // 3
+
+
+def install_fake_measure(monkeypatch, height_of):
+    """generate_card_html 原样返回内容，measure_content_height 按 height_of(行列表) 计算高度"""
+    calls = []
+
+    async def fake_measure(page, html):
+        lines = html.split('\n')
+        calls.append(len(lines))
+        return height_of(lines)
+
+    monkeypatch.setattr(renderer, "generate_card_html", lambda content, *args, **kwargs: content)
+    monkeypatch.setattr(renderer, "measure_content_height", fake_measure)
+    return calls
+
+
+def split_both(lines):
+    linear = asyncio.run(renderer.split_overflow_linear(None, lines, "purple"))
+    bisect = asyncio.run(renderer.split_overflow_bisect(None, lines, "purple"))
+    return linear, bisect
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_same_boundaries_when_height_is_monotone(monkeypatch, seed):
+    rng = random.Random(seed)
+    # 每行高度随机，偶尔有单行就超出一张卡片的
+    heights = {f"line{i}": rng.choice([40, 80, 120, 300, UNIT, renderer.MAX_INNER_HEIGHT + 1])
+               for i in range(rng.randint(1, 40))}
+    install_fake_measure(monkeypatch, lambda lines: sum(heights[line] for line in lines))
+
+    linear, bisect = split_both(list(heights))
+
+    assert bisect == linear
+    assert '\n'.join(bisect) == '\n'.join(heights)
+
+
+def test_bisect_needs_fewer_measurements(monkeypatch):
+    lines = [f"line{i}" for i in range(60)]
+    calls = install_fake_measure(monkeypatch, lambda lines: 100 * len(lines))
+
+    asyncio.run(renderer.split_overflow_linear(None, lines, "purple"))
+    linear_calls = len(calls)
+    calls.clear()
+    asyncio.run(renderer.split_overflow_bisect(None, lines, "purple"))
+
+    assert len(calls) < linear_calls
+
+
+def test_boundaries_differ_when_height_is_not_monotone(monkeypatch):
+    """
+    高度不单调时两者不保证一致：以 "h" 结尾的内容额外高出 2 个单位（如标题在卡片末尾时的下边距），
+    追加一行反而变矮。逐行模式在第一个超出的前缀处就切分；二分模式只看区间中点，
+    可能越过这个局部超出的前缀，装进更多行
+    """
+    def height_of(lines):
+        return UNIT * len(lines) + (2 * UNIT if lines[-1] == "h" else 0)
+
+    install_fake_measure(monkeypatch, height_of)
+
+    linear, bisect = split_both(["x", "h", "x", "x", "x"])
+
+    assert linear == ["x", "h\nx\nx", "x"]
+    assert bisect == ["x\nh\nx", "x\nx"]
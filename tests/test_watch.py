@@ -0,0 +1,74 @@
+"""监听模式：笔记与所引用图片的快照、卡片指纹与多余卡片的清理（不连浏览器）"""
+
+import os
+
+import render_xhs_v2 as renderer
+
+
+def write_note(tmp_path, body: str):
+    path = tmp_path / "note.md"
+    path.write_text(f"---\ntitle: 标题\n---\n{body}\n", encoding="utf-8")
+    return str(path)
+
+
+def test_note_image_files_lists_local_images_only(tmp_path):
+    (tmp_path / "img").mkdir()
+    for name in ("a.png", "b.jpg", "fenced.png"):
+        (tmp_path / "img" / name).write_bytes(b"x")
+    md_file = write_note(tmp_path, "\n".join([
+        "![](img/b.jpg) ![](img/a.png)",
+        "![](img/a.png)",
+        "![](https://example.com/remote.png)",
+        "![](img/missing.png)",
+        "```",
+        "![](img/fenced.png)",
+        "```",
+    ]))
+
+    assert renderer.note_image_files(md_file) == [tmp_path / "img" / "a.png", tmp_path / "img" / "b.jpg"]
+
+
+def test_note_image_files_missing_note(tmp_path):
+    assert renderer.note_image_files(str(tmp_path / "missing.md")) == []
+
+
+def test_snapshot_changes_when_referenced_image_changes(tmp_path):
+    image = tmp_path / "a.png"
+    image.write_bytes(b"x")
+    md_file = write_note(tmp_path, "![](a.png)")
+    before = renderer.snapshot_files(md_file, *renderer.note_image_files(md_file))
+
+    image.write_bytes(b"xy")
+
+    after = renderer.snapshot_files(md_file, *renderer.note_image_files(md_file))
+    assert set(after) == {md_file, str(image)}
+    assert after[md_file] == before[md_file]
+    assert after[str(image)] != before[str(image)]
+
+
+def test_snapshot_recurses_directories_and_skips_missing(tmp_path):
+    (tmp_path / "fonts").mkdir()
+    (tmp_path / "fonts" / "a.woff2").write_bytes(b"x")
+
+    snapshot = renderer.snapshot_files(tmp_path, tmp_path / "missing")
+
+    assert list(snapshot) == [str(tmp_path / "fonts" / "a.woff2")]
+
+
+def test_job_fingerprint_follows_html_and_quality():
+    fingerprint = renderer.job_fingerprint("<p>一</p>", 90)
+
+    assert fingerprint == renderer.job_fingerprint("<p>一</p>", 90)
+    assert fingerprint != renderer.job_fingerprint("<p>二</p>", 90)
+    assert fingerprint != renderer.job_fingerprint("<p>一</p>", 80)
+
+
+def test_remove_stale_images_keeps_current_cards(tmp_path):
+    for name in ("cover.png", "card_1.png", "card_2.png", "card_3.png", "notes.txt", "card_x.png"):
+        (tmp_path / name).write_bytes(b"x")
+    keep = [str(tmp_path / name) for name in ("cover.png", "card_1.png", "card_2.png")]
+
+    removed = renderer.remove_stale_images(str(tmp_path), keep)
+
+    assert removed == [str(tmp_path / "card_3.png")]
+    assert sorted(os.listdir(tmp_path)) == ["card_1.png", "card_2.png", "card_x.png", "cover.png", "notes.txt"]